@@ -0,0 +1,202 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import List, Dict, Tuple, Optional, Deque, Callable, Awaitable, Any
+
+from chatters import ChatterStats
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+AGGREGATE_WINDOW_SECONDS = float(os.getenv("AGGREGATE_WINDOW_SECONDS", "60"))
+AGGREGATE_TICK_HZ = float(os.getenv("AGGREGATE_TICK_HZ", "4"))
+AGGREGATE_TOP_K = int(os.getenv("AGGREGATE_TOP_K", "10"))
+
+SENTIMENT_PERCENTILES = (10, 50, 90)
+
+class _Bucket:
+    """Counters for one second of chat."""
+    __slots__ = ('second', 'messages', 'analyzed', 'keywords', 'emotes', 'copypastas', 'sentiments',
+                 'sentiment_sum', 'sentiment_weight')
+
+    def __init__(self, second: int):
+        self.second = second
+        self.messages = 0
+        self.analyzed = 0
+        self.keywords: Counter = Counter() # Weighted by 1 / sample rate
+        self.emotes: Counter = Counter()
+        self.copypastas: Counter = Counter() # Messages per copypasta cluster id
+        self.sentiments: List[float] = []
+        self.sentiment_sum = 0.0 # Weighted
+        self.sentiment_weight = 0.0
+
+class ChannelAggregator:
+    """Sliding-window chat statistics for one channel.
+
+    Messages are counted into one-second buckets; window totals are kept up to
+    date incrementally (added on ingest, subtracted when a bucket expires), so a
+    snapshot only has to pick the top-k entries and sort the sentiment scores.
+
+    Message and emote counts are exact. When analysis is sampled under load, each
+    analyzed message's keywords and sentiment are weighted by 1 / sample rate, so
+    keyword counts and the sentiment mean estimate what every message would give.
+    Unique chatters are estimated by `chatters` over its own windows (see chatters.py).
+    """
+
+    def __init__(self, window_seconds: float = AGGREGATE_WINDOW_SECONDS, top_k: int = AGGREGATE_TOP_K,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = max(1, int(window_seconds))
+        self.top_k = top_k
+        self._clock = clock
+        self._buckets: Deque[_Bucket] = deque()
+        self._keyword_totals: Counter = Counter()
+        self._emote_totals: Counter = Counter()
+        self._emote_urls: Dict[str, str] = {}
+        self._copypasta_totals: Counter = Counter()
+        self._copypasta_labels: Dict[int, str] = {}
+        self._message_total = 0
+        self._analyzed_total = 0
+        self._sentiment_sum = 0.0
+        self._sentiment_weight = 0.0
+        self._sentiment_count = 0
+        self._started_at = clock()
+        self._dirty = True
+        self.chatters = ChatterStats(clock=clock)
+
+    def add_message(self, sentiment_score: Optional[float], keywords: List[str],
+                    detected_emotes: List[Dict[str, Any]], analyzed: bool = True, sample_rate: float = 1.0,
+                    copypasta: Optional[Tuple[int, str, int]] = None, author: Optional[str] = None):
+        """Counts one processed chat message into the current bucket. `analyzed` is
+        False for messages that skipped sentiment/keyword analysis under load, and
+        `sample_rate` the share of messages being analyzed at the time. `copypasta` is
+        (cluster id, label, messages to count) for messages of a copypasta wave.
+        `author` is counted into the unique-chatter estimates.
+        """
+        now = self._clock()
+        self._expire(now)
+        second = int(now)
+        if not self._buckets or self._buckets[-1].second != second:
+            self._buckets.append(_Bucket(second))
+        bucket = self._buckets[-1]
+
+        bucket.messages += 1
+        self._message_total += 1
+        weight = 1.0 / sample_rate if sample_rate > 0 else 1.0
+        if analyzed:
+            bucket.analyzed += 1
+            self._analyzed_total += 1
+        if keywords:
+            if weight == 1.0:
+                bucket.keywords.update(keywords)
+                self._keyword_totals.update(keywords)
+            else:
+                for keyword in keywords:
+                    bucket.keywords[keyword] += weight
+                    self._keyword_totals[keyword] += weight
+        for emote in detected_emotes:
+            name = emote['name']
+            bucket.emotes[name] += 1
+            self._emote_totals[name] += 1
+            self._emote_urls[name] = emote['url']
+        if copypasta is not None:
+            cluster_id, label, members = copypasta
+            bucket.copypastas[cluster_id] += members
+            self._copypasta_totals[cluster_id] += members
+            self._copypasta_labels[cluster_id] = label
+        if sentiment_score is not None:
+            bucket.sentiments.append(sentiment_score)
+            bucket.sentiment_sum += sentiment_score * weight
+            bucket.sentiment_weight += weight
+            self._sentiment_sum += sentiment_score * weight
+            self._sentiment_weight += weight
+            self._sentiment_count += 1
+        if author:
+            self.chatters.add(author)
+        self._dirty = True
+
+    def _expire(self, now: float):
+        cutoff = int(now) - self.window_seconds
+        while self._buckets and self._buckets[0].second <= cutoff:
+            bucket = self._buckets.popleft()
+            self._message_total -= bucket.messages
+            self._analyzed_total -= bucket.analyzed
+            self._keyword_totals.subtract(bucket.keywords)
+            for keyword in bucket.keywords:
+                if self._keyword_totals[keyword] <= 1e-9: # Weighted counts are floats
+                    del self._keyword_totals[keyword]
+            self._emote_totals.subtract(bucket.emotes)
+            for name in bucket.emotes:
+                if self._emote_totals[name] <= 0:
+                    del self._emote_totals[name]
+                    self._emote_urls.pop(name, None)
+            self._copypasta_totals.subtract(bucket.copypastas)
+            for cluster_id in bucket.copypastas:
+                if self._copypasta_totals[cluster_id] <= 0:
+                    del self._copypasta_totals[cluster_id]
+                    self._copypasta_labels.pop(cluster_id, None)
+            self._sentiment_sum -= bucket.sentiment_sum
+            self._sentiment_weight -= bucket.sentiment_weight
+            self._sentiment_count -= len(bucket.sentiments)
+            self._dirty = True
+        if self._sentiment_count == 0:
+            # Reset accumulated float error
+            self._sentiment_sum = 0.0
+            self._sentiment_weight = 0.0
+
+    @property
+    def dirty(self) -> bool:
+        """True if the window changed since the last snapshot."""
+        self._expire(self._clock())
+        return self._dirty
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the compact payload of an `aggregate` frame."""
+        now = self._clock()
+        self._expire(now)
+        self._dirty = False
+
+        span = min(float(self.window_seconds), max(now - self._started_at, 1.0))
+        sentiments = sorted(score for bucket in self._buckets for score in bucket.sentiments)
+        sentiment: Dict[str, Any] = {"count": len(sentiments), "mean": None}
+        if sentiments:
+            sentiment["mean"] = round(self._sentiment_sum / self._sentiment_weight, 3)
+            for p in SENTIMENT_PERCENTILES:
+                # Nearest-rank percentile
+                rank = max(0, math.ceil(p / 100.0 * len(sentiments)) - 1)
+                sentiment[f"p{p}"] = sentiments[rank]
+
+        top_keywords = heapq.nlargest(self.top_k, self._keyword_totals.items(), key=lambda item: item[1])
+        top_emotes = heapq.nlargest(self.top_k, self._emote_totals.items(), key=lambda item: item[1])
+        waves = heapq.nlargest(self.top_k, self._copypasta_totals.items(), key=lambda item: item[1])
+        return {
+            "window_seconds": self.window_seconds,
+            "message_count": self._message_total,
+            "message_rate": round(self._message_total / span, 2),
+            # Share of the window's messages that got sentiment/keyword analysis
+            "analyzed_ratio": round(self._analyzed_total / self._message_total, 3) if self._message_total else 1.0,
+            "sentiment": sentiment,
+            "top_keywords": [[keyword, round(count)] for keyword, count in top_keywords],
+            "top_emotes": [[name, count, self._emote_urls.get(name)] for name, count in top_emotes],
+            # Largest copypasta waves: [first message, messages in the window, cluster id]
+            "copypasta_waves": [[self._copypasta_labels.get(cluster_id), count, cluster_id] for cluster_id, count in waves],
+            # Estimated unique chatters and messages-per-chatter distributions for 1m, 5m and the session
+            "chatters": self.chatters.snapshot(),
+        }
+
+    async def run(self, publish: Callable[[Dict[str, Any]], Awaitable[None]],
+                  tick_hz: float = AGGREGATE_TICK_HZ):
+        """Publishes an `aggregate` frame every tick while the window is changing."""
+        interval = 1.0 / max(tick_hz, 0.01)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.dirty:
+                    await publish({"type": "aggregate", "payload": self.snapshot()})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error publishing aggregate frame: {e}", exc_info=True)
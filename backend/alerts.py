@@ -0,0 +1,439 @@
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Dict, List, Tuple, Optional, Deque, Callable, Awaitable, Any
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# JSON file the alert rules are loaded from on startup and saved to when they change
+# over HTTP. Unset: rules only live in memory. In multi-worker mode rule changes are
+# relayed to every worker through the broker (see cluster.py); only the worker that
+# served the request writes the file.
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE", "")
+ALERT_MAX_RULES = int(os.getenv("ALERT_MAX_RULES", "1000"))
+# Recent alerts kept per channel for GET /alerts/{streamer}
+ALERT_HISTORY_SIZE = int(os.getenv("ALERT_HISTORY_SIZE", "50"))
+# Quiet seconds (no messages) are fed to the detectors as zeros; after a longer gap only
+# this many are replayed
+ALERT_MAX_GAP_SECONDS = int(os.getenv("ALERT_MAX_GAP_SECONDS", "600"))
+
+# What a rule watches, as one value per second of chat:
+#   sentiment    - mean sentiment of the second's analyzed messages (seconds without any are skipped)
+#   message_rate - messages
+#   emote_rate   - emotes (distinct per message, as aggregates count them); only `term` if given
+#   keyword      - messages with the keyword `term` among their extracted keywords
+ALERT_METRICS = ("sentiment", "message_rate", "emote_rate", "keyword")
+ALERT_DETECTORS = ("ewma", "cusum")
+ALERT_DIRECTIONS = ("up", "down", "both")
+
+# Rule defaults. `threshold` is the z-score for "ewma" and the decision interval h
+# (in standard deviations) for "cusum"
+RULE_DEFAULTS: Dict[str, Any] = {
+    "detector": "ewma",
+    "direction": "both",
+    "span": 60, # Seconds of history the baseline (EWMA mean and variance) mostly reflects
+    "drift": 0.5, # CUSUM slack k, in standard deviations
+    "warmup": 30, # Seconds observed before the rule may fire
+    "cooldown": 60, # Seconds after firing during which the rule stays quiet
+}
+DEFAULT_THRESHOLDS = {"ewma": 4.0, "cusum": 5.0}
+# Floor for the baseline's standard deviation, so a flat baseline does not turn tiny
+# changes into huge scores: 0.05 sentiment, one message/emote/keyword per second
+DEFAULT_MIN_STD = {"sentiment": 0.05, "message_rate": 1.0, "emote_rate": 1.0, "keyword": 1.0}
+
+# --- Detectors ---
+# Both standardize each value against an EWMA of the mean and variance of the values
+# before it, and keep a few floats of state per rule and channel.
+
+class _Baseline:
+    __slots__ = ('alpha', 'min_std', 'warmup', 'mean', 'var', 'count')
+
+    def __init__(self, span: float, min_std: float, warmup: int):
+        self.alpha = 2.0 / (span + 1.0)
+        self.min_std = min_std
+        self.warmup = warmup
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def score(self, value: float) -> Optional[float]:
+        """The value's z-score against the baseline, None during warmup."""
+        if self.count < self.warmup:
+            return None
+        return (value - self.mean) / max(math.sqrt(self.var), self.min_std)
+
+    def learn(self, value: float):
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.var = (1.0 - self.alpha) * (self.var + diff * increment)
+        self.count += 1
+
+class EwmaDetector:
+    """Fires when a value is more than `threshold` standard deviations from the EWMA baseline."""
+    __slots__ = ('baseline', 'threshold', 'direction')
+
+    def __init__(self, baseline: _Baseline, threshold: float, direction: str):
+        self.baseline = baseline
+        self.threshold = threshold
+        self.direction = direction
+
+    def update(self, value: float) -> Optional[Tuple[str, float]]:
+        """Feeds one value. Returns (direction, z-score) if it fires."""
+        z = self.baseline.score(value)
+        self.baseline.learn(value)
+        if z is None:
+            return None
+        if z >= self.threshold and self.direction != "down":
+            return "up", z
+        if z <= -self.threshold and self.direction != "up":
+            return "down", z
+        return None
+
+class CusumDetector:
+    """Two-sided CUSUM over the values' z-scores: fires once the deviations beyond
+    `drift` add up to more than `threshold`, so it also catches shifts too small for
+    a single value to stand out. Sums restart after firing."""
+    __slots__ = ('baseline', 'threshold', 'direction', 'drift', 'high', 'low')
+
+    def __init__(self, baseline: _Baseline, threshold: float, direction: str, drift: float):
+        self.baseline = baseline
+        self.threshold = threshold
+        self.direction = direction
+        self.drift = drift
+        self.high = 0.0
+        self.low = 0.0
+
+    def update(self, value: float) -> Optional[Tuple[str, float]]:
+        z = self.baseline.score(value)
+        self.baseline.learn(value)
+        if z is None:
+            return None
+        self.high = max(0.0, self.high + z - self.drift)
+        self.low = max(0.0, self.low - z - self.drift)
+        if self.high > self.threshold and self.direction != "down":
+            score, self.high = self.high, 0.0
+            return "up", score
+        if self.low > self.threshold and self.direction != "up":
+            score, self.low = self.low, 0.0
+            return "down", -score
+        return None
+
+# --- Rules ---
+
+class AlertRule:
+    """One alert rule; replaced as a whole, never changed in place."""
+    __slots__ = ('id', 'name', 'channel', 'metric', 'term', 'detector', 'direction', 'threshold',
+                 'span', 'drift', 'warmup', 'cooldown', 'min_std')
+
+    def __init__(self, spec: Dict[str, Any]):
+        """Validates a rule spec (see RULE_DEFAULTS and the README); raises ValueError."""
+        if not isinstance(spec, dict):
+            raise ValueError("a rule must be a JSON object")
+        unknown = set(spec) - set(self.__slots__)
+        if unknown:
+            raise ValueError(f"unknown rule fields: {', '.join(sorted(unknown))}")
+        spec = {**RULE_DEFAULTS, **{key: value for key, value in spec.items() if value is not None}}
+        self.metric = spec.get("metric")
+        if self.metric not in ALERT_METRICS:
+            raise ValueError(f"metric must be one of {', '.join(ALERT_METRICS)}")
+        self.detector = spec["detector"]
+        if self.detector not in ALERT_DETECTORS:
+            raise ValueError(f"detector must be one of {', '.join(ALERT_DETECTORS)}")
+        self.direction = spec["direction"]
+        if self.direction not in ALERT_DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(ALERT_DIRECTIONS)}")
+        term = spec.get("term")
+        if self.metric == "keyword" and not term:
+            raise ValueError("keyword rules need a term")
+        if term is not None and self.metric not in ("keyword", "emote_rate"):
+            raise ValueError("only keyword and emote_rate rules take a term")
+        # Keywords are extracted lowercased; emote names are case-sensitive
+        self.term = str(term).lower() if self.metric == "keyword" else (str(term) if term else None)
+        self.channel = str(spec.get("channel") or "").lower().strip() or None # None: every channel
+        try:
+            self.threshold = float(spec.get("threshold", DEFAULT_THRESHOLDS[self.detector]))
+            self.span = float(spec["span"])
+            self.drift = float(spec["drift"])
+            self.warmup = int(spec["warmup"])
+            self.cooldown = float(spec["cooldown"])
+            self.min_std = float(spec.get("min_std", DEFAULT_MIN_STD[self.metric]))
+        except (TypeError, ValueError):
+            raise ValueError("threshold, span, drift, warmup, cooldown and min_std must be numbers") from None
+        if self.threshold <= 0 or self.span < 1 or self.drift < 0 or self.warmup < 1 or self.cooldown < 0 or self.min_std <= 0:
+            raise ValueError("threshold and min_std must be positive, span and warmup at least 1, drift and cooldown not negative")
+        self.id = str(spec.get("id") or "")
+        default_name = f"{self.metric} {self.term}" if self.term else self.metric
+        self.name = str(spec.get("name") or default_name)
+
+    def detector_for_channel(self):
+        baseline = _Baseline(self.span, self.min_std, self.warmup)
+        if self.detector == "cusum":
+            return CusumDetector(baseline, self.threshold, self.direction, self.drift)
+        return EwmaDetector(baseline, self.threshold, self.direction)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+class AlertRuleSet:
+    """The alert rules of all channels. Engines notice changes through `version`."""
+
+    def __init__(self, path: str = ALERT_RULES_FILE, max_rules: int = ALERT_MAX_RULES):
+        self.path = path
+        self.max_rules = max_rules
+        self.rules: Dict[str, AlertRule] = {}
+        self.version = 0
+        self._ids = itertools.count(1)
+        # Prefix of generated ids; workers set a distinct one so their ids never collide
+        self.id_prefix = ""
+        self._save_lock = threading.Lock() # Saves run in worker threads
+        self._saved_version = -1
+
+    def add(self, spec: Dict[str, Any]) -> AlertRule:
+        """Adds a rule, or replaces the one with the spec's `id`. Raises ValueError.
+        Re-adding an identical rule keeps the existing one (and its detectors' state)."""
+        rule = AlertRule(spec)
+        existing = self.rules.get(rule.id)
+        if existing is not None and existing.to_dict() == rule.to_dict():
+            return existing
+        if existing is None and len(self.rules) >= self.max_rules:
+            raise ValueError(f"at most {self.max_rules} rules (ALERT_MAX_RULES)")
+        if not rule.id:
+            rule.id = next(rule_id for rule_id in (f"{self.id_prefix}{n}" for n in self._ids) if rule_id not in self.rules)
+        self.rules[rule.id] = rule
+        self.version += 1
+        return rule
+
+    def remove(self, rule_id: str) -> bool:
+        if self.rules.pop(rule_id, None) is None:
+            return False
+        self.version += 1
+        return True
+
+    def for_channel(self, channel: str) -> List[AlertRule]:
+        return [rule for rule in self.rules.values() if rule.channel is None or rule.channel == channel]
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [rule.to_dict() for rule in self.rules.values()]
+
+    def load(self):
+        """Loads the rules file, if there is one. Invalid rules are logged and skipped."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                specs = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read alert rules from {self.path}: {e}")
+            return
+        for spec in specs if isinstance(specs, list) else []:
+            try:
+                self.add(spec)
+            except ValueError as e:
+                logger.error(f"Skipping invalid alert rule {spec!r} in {self.path}: {e}")
+        logger.info(f"Loaded {len(self.rules)} alert rules from {self.path}")
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """(version, rules) to hand to save(); taken on the event loop, which changes the rules."""
+        return self.version, self.to_list()
+
+    def save(self, snapshot: Tuple[int, List[Dict[str, Any]]]):
+        """Writes a snapshot() to the rules file (if configured) via a temporary file, so it
+        is never half-written. Runs in a worker thread; a snapshot older than the last one
+        written is skipped."""
+        version, rules = snapshot
+        if not self.path:
+            return
+        with self._save_lock:
+            if version <= self._saved_version:
+                return
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(rules, f, indent=2)
+            os.replace(temporary, self.path)
+            self._saved_version = version
+
+alert_rules = AlertRuleSet()
+alert_rules.load()
+
+# --- Per-Channel Engine ---
+
+class _RuleState:
+    __slots__ = ('rule', 'detector', 'fired_at')
+
+    def __init__(self, rule: AlertRule):
+        self.rule = rule
+        self.detector = rule.detector_for_channel()
+        self.fired_at = -math.inf
+
+class AlertEngine:
+    """Runs the alert rules of one channel.
+
+    Per message, add_message() only adds to the counters of the current second (and,
+    for the few keywords and emotes that rules watch, a dict lookup per keyword or
+    emote), whatever the number of rules. When a second is over, each rule's detector
+    is fed that second's value, so evaluating costs O(rules) once per second. Seconds
+    without messages are closed by tick(), which run() calls every second.
+    """
+
+    def __init__(self, channel: str, rules: AlertRuleSet = alert_rules,
+                 clock: Callable[[], float] = time.time, history_size: int = ALERT_HISTORY_SIZE,
+                 on_alert: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.channel = channel.lower()
+        self.rules = rules
+        self._clock = clock
+        self.on_alert = on_alert # Called for every alert, e.g. to count it
+        self._states: Dict[str, _RuleState] = {}
+        self._rules_version = -1
+        self._watched_keywords: Dict[str, float] = {}
+        self._watched_emotes: Dict[str, float] = {}
+        self._second = int(clock())
+        self._reset_counters()
+        self._sync_rules()
+        self.pending: List[Dict[str, Any]] = [] # Fired, not yet published
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self.alerts_fired = 0
+
+    def _reset_counters(self):
+        self._messages = 0
+        self._emotes = 0
+        self._sentiment_sum = 0.0
+        self._sentiment_weight = 0.0
+        for term in self._watched_keywords:
+            self._watched_keywords[term] = 0.0
+        for term in self._watched_emotes:
+            self._watched_emotes[term] = 0.0
+
+    def _sync_rules(self):
+        """Picks up added and removed rules; unchanged rules keep their detector state."""
+        rules = self.rules.for_channel(self.channel)
+        states: Dict[str, _RuleState] = {}
+        for rule in rules:
+            state = self._states.get(rule.id)
+            states[rule.id] = state if state is not None and state.rule is rule else _RuleState(rule)
+        self._states = states
+        self._watched_keywords = {rule.term: 0.0 for rule in rules if rule.metric == "keyword"}
+        self._watched_emotes = {rule.term: 0.0 for rule in rules if rule.metric == "emote_rate" and rule.term}
+        self._rules_version = self.rules.version
+
+    @property
+    def rule_count(self) -> int:
+        return len(self._states)
+
+    def add_message(self, sentiment_score: Optional[float], keywords: List[str], emote_names: List[str],
+                    sample_rate: float = 1.0):
+        """Counts one processed message. Keywords and sentiment are weighted by
+        1 / `sample_rate`, as in the aggregates."""
+        second = int(self._clock())
+        if second != self._second:
+            self._advance(second)
+        self._messages += 1
+        self._emotes += len(emote_names)
+        weight = 1.0 / sample_rate if sample_rate > 0 else 1.0
+        if sentiment_score is not None:
+            self._sentiment_sum += sentiment_score * weight
+            self._sentiment_weight += weight
+        watched = self._watched_keywords
+        if watched and keywords:
+            for keyword in keywords:
+                if keyword in watched:
+                    watched[keyword] += weight
+        watched = self._watched_emotes
+        if watched:
+            for name in emote_names:
+                if name in watched:
+                    watched[name] += 1
+
+    def tick(self):
+        """Closes the seconds that are over, even if no message arrived since."""
+        second = int(self._clock())
+        if second != self._second:
+            self._advance(second)
+
+    def _advance(self, second: int):
+        """Feeds the current second, and the empty seconds up to `second`, to the rules."""
+        if second < self._second:
+            return # Clock went backwards; keep counting into the current second
+        self._evaluate(self._second)
+        empty_seconds = second - self._second - 1
+        if empty_seconds > 0 and self._states:
+            self._reset_counters()
+            for empty_second in range(max(self._second + 1, second - ALERT_MAX_GAP_SECONDS), second):
+                self._evaluate(empty_second)
+        if self._rules_version != self.rules.version:
+            self._sync_rules()
+        self._second = second
+        self._reset_counters()
+
+    def _value(self, rule: AlertRule) -> Optional[float]:
+        metric = rule.metric
+        if metric == "message_rate":
+            return self._messages
+        if metric == "sentiment":
+            return self._sentiment_sum / self._sentiment_weight if self._sentiment_weight else None
+        if metric == "keyword":
+            return self._watched_keywords.get(rule.term, 0.0)
+        return self._watched_emotes.get(rule.term, 0.0) if rule.term else self._emotes
+
+    def _evaluate(self, second: int):
+        for state in self._states.values():
+            rule = state.rule
+            value = self._value(rule)
+            if value is None:
+                continue
+            baseline = state.detector.baseline.mean
+            fired = state.detector.update(value)
+            if fired is None or second - state.fired_at < rule.cooldown:
+                continue
+            state.fired_at = second
+            direction, score = fired
+            self._fire(rule, second, direction, score, value, baseline)
+
+    def _fire(self, rule: AlertRule, second: int, direction: str, score: float, value: float, baseline: float):
+        self.alerts_fired += 1
+        alert = {
+            "id": self.alerts_fired,
+            "rule_id": rule.id,
+            "rule_name": rule.name,
+            "channel": self.channel,
+            "metric": rule.metric,
+            "term": rule.term,
+            "detector": rule.detector,
+            "direction": direction,
+            "value": round(value, 3), # In the second that fired
+            "baseline": round(baseline, 3), # EWMA mean before it
+            "score": round(score, 2), # z-score (ewma) or cumulative sum (cusum), signed
+            "threshold": rule.threshold,
+            "timestamp": float(second + 1), # End of that second, unix seconds
+        }
+        self.pending.append(alert)
+        self.history.append(alert)
+        if self.on_alert is not None:
+            self.on_alert(alert)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rules": self.rule_count, "alerts_fired": self.alerts_fired, "recent": list(self.history)}
+
+    async def run(self, publish: Callable[[Dict[str, Any]], Awaitable[None]], interval: float = 1.0):
+        """Closes finished seconds and publishes an `alert` frame per fired alert, every `interval`."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.tick()
+                pending, self.pending = self.pending, []
+                for alert in pending:
+                    await publish({"type": "alert", "payload": alert})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error publishing alerts for {self.channel}: {e}", exc_info=True)
@@ -0,0 +1,82 @@
+import os
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, NamedTuple, Any
+
+from nlp_executor import NLPResult
+from emote_handler import EmoteData
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Messages whose full analysis (sentiment, word scores, keywords, custom emotes) is
+# remembered per channel, so identical chat lines ("W", "LUL", "KEKW KEKW KEKW") skip it
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "4096"))
+# Longer messages are rarely repeated verbatim and are not cached
+ANALYSIS_CACHE_MAX_LENGTH = int(os.getenv("ANALYSIS_CACHE_MAX_LENGTH", "120"))
+
+class CachedAnalysis(NamedTuple):
+    nlp_result: NLPResult
+    custom_emotes: List[EmoteData] # FFZ/7TV emotes detected in the text
+    # Versions the analysis was computed with; the entry is stale once either changes.
+    # Together they determine all of it: the keywords skip the score table's emotes (in
+    # the NLP workers) and the emote index's names (in the pipeline)
+    emote_index_version: int
+    score_table_version: Optional[str]
+
+class AnalysisCache:
+    """Bounded LRU of per-message analysis results for one channel, keyed on the exact
+    message text. An entry only counts as a hit while the channel's emote index and the
+    emote score table are still the versions it was computed with; stale entries are
+    dropped when looked up, and `clear()` drops everything when the emotes are replaced.
+    """
+
+    def __init__(self, max_size: int = ANALYSIS_CACHE_SIZE, max_length: int = ANALYSIS_CACHE_MAX_LENGTH):
+        self.max_size = max(0, max_size)
+        self.max_length = max_length
+        self._entries: "OrderedDict[str, CachedAnalysis]" = OrderedDict()
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0 # Misses on an entry from an older emote index or score table
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str, emote_index_version: int, score_table_version: Optional[str]) -> Optional[CachedAnalysis]:
+        entry = self._entries.get(text)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.emote_index_version != emote_index_version or entry.score_table_version != score_table_version:
+            del self._entries[text]
+            self.stale += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(text)
+        self.hits += 1
+        return entry
+
+    def cacheable(self, text: str) -> bool:
+        return self.max_size > 0 and len(text) <= self.max_length
+
+    def put(self, text: str, entry: CachedAnalysis):
+        if not self.cacheable(text):
+            return
+        self._entries[text] = entry
+        self._entries.move_to_end(text)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,224 @@
+"""End-to-end chat throughput benchmark against a local fake Twitch chat server.
+
+Starts the backend (uvicorn main:app) as a subprocess pointed at a FakeTMIServer,
+connects WebSocket clients the way the frontend does, replays synthetic or
+recorded chat and measures, for `chat_message` frames:
+  - delivered messages per second
+  - p50/p99 latency from the fake server sending the PRIVMSG to a client receiving it
+  - backend CPU per message (server process plus NLP workers, Linux only)
+
+Run from the backend directory:
+    python -m benchmarks.chat_replay --rate 500 --duration 20 --channels 4
+    python -m benchmarks.chat_replay --workers 4 --channels 8 --clients 2
+    python -m benchmarks.chat_replay --irc-client raw
+    python -m benchmarks.chat_replay --json before.json
+    python -m benchmarks.chat_replay --baseline before.json --tolerance 0.15
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+import aiohttp
+
+from benchmarks.fake_tmi import FakeTMIServer
+from benchmarks.traffic import load_traffic, privmsg_line, RateSchedule
+from benchmarks.reporting import percentile, process_tree_cpu_seconds, print_results, finish
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEND_TICK_SECONDS = 0.01
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class LatencyRecorder:
+    """Collects send times (by message id) and the latency of every delivery."""
+
+    def __init__(self):
+        self.sent_at: Dict[str, float] = {}
+        self.latencies: List[float] = []
+        self.delivered = 0
+        self.last_delivery = 0.0
+        self.frames: Dict[str, int] = defaultdict(int)
+
+    def on_frame(self, frame: dict):
+        frame_type = frame.get("type", "?")
+        self.frames[frame_type] += 1
+        if frame_type != "chat_message":
+            return
+        now = time.perf_counter()
+        message_id = (frame["payload"].get("tags") or {}).get("id")
+        sent = self.sent_at.get(message_id)
+        if sent is not None:
+            self.latencies.append(now - sent)
+        self.delivered += 1
+        self.last_delivery = now
+
+async def _client(session: aiohttp.ClientSession, url: str, recorder: LatencyRecorder,
+                  joined: asyncio.Event):
+    async with session.ws_connect(url, max_msg_size=0) as ws:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            frame = json.loads(msg.data)
+            if frame.get("type") == "status" and "Successfully joined" in str(frame.get("payload")):
+                joined.set()
+            recorder.on_frame(frame)
+
+def _start_backend(args, fake: FakeTMIServer, port: int, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "TWITCH_IRC_URL": fake.irc_url,
+        "FFZ_API_BASE": fake.base_url,
+        "SEVENTV_API_BASE": fake.base_url,
+        "TWITCH_API_BASE": fake.base_url,
+        "TWITCH_ACCESS_TOKEN": "", # Anonymous login, no token validation
+        "TWITCH_CLIENT_ID": "benchmark",
+        "EMOTE_CACHE_DIR": os.path.join(workdir, "emote_cache"),
+        "IRC_JOIN_RATE_LIMIT": "1000",
+        "NLP_EXECUTOR": args.nlp_executor,
+        "IRC_CLIENT": args.irc_client,
+    })
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    if args.workers > 1:
+        env["WORKER_BROKER_SOCKET"] = os.path.join(workdir, "broker.sock")
+        command += ["--workers", str(args.workers)]
+    log = open(os.path.join(workdir, "backend.log"), "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+async def _wait_ready(session: aiohttp.ClientSession, base_url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{base_url}/ready") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass # Not listening yet
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"Backend not ready after {timeout} s")
+
+async def run(args) -> Dict[str, float]:
+    fake = FakeTMIServer()
+    await fake.start()
+    workdir = tempfile.mkdtemp(prefix="chat_replay_")
+    port = _free_port()
+    backend = _start_backend(args, fake, port, workdir)
+    recorder = LatencyRecorder()
+    channels = [f"benchchannel{i}" for i in range(args.channels)]
+    client_tasks: List[asyncio.Task] = []
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            await _wait_ready(session, f"http://127.0.0.1:{port}", args.startup_timeout)
+
+            joined_events = []
+            for channel in channels:
+                for _ in range(args.clients):
+                    joined = asyncio.Event()
+                    joined_events.append(joined)
+                    client_tasks.append(asyncio.create_task(
+                        _client(session, f"ws://127.0.0.1:{port}/ws/{channel}", recorder, joined)
+                    ))
+            await fake.wait_joined(channels)
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in joined_events)), 30)
+            await asyncio.sleep(args.settle) # Let emote fetches finish
+
+            source = load_traffic(args.replay, args.seed, args.emote_ratio, args.copypasta_ratio)
+            schedule = RateSchedule(args.rate, args.burst_every, args.burst_seconds, args.burst_factor)
+            cpu_before = process_tree_cpu_seconds(backend.pid)
+            started = time.perf_counter()
+            sent = 0
+            for send_at, count in schedule.due(args.duration, SEND_TICK_SECONDS):
+                delay = started + send_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lines: Dict[str, List[str]] = defaultdict(list)
+                for _ in range(count):
+                    sent += 1
+                    channel = channels[sent % len(channels)]
+                    message_id = str(sent)
+                    recorder.sent_at[message_id] = time.perf_counter()
+                    lines[channel].append(privmsg_line(channel, source.next_message(), sent))
+                await asyncio.gather(*(fake.send(channel, batch) for channel, batch in lines.items()))
+            send_seconds = time.perf_counter() - started
+
+            # Drain: wait until everything arrived or deliveries stop
+            expected = sent * args.clients
+            idle_since = time.perf_counter()
+            last_count = recorder.delivered
+            while recorder.delivered < expected and time.perf_counter() - idle_since < args.drain_timeout:
+                await asyncio.sleep(0.05)
+                if recorder.delivered != last_count:
+                    last_count = recorder.delivered
+                    idle_since = time.perf_counter()
+            cpu_after = process_tree_cpu_seconds(backend.pid)
+            elapsed = max(recorder.last_delivery, started + send_seconds) - started
+    finally:
+        for task in client_tasks:
+            task.cancel()
+        await asyncio.gather(*client_tasks, return_exceptions=True)
+        backend.terminate()
+        try:
+            backend.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            backend.kill()
+        await fake.stop()
+
+    unique_delivered = recorder.delivered / max(1, args.clients)
+    results: Dict[str, float] = {
+        "messages_sent": sent,
+        "deliveries": recorder.delivered,
+        "delivery_ratio": recorder.delivered / expected if expected else 0.0,
+        "send_rate_per_sec": sent / send_seconds if send_seconds else 0.0,
+        "messages_per_sec": unique_delivered / elapsed if elapsed else 0.0,
+        "latency_p50_ms": (percentile(recorder.latencies, 50) or 0.0) * 1000,
+        "latency_p99_ms": (percentile(recorder.latencies, 99) or 0.0) * 1000,
+        "latency_max_ms": (max(recorder.latencies) if recorder.latencies else 0.0) * 1000,
+    }
+    if cpu_before is not None and cpu_after is not None and unique_delivered:
+        results["cpu_ms_per_message"] = (cpu_after - cpu_before) * 1000 / unique_delivered
+    results["aggregate_frames"] = recorder.frames.get("aggregate", 0)
+    print(f"Backend log: {os.path.join(workdir, 'backend.log')}")
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=200, help="messages/s across all channels")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=1, help="WebSocket clients per channel")
+    parser.add_argument("--burst-every", type=float, default=0, help="seconds between bursts (0 = none)")
+    parser.add_argument("--burst-seconds", type=float, default=1)
+    parser.add_argument("--burst-factor", type=float, default=5)
+    parser.add_argument("--emote-ratio", type=float, default=0.3, help="share of words that are emotes")
+    parser.add_argument("--copypasta-ratio", type=float, default=0.1)
+    parser.add_argument("--replay", help="recorded chat to replay instead of synthetic traffic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--nlp-executor", default=os.getenv("NLP_EXECUTOR", "process"))
+    parser.add_argument("--irc-client", default=os.getenv("IRC_CLIENT", "twitchio"), choices=("twitchio", "raw"))
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (>1 uses the worker broker)")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait after joining")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--drain-timeout", type=float, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if results are worse than this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(f"chat replay: {args.rate:g} msgs/s for {args.duration:g} s over {args.channels} channel(s)", results)
+    return finish(results, args.json, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Local stand-in for Twitch chat (TMI) and the emote/user APIs, for benchmarks.
+
+Speaks just enough of the IRC-over-WebSocket protocol for twitchio to log in,
+join channels and receive PRIVMSGs, and serves small fixed emote sets on the
+FFZ, 7TV and Helix paths used by emote_handler.
+"""
+import asyncio
+import logging
+from collections import defaultdict, Counter
+from typing import Dict, Set, List, Iterable
+
+from aiohttp import web, WSMsgType
+
+logger = logging.getLogger(__name__)
+
+# Emote sets served by the fake APIs; the traffic generator uses the same names
+FFZ_EMOTES = ("OMEGALUL", "monkaS", "Pepega", "PepeHands", "FeelsGoodMan")
+SEVENTV_GLOBAL_EMOTES = ("EZ", "Clap", "catJAM", "peepoHappy", "Sadge", "KEKW")
+# (id, name) of Twitch emotes, sent as `emotes` tags
+TWITCH_EMOTES = (("25", "Kappa"), ("88", "PogChamp"), ("354", "4Head"), ("305954156", "LUL"))
+
+def _seventv_emote(name: str) -> Dict:
+    return {"name": name, "data": {"host": {"url": f"//cdn.7tv.test/{name}", "files": [{"name": "1x.webp"}]}}}
+
+class FakeTMIServer:
+    """aiohttp app serving chat at `/` (WebSocket) and the emote APIs over HTTP."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, api_delay: float = 0.0):
+        self.host = host
+        self.port = port
+        # Seconds each emote/user API response is held back, so concurrent requests overlap
+        self.api_delay = api_delay
+        # Requests served per API route, e.g. "/helix/users"
+        self.api_requests: Counter = Counter()
+        self._runner: web.AppRunner = None
+        # channel -> connected sockets that joined it
+        self.joined: Dict[str, Set[web.WebSocketResponse]] = defaultdict(set)
+        self._join_events: Dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        self.connections = 0
+
+        self.app = web.Application(middlewares=[self._count_api_request])
+        self.app.router.add_get("/", self._chat)
+        self.app.router.add_get("/v1/room/{channel}", self._ffz_room)
+        self.app.router.add_get("/v3/emote-sets/global", self._seventv_global)
+        self.app.router.add_get("/v3/users/twitch/{user_id}", self._seventv_user)
+        self.app.router.add_get("/helix/users", self._helix_users)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def irc_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1] # Resolve port 0
+        logger.info(f"Fake TMI server listening on {self.irc_url}")
+
+    async def stop(self):
+        for sockets in self.joined.values():
+            for ws in list(sockets):
+                await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def wait_joined(self, channels: Iterable[str], timeout: float = 30.0):
+        await asyncio.wait_for(
+            asyncio.gather(*(self._join_events[channel].wait() for channel in channels)), timeout
+        )
+
+    async def send(self, channel: str, lines: List[str]):
+        """Sends raw IRC lines to every connection that joined `channel`, in one frame."""
+        if not lines:
+            return
+        data = "\r\n".join(lines) + "\r\n"
+        for ws in list(self.joined.get(channel, ())):
+            if not ws.closed:
+                await ws.send_str(data)
+
+    # --- Chat ---
+
+    async def _chat(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        nick = "justinfan"
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                for line in msg.data.split("\r\n"):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if line.startswith("NICK "):
+                        nick = line[5:].strip()
+                        await ws.send_str("\r\n".join([
+                            f":tmi.twitch.tv 001 {nick} :Welcome, GLHF!",
+                            f":tmi.twitch.tv 002 {nick} :Your host is tmi.twitch.tv",
+                            f":tmi.twitch.tv 003 {nick} :This server is rather new",
+                            f":tmi.twitch.tv 004 {nick} :-",
+                            f":tmi.twitch.tv 375 {nick} :-",
+                            f":tmi.twitch.tv 372 {nick} :You are in a maze of twisty passages.",
+                            f":tmi.twitch.tv 376 {nick} :>",
+                        ]) + "\r\n")
+                    elif line.startswith("CAP REQ"):
+                        await ws.send_str(f":tmi.twitch.tv CAP * ACK {line[8:]}\r\n")
+                    elif line.startswith("JOIN "):
+                        for channel in line[5:].split(","):
+                            channel = channel.strip().lstrip("#")
+                            self.joined[channel].add(ws)
+                            await ws.send_str("\r\n".join([
+                                f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}",
+                                f":{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{nick}",
+                                f":{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list",
+                            ]) + "\r\n")
+                            self._join_events[channel].set()
+                    elif line.startswith("PART "):
+                        channel = line[5:].strip().lstrip("#")
+                        self.joined[channel].discard(ws)
+                        await ws.send_str(f":{nick}!{nick}@{nick}.tmi.twitch.tv PART #{channel}\r\n")
+                    elif line.startswith("PING"):
+                        await ws.send_str("PONG :tmi.twitch.tv\r\n")
+        finally:
+            for sockets in self.joined.values():
+                sockets.discard(ws)
+        return ws
+
+    # --- Emote / User APIs ---
+
+    @web.middleware
+    async def _count_api_request(self, request: web.Request, handler):
+        if request.path == "/":
+            return await handler(request)
+        self.api_requests[request.match_info.route.resource.canonical] += 1
+        if self.api_delay:
+            await asyncio.sleep(self.api_delay)
+        return await handler(request)
+
+    async def _ffz_room(self, request: web.Request) -> web.Response:
+        emoticons = [{"name": name, "urls": {"1": f"//cdn.ffz.test/{name}/1"}} for name in FFZ_EMOTES]
+        return web.json_response({"room": {}, "sets": {"1": {"emoticons": emoticons}}})
+
+    async def _seventv_global(self, request: web.Request) -> web.Response:
+        return web.json_response({"emotes": [_seventv_emote(name) for name in SEVENTV_GLOBAL_EMOTES]})
+
+    async def _seventv_user(self, request: web.Request) -> web.Response:
+        return web.json_response({"emote_set": {"emotes": []}})
+
+    async def _helix_users(self, request: web.Request) -> web.Response:
+        login = request.query.get("login", "")
+        return web.json_response({"data": [{"id": str(abs(hash(login)) % 10**8), "login": login}]})
@@ -0,0 +1,80 @@
+"""Request coalescing of the shared HTTP client, against the local fake API server.
+
+Checks that:
+  - N concurrent `coalesced_get` calls for the same URL reach the server once
+    and all get the same response, while different URLs are not merged
+  - the Twitch login -> user ID lookup is memoized: concurrent lookups of one
+    login make one Helix request and later lookups make none
+
+Run from the backend directory:
+    python -m benchmarks.http_coalescing --callers 50
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Dict, Any
+
+from benchmarks.fake_tmi import FakeTMIServer
+from benchmarks.reporting import print_results
+
+async def _run(callers: int, delay: float) -> Dict[str, Any]:
+    server = FakeTMIServer(api_delay=delay)
+    await server.start()
+    # The API base URLs are read on import, so point them at the stub server first
+    os.environ["TWITCH_API_BASE"] = server.base_url
+    from http_client import coalesced_get, close_http_client
+    import emote_handler
+
+    try:
+        url = f"{server.base_url}/v3/emote-sets/global"
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(coalesced_get(url) for _ in range(callers)))
+        coalesced_ms = (time.perf_counter() - started) * 1000
+        same_url_requests = server.api_requests["/v3/emote-sets/global"]
+        shared = all(response is responses[0] for response in responses)
+
+        rooms = [f"{server.base_url}/v1/room/channel{i}" for i in range(3)]
+        await asyncio.gather(*(coalesced_get(room) for room in rooms for _ in range(callers)))
+        distinct_url_requests = server.api_requests["/v1/room/{channel}"]
+
+        lookup = lambda: emote_handler.get_twitch_user_id("SomeStreamer", "client-id", "oauth:token")
+        user_ids = await asyncio.gather(*(lookup() for _ in range(callers)))
+        user_ids.append(await lookup()) # Memoized by now
+        helix_requests = server.api_requests["/helix/users"]
+    finally:
+        await close_http_client()
+        await server.stop()
+
+    return {
+        "callers": callers,
+        "same_url_requests": same_url_requests,
+        "shared_response": shared,
+        "distinct_url_requests": distinct_url_requests,
+        "helix_requests": helix_requests,
+        "consistent_user_id": len(set(user_ids)) == 1 and user_ids[0] is not None,
+        "coalesced_ms": coalesced_ms,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds the stub server holds each response")
+    args = parser.parse_args()
+
+    results = asyncio.run(_run(args.callers, args.delay))
+    print_results(f"{args.callers} concurrent callers per URL", results)
+    failures = []
+    if results["same_url_requests"] != 1 or not results["shared_response"]:
+        failures.append("concurrent GETs of one URL were not merged into one request")
+    if results["distinct_url_requests"] != 3:
+        failures.append("GETs of different URLs were merged")
+    if results["helix_requests"] != 1 or not results["consistent_user_id"]:
+        failures.append("lookups of one login made more than one Helix request")
+    for failure in failures:
+        print(f"\nFAILED: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
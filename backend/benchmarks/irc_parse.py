@@ -0,0 +1,139 @@
+"""Chat line handling cost: twitchio vs. the raw IRC client (IRC_CLIENT=raw).
+
+Feeds the same PRIVMSG frames to both clients, without networking, and times per
+message:
+  - parse: twitchio's parser() vs. raw_irc.parse_privmsg() plus reading the tags
+  - dispatch: from a received WebSocket frame until the message handler has read
+    channel, author, content, timestamp and tags (twitchio: a task per line,
+    parser, Channel/Chatter/Message objects and its chatter cache)
+and checks that both clients hand the pipeline the same messages.
+
+Run from the backend directory:
+    python -m benchmarks.irc_parse --messages 50000 --json irc.json
+"""
+import sys
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Tuple, Any
+
+from twitchio.ext import commands
+from twitchio.parse import parser as twitchio_parser
+
+from raw_irc import RawIrcConnection, ChatLine, parse_privmsg
+from benchmarks.traffic import load_traffic, privmsg_line
+from benchmarks.reporting import print_results, finish
+
+NICK = "justinfan123"
+CHANNEL = "benchchannel"
+
+Received = Tuple[str, str, str, Any, str] # channel, author, content, timestamp, emotes tag
+
+class _TwitchioBot(commands.Bot):
+    def __init__(self, count: int):
+        super().__init__(token="anonymous", prefix="!unused", initial_channels=[])
+        self._http.nick = NICK
+        self._connection.nick = NICK
+        self.received: List[Received] = []
+        self.count = count
+        self.done = asyncio.Event()
+
+    async def event_message(self, message):
+        # What ChatShard._dispatch_message reads
+        tags = message.tags
+        self.received.append((message.channel.name, message.author.name, message.content,
+                               message.timestamp, tags.get("emotes", "")))
+        if len(self.received) == self.count:
+            self.done.set()
+
+class _RawClient(RawIrcConnection):
+    def __init__(self, count: int):
+        super().__init__(NICK)
+        self.received: List[Received] = []
+        self.count = count
+        self.done = asyncio.Event()
+
+    async def event_chat_line(self, line: ChatLine):
+        tags = line.tags
+        self.received.append((line.channel, line.author, line.content, line.timestamp, tags.get("emotes", "")))
+        if len(self.received) == self.count:
+            self.done.set()
+
+def _time_parse(parse, lines: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / len(lines)
+
+def _parse_raw(line: str):
+    chat_line = parse_privmsg(line)
+    return chat_line.tags
+
+async def _dispatch_twitchio(frames: List[str], count: int) -> Tuple[float, List[Received]]:
+    bot = _TwitchioBot(count)
+    connection = bot._connection
+    start = time.perf_counter()
+    for frame in frames:
+        # As twitchio's WSConnection._keep_alive handles a received frame
+        for event in frame.split("\r\n"):
+            if event:
+                connection._background_tasks.append(asyncio.create_task(connection._process_data(event)))
+    await bot.done.wait()
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*connection._background_tasks)
+    return elapsed * 1e6 / count, bot.received
+
+async def _dispatch_raw(frames: List[str], count: int) -> Tuple[float, List[Received]]:
+    client = _RawClient(count)
+    start = time.perf_counter()
+    for frame in frames:
+        client._handle_frame(frame)
+    await client.done.wait()
+    return (time.perf_counter() - start) * 1e6 / count, client.received
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--lines-per-frame", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--emote-ratio", type=float, default=0.3)
+    parser.add_argument("--replay", help="recorded chat to use instead of synthetic traffic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if results are worse than this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    args = parser.parse_args()
+
+    source = load_traffic(args.replay, args.seed, args.emote_ratio, 0.0)
+    lines = [privmsg_line(CHANNEL, source.next_message(), message_id) for message_id in range(args.messages)]
+    frames = ["\r\n".join(lines[i:i + args.lines_per_frame]) + "\r\n"
+              for i in range(0, len(lines), args.lines_per_frame)]
+
+    twitchio_dispatch, raw_dispatch = float("inf"), float("inf")
+    for _ in range(args.repeat):
+        elapsed, twitchio_received = asyncio.run(_dispatch_twitchio(frames, len(lines)))
+        twitchio_dispatch = min(twitchio_dispatch, elapsed)
+        elapsed, raw_received = asyncio.run(_dispatch_raw(frames, len(lines)))
+        raw_dispatch = min(raw_dispatch, elapsed)
+    mismatches = sum(1 for a, b in zip(twitchio_received, raw_received) if a != b)
+
+    results: Dict[str, Any] = {
+        "messages": len(lines),
+        "twitchio_parse_us": _time_parse(lambda line: twitchio_parser(line, NICK), lines, args.repeat),
+        "raw_parse_us": _time_parse(_parse_raw, lines, args.repeat),
+        "twitchio_dispatch_us": twitchio_dispatch,
+        "raw_dispatch_us": raw_dispatch,
+        "dispatch_speedup_ratio": twitchio_dispatch / raw_dispatch,
+        "mismatched_messages": mismatches,
+    }
+    print_results(f"chat line handling, {len(lines)} messages (best of {args.repeat})", results)
+    if mismatches:
+        print(f"\n{mismatches} messages differ between twitchio and the raw client")
+        return 1
+    return finish(results, args.json, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Keyword extraction throughput: keyword engine vs. the per-message nltk reference.
+
+Run from the backend directory:
+    python -m benchmarks.keyword_throughput --messages 20000 --repeat-ratio 0.5
+"""
+import sys
+import time
+import random
+import argparse
+from typing import List, Callable
+
+import nlp_processor
+
+CHAT_WORDS = (
+    "the game is so good streamer play boss fight chat this run was insane what a clutch "
+    "hype train raid gg ez skill issue map build items sword shield dragon music stream lag "
+    "mods ban that guy next level when is the giveaway i love this song bro missed the jump "
+    "again how many deaths today first time watching great vibes tonight"
+).split()
+
+def synthetic_chat(count: int, repeat_ratio: float, seed: int) -> List[str]:
+    """Random chat lines; `repeat_ratio` of them repeat earlier lines (copypasta, spam)."""
+    rng = random.Random(seed)
+    messages: List[str] = []
+    for _ in range(count):
+        if messages and rng.random() < repeat_ratio:
+            messages.append(rng.choice(messages[-500:]))
+        else:
+            messages.append(" ".join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(2, 14))))
+    return messages
+
+def measure(name: str, run: Callable[[], List[List[str]]], count: int) -> List[List[str]]:
+    start = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {count / elapsed:>10.0f} msgs/s  ({elapsed * 1e6 / count:.1f} us/msg)")
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat-ratio", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    nlp_processor.init_nlp_resources()
+    engine = nlp_processor.keyword_engine
+    if engine is None:
+        print("Keyword engine unavailable (NLTK data missing), nothing to measure.")
+        return 1
+    messages = synthetic_chat(args.messages, args.repeat_ratio, args.seed)
+
+    # The reference path doesn't know about emotes, so compare without emote skipping
+    engine.set_skip_words(())
+    reference = measure("nltk per message", lambda: [nlp_processor.extract_keywords_nltk(m) for m in messages], len(messages))
+    batched = measure(
+        f"engine, batches of {args.batch_size}",
+        lambda: [
+            keywords
+            for i in range(0, len(messages), args.batch_size)
+            for keywords in nlp_processor.extract_keywords_batch(messages[i:i + args.batch_size])
+        ],
+        len(messages)
+    )
+    engine.set_skip_words(nlp_processor.get_emote_score_table().scores)
+
+    mismatches = sum(1 for a, b in zip(reference, batched) if a != b)
+    print(f"Output mismatches: {mismatches}")
+    print(f"Cache stats: {engine.cache_info()}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Result formatting and baseline comparison shared by the benchmarks."""
+import os
+import json
+import math
+from typing import Dict, List, Sequence, Optional
+
+# Metrics compared against a baseline, by name suffix; anything else is informational
+HIGHER_IS_BETTER_SUFFIXES = ("_per_sec", "_ratio")
+LOWER_IS_BETTER_SUFFIXES = ("_ms", "_per_message", "_us")
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of unsorted `values` (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(p / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+def process_tree_cpu_seconds(pid: int) -> Optional[float]:
+    """CPU time (user + system) of process `pid` and all its descendants, e.g. the
+    server and its NLP pool workers. Linux only (reads /proc); None elsewhere.
+    """
+    try:
+        ticks = os.sysconf("SC_CLK_TCK")
+    except (AttributeError, ValueError, OSError):
+        return None
+    if not os.path.exists(f"/proc/{pid}/stat"):
+        return None
+    total = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks # utime, stime
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError, IndexError):
+            continue # Process exited meanwhile
+    return total
+
+def print_results(title: str, results: Dict[str, float]):
+    print(f"\n== {title} ==")
+    for key, value in results.items():
+        if isinstance(value, float):
+            print(f"  {key:<28} {value:,.3f}")
+        else:
+            print(f"  {key:<28} {value}")
+
+def compare_to_baseline(results: Dict[str, float], baseline_path: str, tolerance: float) -> List[str]:
+    """Returns a description of every metric that is more than `tolerance` (a fraction)
+    worse than in the baseline JSON file.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    for key, old in baseline.items():
+        new = results.get(key)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old <= 0:
+            continue
+        if key.endswith(HIGHER_IS_BETTER_SUFFIXES):
+            worse = new < old * (1 - tolerance)
+        elif key.endswith(LOWER_IS_BETTER_SUFFIXES):
+            worse = new > old * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{key}: {old:,.3f} -> {new:,.3f}")
+    return regressions
+
+def finish(results: Dict[str, float], json_path: Optional[str], baseline_path: Optional[str],
+           tolerance: float) -> int:
+    """Writes results as JSON and checks them against a baseline. Returns the exit code."""
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {json_path}")
+    if baseline_path:
+        regressions = compare_to_baseline(results, baseline_path, tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS (>{tolerance:.0%} worse than {baseline_path}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions against {baseline_path}")
+    return 0
@@ -0,0 +1,88 @@
+"""Per-stage microbenchmark of the chat pipeline's hot functions.
+
+Times analyze_sentiment (per message and in NLP executor sized batches),
+extract_keywords and detect_emotes_in_message per message on the same traffic chat_replay uses, without any networking.
+Fails if a batched compound score is further than COMPOUND_TOLERANCE from the per-message one.
+
+Run from the backend directory:
+    python -m benchmarks.stages --messages 20000 --json stages.json
+    python -m benchmarks.stages --baseline stages.json
+"""
+import sys
+import time
+import argparse
+from typing import Callable, Dict, List, Optional, Any
+
+import nlp_processor
+from emote_handler import build_emote_index, detect_emotes_in_message
+from benchmarks.fake_tmi import FFZ_EMOTES, SEVENTV_GLOBAL_EMOTES
+from benchmarks.traffic import load_traffic
+from benchmarks.reporting import print_results, finish
+from nlp_executor import NLP_BATCH_MAX_SIZE
+from sentiment_engine import COMPOUND_TOLERANCE
+
+def _time_per_message(func: Callable[[Any], object], messages: List[Any], repeat: int,
+                      message_count: Optional[int] = None) -> float:
+    """Best-of-`repeat` time per message, in microseconds. `messages` may be batches
+    if `message_count` gives the number of messages in them."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            func(message)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / (message_count or len(messages))
+
+def _batches(messages: List[str], size: int = NLP_BATCH_MAX_SIZE) -> List[List[str]]:
+    return [messages[i:i + size] for i in range(0, len(messages), size)]
+
+def _compound_differences(messages: List[str]) -> List[float]:
+    """|batched - per-message compound score| of each message."""
+    batched = [result for batch in _batches(messages) for result in nlp_processor.analyze_sentiment_batch(batch)]
+    return [abs((single[0] or 0.0) - (result[0] or 0.0))
+            for single, result in zip(map(nlp_processor.analyze_sentiment, messages), batched)]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--emote-ratio", type=float, default=0.3)
+    parser.add_argument("--copypasta-ratio", type=float, default=0.1)
+    parser.add_argument("--replay", help="recorded chat to use instead of synthetic traffic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if results are worse than this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    args = parser.parse_args()
+
+    nlp_processor.init_nlp_resources()
+    source = load_traffic(args.replay, args.seed, args.emote_ratio, args.copypasta_ratio)
+    messages = [source.next_message().content for _ in range(args.messages)]
+    emote_index = build_emote_index(
+        {name: f"https://cdn.ffz.test/{name}" for name in FFZ_EMOTES}, {},
+        {name: f"https://cdn.7tv.test/{name}" for name in SEVENTV_GLOBAL_EMOTES}
+    )
+
+    results: Dict[str, float] = {
+        "messages": len(messages),
+        "analyze_sentiment_us": _time_per_message(nlp_processor.analyze_sentiment, messages, args.repeat),
+        "analyze_sentiment_batch_us": _time_per_message(
+            nlp_processor.analyze_sentiment_batch, _batches(messages), args.repeat, len(messages)),
+        "extract_keywords_us": _time_per_message(nlp_processor.extract_keywords, messages, args.repeat),
+        "detect_emotes_us": _time_per_message(lambda m: detect_emotes_in_message(m, emote_index), messages, args.repeat),
+    }
+    differences = _compound_differences(messages)
+    # Rounding noise around COMPOUND_TOLERANCE itself is not a mismatch
+    mismatches = sum(1 for difference in differences if difference > COMPOUND_TOLERANCE + 1e-9)
+    results["max_compound_difference"] = max(differences, default=0.0)
+    results["mismatched_compound_scores"] = mismatches
+    if not nlp_processor.NLTK_DATA_READY:
+        print("Note: NLTK data is missing, extract_keywords returns early and its timing is meaningless.")
+    print_results(f"pipeline stages, {len(messages)} messages (best of {args.repeat})", results)
+    if mismatches:
+        print(f"\n{mismatches} batched compound scores differ from analyze_sentiment's by more than {COMPOUND_TOLERANCE}")
+        return 1
+    return finish(results, args.json, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
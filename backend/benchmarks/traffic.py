@@ -0,0 +1,145 @@
+"""Synthetic and recorded chat traffic for the benchmarks."""
+import time
+import random
+from typing import List, Optional, Tuple, Iterator
+
+from benchmarks.fake_tmi import FFZ_EMOTES, SEVENTV_GLOBAL_EMOTES, TWITCH_EMOTES
+
+CHAT_WORDS = (
+    "the game is so good streamer play boss fight chat this run was insane what a clutch "
+    "hype train raid gg ez skill issue map build items sword shield dragon music stream lag "
+    "mods ban that guy next level when is the giveaway i love this song bro missed the jump "
+    "again how many deaths today first time watching great vibes tonight terrible awful nice"
+).split()
+
+COPYPASTAS = (
+    "I'm not even mad that was amazing OMEGALUL I'm not even mad that was amazing OMEGALUL",
+    "chat is this real chat is this real chat is this real Pepega",
+    "THIS IS THE BEST STREAM EVER PogChamp Clap THIS IS THE BEST STREAM EVER PogChamp Clap",
+)
+
+class ChatMessage:
+    __slots__ = ('author', 'content', 'emotes_tag')
+
+    def __init__(self, author: str, content: str, emotes_tag: str = ""):
+        self.author = author
+        self.content = content
+        self.emotes_tag = emotes_tag
+
+def _twitch_emotes_tag(content: str) -> str:
+    """Builds an IRCv3 `emotes` tag (id:start-end,start-end/...) for Twitch emotes in `content`."""
+    ranges = {}
+    position = 0
+    for word in content.split(" "):
+        for emote_id, name in TWITCH_EMOTES:
+            if word == name:
+                ranges.setdefault(emote_id, []).append(f"{position}-{position + len(word) - 1}")
+        position += len(word) + 1
+    return "/".join(f"{emote_id}:{','.join(spans)}" for emote_id, spans in ranges.items())
+
+class SyntheticChat:
+    """Random chat lines with emotes, plus copypasta repeated `copypasta_ratio` of the time."""
+
+    def __init__(self, seed: int = 1, emote_ratio: float = 0.3, copypasta_ratio: float = 0.1,
+                 chatters: int = 2000):
+        self._rng = random.Random(seed)
+        self.emote_ratio = emote_ratio
+        self.copypasta_ratio = copypasta_ratio
+        self._chatters = [f"viewer{i}" for i in range(chatters)]
+        self._emotes = list(FFZ_EMOTES) + list(SEVENTV_GLOBAL_EMOTES) + [name for _, name in TWITCH_EMOTES]
+
+    def next_message(self) -> ChatMessage:
+        rng = self._rng
+        if rng.random() < self.copypasta_ratio:
+            content = rng.choice(COPYPASTAS)
+        else:
+            words = []
+            for _ in range(rng.randint(1, 14)):
+                words.append(rng.choice(self._emotes) if rng.random() < self.emote_ratio else rng.choice(CHAT_WORDS))
+            content = " ".join(words)
+        return ChatMessage(rng.choice(self._chatters), content, _twitch_emotes_tag(content))
+
+    def messages(self, count: int) -> List[ChatMessage]:
+        return [self.next_message() for _ in range(count)]
+
+class RecordedChat:
+    """Replays a recording: one message per line, either `author<TAB>content` or just content.
+    Raw IRC PRIVMSG lines are accepted too (tags other than `emotes` are dropped).
+    """
+
+    def __init__(self, path: str):
+        self._messages: List[ChatMessage] = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line:
+                    self._messages.append(self._parse(line))
+        if not self._messages:
+            raise ValueError(f"No messages in recording {path}")
+        self._position = 0
+
+    @staticmethod
+    def _parse(line: str) -> ChatMessage:
+        if " PRIVMSG #" in line:
+            tags, emotes_tag = "", ""
+            if line.startswith("@"):
+                tags, line = line[1:].split(" ", 1)
+                for tag in tags.split(";"):
+                    if tag.startswith("emotes="):
+                        emotes_tag = tag[7:]
+            author = line[1:].split("!", 1)[0]
+            content = line.split(" :", 1)[1] if " :" in line else ""
+            return ChatMessage(author, content, emotes_tag)
+        if "\t" in line:
+            author, content = line.split("\t", 1)
+            return ChatMessage(author, content, _twitch_emotes_tag(content))
+        return ChatMessage("viewer", line, _twitch_emotes_tag(line))
+
+    def next_message(self) -> ChatMessage:
+        message = self._messages[self._position]
+        self._position = (self._position + 1) % len(self._messages)
+        return message
+
+def privmsg_line(channel: str, message: ChatMessage, message_id: int) -> str:
+    """Formats a chat message as Twitch sends it (with tags)."""
+    author = message.author
+    tags = (
+        f"@badge-info=;badges=;color=;display-name={author};emotes={message.emotes_tag};"
+        f"first-msg=0;flags=;id={message_id};mod=0;room-id=1;subscriber=0;"
+        f"tmi-sent-ts={int(time.time() * 1000)};turbo=0;user-id=1;user-type="
+    )
+    return f"{tags} :{author}!{author}@{author}.tmi.twitch.tv PRIVMSG #{channel} :{message.content}"
+
+class RateSchedule:
+    """Target send rate over time: `rate` msgs/s, multiplied by `burst_factor` for
+    `burst_seconds` out of every `burst_every` seconds (no bursts if burst_every is 0).
+    """
+
+    def __init__(self, rate: float, burst_every: float = 0.0, burst_seconds: float = 1.0,
+                 burst_factor: float = 5.0):
+        self.rate = rate
+        self.burst_every = burst_every
+        self.burst_seconds = burst_seconds
+        self.burst_factor = burst_factor
+
+    def rate_at(self, elapsed: float) -> float:
+        if self.burst_every > 0 and (elapsed % self.burst_every) < self.burst_seconds:
+            return self.rate * self.burst_factor
+        return self.rate
+
+    def due(self, duration: float, tick: float) -> Iterator[Tuple[float, int]]:
+        """Yields (send_at, message_count) for each tick of the run."""
+        owed = 0.0
+        elapsed = 0.0
+        while elapsed < duration:
+            owed += self.rate_at(elapsed) * tick
+            count = int(owed)
+            owed -= count
+            yield elapsed, count
+            elapsed += tick
+
+def load_traffic(replay: Optional[str], seed: int, emote_ratio: float, copypasta_ratio: float):
+    """Returns a message source with a next_message() method."""
+    if replay:
+        return RecordedChat(replay)
+    return SyntheticChat(seed=seed, emote_ratio=emote_ratio, copypasta_ratio=copypasta_ratio)
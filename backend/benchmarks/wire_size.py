@@ -0,0 +1,98 @@
+"""Size and encode time of chat_message frames in each WebSocket wire format.
+
+Builds chat_message frames the way the pipeline does (sentiment, keywords, emotes,
+IRC tags) from the same traffic chat_replay uses and encodes them for the default
+JSON format and a few negotiated compact ones.
+
+Run from the backend directory:
+    python -m benchmarks.wire_size --messages 20000 --json wire.json
+    python -m benchmarks.wire_size --baseline wire.json
+"""
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import nlp_processor
+from emote_handler import build_emote_index, detect_emotes_in_message
+from websocket_manager import encode_message
+from wire_format import WireFormat, EmoteRegistry, compact_frames, msgpack
+from benchmarks.fake_tmi import FFZ_EMOTES, SEVENTV_GLOBAL_EMOTES
+from benchmarks.traffic import load_traffic, privmsg_line
+from benchmarks.reporting import print_results, finish
+
+COMPACT_FIELDS = ("timestamp", "author", "content", "sentiment_score", "keywords", "detected_emotes")
+
+def _tags(line: str) -> Dict[str, str]:
+    return dict(tag.split("=", 1) for tag in line[1:].split(" ", 1)[0].split(";"))
+
+def _frames(messages, emote_index) -> List[dict]:
+    frames = []
+    for index, message in enumerate(messages):
+        sentiment_score, sentiment_words = nlp_processor.analyze_sentiment(message.content)
+        emotes = [
+            {"name": emote["name"], "url": emote["url"], "type": emote["source"],
+             "sentiment_score": sentiment_words.get(emote["name"])}
+            for emote in detect_emotes_in_message(message.content, emote_index)
+        ]
+        frames.append({"type": "chat_message", "payload": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "author": message.author,
+            "content": message.content,
+            "tags": _tags(privmsg_line("benchchannel", message, index)),
+            "sentiment_score": sentiment_score,
+            "sentiment_words": sentiment_words,
+            "keywords": nlp_processor.extract_keywords(message.content),
+            "detected_emotes": emotes,
+            "score_table_version": nlp_processor.get_emote_score_table().version
+        }})
+    return frames
+
+def _measure(name: str, frames: List[dict], wire: WireFormat, results: Dict[str, float]):
+    registry = EmoteRegistry()
+    encoded = []
+    start = time.perf_counter()
+    for frame in frames:
+        if wire.is_default:
+            encoded.append(("chat_message", encode_message(frame)))
+        else:
+            encoded.extend(compact_frames(frame, wire, registry))
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(len(data.encode("utf-8")) if isinstance(data, str) else len(data) for _, data in encoded)
+    results[f"{name}_bytes_per_message"] = total_bytes / len(frames)
+    results[f"{name}_encode_us"] = elapsed * 1e6 / len(frames)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--emote-ratio", type=float, default=0.3)
+    parser.add_argument("--copypasta-ratio", type=float, default=0.1)
+    parser.add_argument("--replay", help="recorded chat to use instead of synthetic traffic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if results are worse than this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression (fraction)")
+    args = parser.parse_args()
+
+    nlp_processor.init_nlp_resources()
+    source = load_traffic(args.replay, args.seed, args.emote_ratio, args.copypasta_ratio)
+    emote_index = build_emote_index(
+        {name: f"https://cdn.ffz.test/{name}" for name in FFZ_EMOTES}, {},
+        {name: f"https://cdn.7tv.test/{name}" for name in SEVENTV_GLOBAL_EMOTES}
+    )
+    frames = _frames([source.next_message() for _ in range(args.messages)], emote_index)
+
+    results: Dict[str, float] = {"messages": len(frames)}
+    _measure("json", frames, WireFormat(), results)
+    _measure("fields", frames, WireFormat("json", COMPACT_FIELDS), results)
+    _measure("refs", frames, WireFormat("json", COMPACT_FIELDS, True), results)
+    if msgpack is not None:
+        _measure("msgpack", frames, WireFormat("msgpack", COMPACT_FIELDS, True), results)
+    else:
+        print("Note: msgpack is not installed, skipping the binary formats.")
+    print_results(f"chat_message wire formats, {len(frames)} messages", results)
+    return finish(results, args.json, args.baseline, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import os
+import re
+import mmap
+import time
+import struct
+import logging
+import threading
+from collections import deque
+from typing import List, Dict, Optional, Deque, Iterator, NamedTuple, BinaryIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Recording is off unless CHAT_STORE_DIR is set
+CHAT_STORE_DIR = os.getenv("CHAT_STORE_DIR", "")
+CHAT_STORE_SEGMENT_BYTES = int(os.getenv("CHAT_STORE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+CHAT_STORE_SEGMENT_SECONDS = float(os.getenv("CHAT_STORE_SEGMENT_SECONDS", "3600"))
+CHAT_STORE_FSYNC_INTERVAL = float(os.getenv("CHAT_STORE_FSYNC_INTERVAL", "1.0"))
+CHAT_STORE_QUEUE_SIZE = int(os.getenv("CHAT_STORE_QUEUE_SIZE", "100000"))
+
+# --- Segment Format ---
+# A segment is one channel's chat for a span of time, in `<dir>/<channel>/<start_ms>.seg`:
+#   header:  magic, format version, segment start (unix ms), channel name
+#   records: type (u8), payload length (u32), payload
+# Strings (authors, emotes, keywords) are interned per segment: the first use of a
+# string writes a STRING record assigning it an id, messages then refer to the id.
+# Segments are only ever appended to, and a reader stops at a truncated last record,
+# so a segment can be read (memory-mapped) while it is being written.
+SEGMENT_MAGIC = b"TCAS"
+SEGMENT_VERSION = 1
+SEGMENT_SUFFIX = ".seg"
+_HEADER = struct.Struct("<4sHxxqH") # magic, version, start_ms, channel name length
+_RECORD = struct.Struct("<BI") # record type, payload length
+_STRING_ID = struct.Struct("<I")
+# ts offset from segment start (ms), author id, sentiment * 10000, emote count, keyword count
+_MESSAGE = struct.Struct("<IIhBB")
+
+RECORD_STRING = 1
+RECORD_MESSAGE = 2
+
+SENTIMENT_SCALE = 10000
+SENTIMENT_NONE = -32768
+MAX_LIST_LENGTH = 255
+
+class ChatEvent(NamedTuple):
+    """One processed chat message, as recorded."""
+    timestamp: float # Unix seconds
+    author: str
+    content: str
+    sentiment_score: Optional[float]
+    emotes: List[str]
+    keywords: List[str]
+    # Share of messages analyzed when this one was processed (not stored in segments)
+    sample_rate: float = 1.0
+
+def _safe_channel(channel: str) -> str:
+    return re.sub(r"[^a-z0-9_]", "_", channel.lower())
+
+# --- Writing ---
+
+class _SegmentWriter:
+    """Appends records to one open segment file."""
+
+    def __init__(self, directory: str, channel: str, start: float):
+        self.start_ms = int(start * 1000)
+        self.opened_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        while True:
+            self.path = os.path.join(directory, f"{self.start_ms}{SEGMENT_SUFFIX}")
+            try:
+                self._file: BinaryIO = open(self.path, "xb", buffering=256 * 1024)
+                break
+            except FileExistsError:
+                self.start_ms += 1 # Never append to an older segment
+        self._strings: Dict[str, int] = {}
+        self.size = 0
+        self.dirty = False
+        name = channel.encode("utf-8")
+        self._write(_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, self.start_ms, len(name)) + name)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+        self.dirty = True
+
+    def _intern(self, text: str, out: List[bytes]) -> int:
+        string_id = self._strings.get(text)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings[text] = string_id
+            payload = _STRING_ID.pack(string_id) + text.encode("utf-8")
+            out.append(_RECORD.pack(RECORD_STRING, len(payload)) + payload)
+        return string_id
+
+    def append(self, event: ChatEvent):
+        out: List[bytes] = []
+        author_id = self._intern(event.author, out)
+        emotes = event.emotes[:MAX_LIST_LENGTH]
+        keywords = event.keywords[:MAX_LIST_LENGTH]
+        ids = [self._intern(name, out) for name in emotes] + [self._intern(word, out) for word in keywords]
+        if event.sentiment_score is None:
+            sentiment = SENTIMENT_NONE
+        else:
+            sentiment = max(-SENTIMENT_SCALE, min(SENTIMENT_SCALE, round(event.sentiment_score * SENTIMENT_SCALE)))
+        offset_ms = max(0, int(event.timestamp * 1000) - self.start_ms)
+        payload = b"".join((
+            _MESSAGE.pack(offset_ms, author_id, sentiment, len(emotes), len(keywords)),
+            struct.pack(f"<{len(ids)}I", *ids),
+            event.content.encode("utf-8")
+        ))
+        out.append(_RECORD.pack(RECORD_MESSAGE, len(payload)) + payload)
+        self._write(b"".join(out))
+
+    def sync(self):
+        if self.dirty:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.dirty = False
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+class ChatRecorder:
+    """Writes processed chat messages to per-channel, append-only segment files.
+
+    record() only appends to an in-memory queue, so the live path never waits on
+    disk; a single background thread encodes the queue, writes it, fsyncs at most
+    every `fsync_interval` seconds and rotates a channel's segment once it reaches
+    `segment_bytes` or has been open for `segment_seconds`. If the writer falls
+    behind by more than `max_queue` messages, new messages are dropped (and counted).
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = CHAT_STORE_SEGMENT_BYTES,
+                 segment_seconds: float = CHAT_STORE_SEGMENT_SECONDS,
+                 fsync_interval: float = CHAT_STORE_FSYNC_INTERVAL,
+                 max_queue: int = CHAT_STORE_QUEUE_SIZE, rollups=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.fsync_interval = fsync_interval
+        self.max_queue = max_queue
+        # (channel, event), or (channel, None) to end the channel's session
+        self._queue: Deque[Tuple[str, Optional[ChatEvent]]] = deque()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._writers: Dict[str, _SegmentWriter] = {}
+        self.recorded = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.segments_opened = 0
+        # Optional rollups.RollupBuilder, updated from the writer thread
+        self.rollups = rollups
+        self._thread = threading.Thread(target=self._run, name="ChatRecorder", daemon=True)
+        self._thread.start()
+        logger.info(f"Chat recorder writing to {directory}")
+
+    def record(self, channel: str, event: ChatEvent):
+        """Queues one message for writing. Never blocks."""
+        if self._closed:
+            return
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append((channel, event)) # deque.append is thread-safe
+        if len(self._queue) >= 1024:
+            self._wakeup.set()
+
+    def _writer_for(self, channel: str, timestamp: float) -> _SegmentWriter:
+        writer = self._writers.get(channel)
+        if writer is not None and (
+            writer.size >= self.segment_bytes
+            or time.monotonic() - writer.opened_at >= self.segment_seconds
+        ):
+            self.bytes_written += writer.size
+            writer.close()
+            writer = None
+        if writer is None:
+            writer = _SegmentWriter(os.path.join(self.directory, _safe_channel(channel)), channel, timestamp)
+            self._writers[channel] = writer
+            self.segments_opened += 1
+        return writer
+
+    def _drain(self):
+        while self._queue:
+            channel, event = self._queue.popleft()
+            if event is None:
+                self._end_session(channel)
+                continue
+            try:
+                self._writer_for(channel, event.timestamp).append(event)
+                self.recorded += 1
+            except Exception as e:
+                logger.error(f"Chat recorder failed to write a message for {channel}: {e}")
+            if self.rollups is not None:
+                try:
+                    self.rollups.add(channel, event.timestamp, event.sentiment_score, event.emotes,
+                                     event.keywords, event.sample_rate)
+                except Exception as e:
+                    logger.error(f"Chat recorder failed to update rollups for {channel}: {e}")
+
+    def _end_session(self, channel: str):
+        writer = self._writers.get(channel)
+        if writer is not None:
+            writer.opened_at = float("-inf") # Next message starts a new segment
+        if self.rollups is not None:
+            self.rollups.end_session(channel)
+
+    def _sync_all(self):
+        for channel, writer in list(self._writers.items()):
+            try:
+                writer.sync()
+            except OSError as e:
+                logger.error(f"Chat recorder fsync failed for {channel}: {e}")
+        if self.rollups is not None:
+            self.rollups.flush()
+
+    def _run(self):
+        # Wake up a few times per fsync interval to keep the queue short
+        poll = max(0.01, self.fsync_interval / 4)
+        last_sync = time.monotonic()
+        while True:
+            self._wakeup.wait(poll)
+            self._wakeup.clear()
+            self._drain()
+            if time.monotonic() - last_sync >= self.fsync_interval:
+                self._sync_all()
+                last_sync = time.monotonic()
+            if self._closed and not self._queue:
+                break
+        for writer in self._writers.values():
+            self.bytes_written += writer.size
+            writer.close()
+        self._writers.clear()
+        if self.rollups is not None:
+            self.rollups.close()
+
+    def close_channel(self, channel: str):
+        """Ends the channel's session: its next message starts a new segment and its
+        rollups are written out. Safe to call from any thread; the writer thread does the
+        actual work once the channel's queued messages are written.
+        """
+        if not self._closed:
+            self._queue.append((channel, None))
+            self._wakeup.set()
+
+    def close(self, timeout: float = 10.0):
+        """Writes out everything queued, fsyncs and closes all segments. Blocking."""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        logger.info(f"Chat recorder closed ({self.recorded} messages recorded, {self.dropped} dropped).")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": len(self._queue),
+            "open_segments": len(self._writers),
+            "segments_opened": self.segments_opened,
+            "bytes_written": self.bytes_written + sum(writer.size for writer in list(self._writers.values())),
+            "rollup_rows_written": self.rollups.rows_written if self.rollups is not None else 0
+        }
+
+def create_chat_recorder(directory: str = CHAT_STORE_DIR) -> Optional[ChatRecorder]:
+    """Returns a recorder (maintaining minute/hour rollups) if a store directory is
+    configured, otherwise None."""
+    if not directory:
+        return None
+    from rollups import RollupBuilder # rollups imports this module
+    return ChatRecorder(directory, rollups=RollupBuilder(directory))
+
+# --- Reading ---
+
+class SegmentReader:
+    """Reads a segment file through a read-only memory map.
+
+    Works on segments that are still being written: a truncated last record is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = None
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size:
+            # Just created, nothing flushed yet (writes are flushed at every fsync)
+            self.start_ms = int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)] or 0)
+            self.channel = ""
+            self._records_start = 0
+            return
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.start_ms, name_length = _HEADER.unpack_from(self._map, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {SEGMENT_VERSION} chat segment")
+        self.channel = bytes(self._map[_HEADER.size:_HEADER.size + name_length]).decode("utf-8")
+        self._records_start = _HEADER.size + name_length
+
+    @property
+    def start(self) -> float:
+        return self.start_ms / 1000.0
+
+    def __iter__(self) -> Iterator[ChatEvent]:
+        data = self._map
+        if data is None:
+            return
+        end = len(data)
+        position = self._records_start
+        strings: List[str] = []
+        while position + _RECORD.size <= end:
+            record_type, length = _RECORD.unpack_from(data, position)
+            payload_start = position + _RECORD.size
+            payload_end = payload_start + length
+            if payload_end > end:
+                break # Truncated last record (still being written, or a crash)
+            if record_type == RECORD_STRING:
+                string_id, = _STRING_ID.unpack_from(data, payload_start)
+                if string_id == len(strings):
+                    strings.append(bytes(data[payload_start + _STRING_ID.size:payload_end]).decode("utf-8"))
+            elif record_type == RECORD_MESSAGE:
+                offset_ms, author_id, sentiment, emote_count, keyword_count = _MESSAGE.unpack_from(data, payload_start)
+                ids_start = payload_start + _MESSAGE.size
+                id_count = emote_count + keyword_count
+                ids = struct.unpack_from(f"<{id_count}I", data, ids_start)
+                content_start = ids_start + 4 * id_count
+                yield ChatEvent(
+                    timestamp=(self.start_ms + offset_ms) / 1000.0,
+                    author=strings[author_id],
+                    content=bytes(data[content_start:payload_end]).decode("utf-8"),
+                    sentiment_score=None if sentiment == SENTIMENT_NONE else sentiment / SENTIMENT_SCALE,
+                    emotes=[strings[i] for i in ids[:emote_count]],
+                    keywords=[strings[i] for i in ids[emote_count:]]
+                )
+            # Unknown record types are skipped, so newer writers stay readable
+            position = payload_end
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "SegmentReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def list_segments(channel: str, directory: str = CHAT_STORE_DIR) -> List[str]:
+    """Paths of a channel's segments, oldest first."""
+    channel_dir = os.path.join(directory, _safe_channel(channel))
+    try:
+        names = [name for name in os.listdir(channel_dir) if name.endswith(SEGMENT_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    names.sort(key=lambda name: int(name[:-len(SEGMENT_SUFFIX)]))
+    return [os.path.join(channel_dir, name) for name in names]
+
+def read_channel(channel: str, start: Optional[float] = None, end: Optional[float] = None,
+                 directory: str = CHAT_STORE_DIR) -> Iterator[ChatEvent]:
+    """Yields a channel's recorded messages with start <= timestamp < end, oldest first."""
+    paths = list_segments(channel, directory)
+    for index, path in enumerate(paths):
+        # Segment start times come from the file names; skip segments entirely outside the range
+        if end is not None and int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)]) / 1000.0 >= end:
+            break
+        if start is not None and index + 1 < len(paths):
+            next_start = int(os.path.basename(paths[index + 1])[:-len(SEGMENT_SUFFIX)]) / 1000.0
+            if next_start <= start:
+                continue
+        with SegmentReader(path) as reader:
+            for event in reader:
+                if (start is None or event.timestamp >= start) and (end is None or event.timestamp < end):
+                    yield event
@@ -0,0 +1,247 @@
+import os
+import math
+import time
+from bisect import bisect_right
+from functools import reduce
+from collections import deque
+from typing import Dict, Tuple, Optional, Deque, Callable, Sequence, Any
+
+# NumPy is optional; it only speeds up merging the sketches of a window's slots
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- Configuration ---
+# HyperLogLog precision: sketches have 2^p registers (bytes) and unique-chatter estimates
+# a relative standard error of about 1.04 / sqrt(2^p), e.g. 2.3% for the default p=11
+CHATTER_HLL_PRECISION = min(16, max(4, int(os.getenv("CHATTER_HLL_PRECISION", "11"))))
+# Chatters per window whose messages are counted exactly for the messages-per-chatter
+# distribution (a uniform sample of the window's chatters once there are more)
+CHATTER_SAMPLE_SIZE = int(os.getenv("CHATTER_SAMPLE_SIZE", "1024"))
+# Estimates are recomputed at most this often; aggregate frames reuse them in between
+CHATTER_REFRESH_SECONDS = float(os.getenv("CHATTER_REFRESH_SECONDS", "1"))
+
+# Rolling windows: (name, window seconds, slot seconds). Each slot has its own sketches,
+# so a window covers its last `window` seconds plus the current, partial slot.
+CHATTER_WINDOWS: Tuple[Tuple[str, int, int], ...] = (("1m", 60, 10), ("5m", 300, 60))
+# Lower bounds of the messages-per-chatter buckets ("1", "2", "3-4", "5-9", "10-19", "20+")
+MESSAGES_PER_CHATTER_THRESHOLDS = (1, 2, 3, 5, 10, 20)
+MESSAGES_PER_CHATTER_BUCKETS = tuple(
+    str(low) if high == low + 1 else f"{low}-{high - 1}"
+    for low, high in zip(MESSAGES_PER_CHATTER_THRESHOLDS, MESSAGES_PER_CHATTER_THRESHOLDS[1:])
+) + (f"{MESSAGES_PER_CHATTER_THRESHOLDS[-1]}+",)
+
+_HASH_MASK = (1 << 64) - 1
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(66)]
+
+def chatter_hash(author: str) -> int:
+    """64-bit hash of a chatter's login name. Built on hash(), so sketches are only
+    comparable within one process."""
+    return hash(author.lower()) & _HASH_MASK
+
+def hll_relative_error(precision: int = CHATTER_HLL_PRECISION) -> float:
+    return 1.04 / math.sqrt(1 << precision)
+
+def _merge_registers(registers: Sequence[bytearray]) -> Any:
+    """Register-wise maximum, i.e. the HyperLogLog of the union."""
+    if len(registers) == 1:
+        return registers[0]
+    if np is not None:
+        return np.maximum.reduce([np.frombuffer(r, dtype=np.uint8) for r in registers])
+    return reduce(lambda merged, r: bytes(map(max, merged, r)), registers)
+
+def _estimate(registers: Any) -> float:
+    """HyperLogLog cardinality estimate, with linear counting for small cardinalities."""
+    m = len(registers)
+    if np is not None and isinstance(registers, np.ndarray):
+        inverse_sum = float(np.ldexp(1.0, -registers.astype(np.int32)).sum())
+        zeros = int(np.count_nonzero(registers == 0))
+    else:
+        inverse_sum = sum(map(_INVERSE_POWERS.__getitem__, registers))
+        zeros = registers.count(0)
+    alpha = 0.7213 / (1.0 + 1.079 / m)
+    estimate = alpha * m * m / inverse_sum
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+class HyperLogLog:
+    """HyperLogLog sketch over 64-bit hashes, in 2^precision bytes."""
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision: int = CHATTER_HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, hashed: int):
+        width = 64 - self.precision
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        index = hashed >> width
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> float:
+        return _estimate(self.registers)
+
+class _Slot:
+    """One slot of a window: a HyperLogLog of its chatters and the messages of its
+    sampled chatters."""
+    __slots__ = ('index', 'sketch', 'sample', 'messages')
+
+    def __init__(self, index: int, precision: int):
+        self.index = index
+        self.sketch = HyperLogLog(precision)
+        self.sample: Dict[int, int] = {} # Sampled chatter's hash -> messages in this slot
+        self.messages = 0
+
+class ChatterWindow:
+    """Unique chatters and messages per chatter over a rolling window, in fixed memory.
+
+    Unique chatters are the HyperLogLog estimate of the union of the window's slots.
+    The messages-per-chatter distribution comes from a distinct sample: chatters whose
+    hash has its lowest `level` bits zero, a uniform sample of 1 in 2^level chatters,
+    have their messages counted exactly. Whenever the sample grows past `sample_size`,
+    the level goes up and half of it is dropped. Until then (level 0) the sample holds
+    every chatter and both numbers are exact. A bucket holding a share p of the
+    sampled chatters has a standard error of about sqrt(p * (1 - p) / sampled chatters).
+    Slots expire whole. `window_seconds` 0 makes a session window with a single slot
+    that never expires.
+    """
+
+    def __init__(self, window_seconds: int, slot_seconds: int = 1,
+                 precision: int = CHATTER_HLL_PRECISION, sample_size: int = CHATTER_SAMPLE_SIZE):
+        self.window_seconds = window_seconds
+        self.slot_seconds = max(1, slot_seconds)
+        self.precision = precision
+        self.sample_size = max(1, sample_size)
+        # Slots older than the current one by more than this are expired
+        self._slot_span = -(-window_seconds // self.slot_seconds) if window_seconds else 0
+        self._slots: Deque[_Slot] = deque()
+        self._sample: Dict[int, int] = {} # Sampled chatter's hash -> messages in the window
+        self._level = 0
+        self._sample_mask = 0
+        self.messages = 0 # In the window
+
+    def _slot(self, now: float) -> _Slot:
+        index = int(now // self.slot_seconds) if self.window_seconds else 0
+        self._expire(index)
+        if not self._slots or self._slots[-1].index != index:
+            self._slots.append(_Slot(index, self.precision))
+        return self._slots[-1]
+
+    def _expire(self, index: int):
+        sample = self._sample
+        while self._slots and self._slots[0].index < index - self._slot_span:
+            slot = self._slots.popleft()
+            self.messages -= slot.messages
+            for hashed, count in slot.sample.items():
+                remaining = sample[hashed] - count
+                if remaining:
+                    sample[hashed] = remaining
+                else:
+                    del sample[hashed]
+        if not self._slots:
+            self._level, self._sample_mask = 0, 0
+
+    def add(self, hashed: int, now: float):
+        slot = self._slot(now)
+        slot.sketch.add(hashed)
+        slot.messages += 1
+        self.messages += 1
+        if hashed & self._sample_mask:
+            return
+        self._sample[hashed] = self._sample.get(hashed, 0) + 1
+        if self.window_seconds:
+            # The session's single slot never expires, so it need not keep its own counts
+            slot.sample[hashed] = slot.sample.get(hashed, 0) + 1
+        if len(self._sample) > self.sample_size:
+            self._raise_level()
+
+    def _raise_level(self):
+        while len(self._sample) > self.sample_size:
+            self._level += 1
+            mask = self._sample_mask = (1 << self._level) - 1
+            self._sample = {hashed: count for hashed, count in self._sample.items() if not hashed & mask}
+            for slot in self._slots:
+                slot.sample = {hashed: count for hashed, count in slot.sample.items() if not hashed & mask}
+
+    def estimate(self, now: float) -> Tuple[int, Dict[str, int]]:
+        """(unique chatters, chatters per messages-per-chatter bucket) in the window."""
+        self._expire(int(now // self.slot_seconds) if self.window_seconds else 0)
+        if not self._slots:
+            return 0, {label: 0 for label in MESSAGES_PER_CHATTER_BUCKETS}
+        counts = [0] * len(MESSAGES_PER_CHATTER_THRESHOLDS)
+        for messages in self._sample.values():
+            counts[bisect_right(MESSAGES_PER_CHATTER_THRESHOLDS, messages) - 1] += 1
+        if self._level == 0:
+            # Every chatter is in the sample; both numbers are exact
+            return len(self._sample), dict(zip(MESSAGES_PER_CHATTER_BUCKETS, counts))
+        unique = round(_estimate(_merge_registers([slot.sketch.registers for slot in self._slots])))
+        # Bucket shares of the sample, scaled to the unique estimate
+        sampled = len(self._sample)
+        return unique, {label: round(unique * count / sampled) for label, count in zip(MESSAGES_PER_CHATTER_BUCKETS, counts)}
+
+    @property
+    def sampled_chatters(self) -> int:
+        return len(self._sample)
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the sketches and samples."""
+        entries = len(self._sample) + sum(len(slot.sample) for slot in self._slots)
+        return sum(len(slot.sketch.registers) for slot in self._slots) + 100 * entries
+
+class ChatterStats:
+    """Unique-chatter estimates and messages-per-chatter distributions of one channel,
+    over the CHATTER_WINDOWS and the whole session."""
+
+    def __init__(self, windows: Tuple[Tuple[str, int, int], ...] = CHATTER_WINDOWS,
+                 refresh_seconds: float = CHATTER_REFRESH_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.windows: Dict[str, ChatterWindow] = {
+            name: ChatterWindow(window_seconds, slot_seconds) for name, window_seconds, slot_seconds in windows
+        }
+        self.windows["session"] = ChatterWindow(0)
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_time = 0.0
+        self._changed = True
+        # Slots expire without new messages too, so even a quiet channel's estimates are
+        # recomputed once per (shortest) slot
+        self._max_age = min((slot_seconds for _, _, slot_seconds in windows), default=60)
+
+    def add(self, author: str):
+        hashed = chatter_hash(author)
+        now = self._clock()
+        for window in self.windows.values():
+            window.add(hashed, now)
+        self._changed = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The `chatters` part of an aggregate frame; recomputed at most every `refresh_seconds`."""
+        now = self._clock()
+        age = now - self._snapshot_time
+        if self._snapshot is None or age >= self._max_age or (self._changed and age >= self.refresh_seconds):
+            snapshot: Dict[str, Any] = {"relative_error": round(hll_relative_error(), 4)}
+            for name, window in self.windows.items():
+                unique, distribution = window.estimate(now)
+                snapshot[name] = {
+                    "unique": unique,
+                    "messages": window.messages,
+                    "messages_per_chatter": distribution,
+                    "sampled_chatters": window.sampled_chatters
+                }
+            self._snapshot, self._snapshot_time, self._changed = snapshot, now, False
+        return self._snapshot
+
+    def unique(self) -> Dict[str, int]:
+        """Unique chatter estimates by window name."""
+        return {name: window_snapshot["unique"] for name, window_snapshot in self.snapshot().items()
+                if isinstance(window_snapshot, dict)}
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.snapshot()
+        return {
+            **snapshot,
+            "memory_bytes": sum(window.memory_bytes() for window in self.windows.values())
+        }
@@ -0,0 +1,414 @@
+import os
+import json
+import struct
+import asyncio
+import logging
+from typing import Dict, Set, Optional, Tuple, Callable, Awaitable, Any
+
+# Broker election uses flock; the broker itself needs Unix sockets
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from websocket_manager import ConnectionManager, encode_message
+from alerts import AlertRuleSet
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Set to run several uvicorn workers (`--workers N`): the workers then elect one of
+# themselves to host a pub/sub broker on this Unix socket, each channel is ingested
+# by exactly one worker and its frames are relayed to every worker with clients for it.
+WORKER_BROKER_SOCKET = os.getenv("WORKER_BROKER_SOCKET", "")
+# A worker whose socket buffer holds more than this many bytes misses relayed frames
+BROKER_MAX_BUFFER_BYTES = int(os.getenv("BROKER_MAX_BUFFER_BYTES", str(8 * 1024 * 1024)))
+BROKER_RECONNECT_DELAY = float(os.getenv("BROKER_RECONNECT_DELAY", "0.5"))
+
+# --- Wire Protocol ---
+# Frames: payload length (u32), op (u8), payload. Most payloads start with the channel
+# name (u16 length + UTF-8); PUB/MSG add the frame type (u8 length + ASCII) and the
+# JSON-encoded frame.
+#   worker -> broker: SUB, UNSUB (interest in a channel), PUB (frame for other workers)
+#   broker -> worker: MSG (relayed frame), OWN (start ingesting), DISOWN (stop ingesting)
+#   both ways: RULE (alert rule added or replaced: rule id, then the rule as JSON),
+#              UNRULE (alert rule removed: rule id)
+# The broker is the only authority on ownership: the first worker subscribing to a
+# channel owns it; when the owner disconnects, another subscribed worker gets OWN;
+# when no worker is subscribed any more, the owner gets DISOWN.
+# Alert rules are changed over HTTP on any worker, but must reach the one ingesting
+# the channel: the broker relays RULE/UNRULE to all other workers and keeps the
+# current rules for workers that connect later. A connecting worker sends its own
+# rules (e.g. from ALERT_RULES_FILE, or kept while a new broker was elected).
+_FRAME = struct.Struct("<IB")
+_U16 = struct.Struct("<H")
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+OP_SUB = 1
+OP_UNSUB = 2
+OP_PUB = 3
+OP_MSG = 4
+OP_OWN = 5
+OP_DISOWN = 6
+OP_RULE = 7
+OP_UNRULE = 8
+# Ops whose payload carries a frame type and data after the channel name (or rule id)
+_DATA_OPS = (OP_PUB, OP_MSG, OP_RULE)
+
+def _pack(op: int, channel: str, frame_type: str = "", data: bytes = b"") -> bytes:
+    name = channel.encode("utf-8")
+    payload = _U16.pack(len(name)) + name
+    if op in _DATA_OPS:
+        kind = frame_type.encode("ascii")
+        payload += bytes((len(kind),)) + kind + data
+    return _FRAME.pack(len(payload), op) + payload
+
+def _unpack(op: int, payload: bytes) -> Tuple[str, str, bytes]:
+    """Returns (channel, frame_type, data)."""
+    name_length, = _U16.unpack_from(payload, 0)
+    position = _U16.size + name_length
+    channel = payload[_U16.size:position].decode("utf-8")
+    if op not in _DATA_OPS:
+        return channel, "", b""
+    kind_length = payload[position]
+    frame_type = payload[position + 1:position + 1 + kind_length].decode("ascii")
+    return channel, frame_type, payload[position + 1 + kind_length:]
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    length, op = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Broker frame of {length} bytes exceeds the limit")
+    return op, await reader.readexactly(length)
+
+# --- Broker ---
+
+class _Peer:
+    __slots__ = ('writer', 'name', 'dropped')
+
+    def __init__(self, writer: asyncio.StreamWriter, name: str):
+        self.writer = writer
+        self.name = name
+        self.dropped = 0
+
+    def send(self, frame: bytes) -> bool:
+        """Writes without waiting; a worker that stopped reading loses frames instead
+        of stalling the broker."""
+        transport = self.writer.transport
+        if transport.is_closing():
+            return False
+        if transport.get_write_buffer_size() > BROKER_MAX_BUFFER_BYTES:
+            self.dropped += 1
+            return False
+        self.writer.write(frame)
+        return True
+
+class Broker:
+    """Pub/sub and channel ownership for the workers of one host, on a Unix socket.
+    Runs on the event loop of the worker that won the election."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.peers: Set[_Peer] = set()
+        self.subscribers: Dict[str, Set[_Peer]] = {}
+        self.owners: Dict[str, _Peer] = {}
+        self.alert_rules: Dict[str, bytes] = {} # Rule id -> rule JSON, as last relayed
+        self.relayed = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path) # Left behind by a broker that died; we hold the lock now
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"Worker broker listening on {self.path} (pid {os.getpid()})")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for peer in list(self.peers):
+            peer.writer.close()
+
+    def _assign_owner(self, channel: str):
+        subscribers = self.subscribers.get(channel)
+        if channel in self.owners or not subscribers:
+            return
+        owner = next(iter(subscribers))
+        self.owners[channel] = owner
+        owner.send(_pack(OP_OWN, channel))
+        logger.info(f"Broker: {owner.name} owns #{channel}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = _Peer(writer, f"worker@{id(writer):x}")
+        self.peers.add(peer)
+        for rule_id, rule in self.alert_rules.items():
+            peer.send(_pack(OP_RULE, rule_id, "", rule))
+        try:
+            while True:
+                op, payload = await _read_frame(reader)
+                channel, frame_type, data = _unpack(op, payload)
+                if op == OP_PUB:
+                    frame = None
+                    for subscriber in self.subscribers.get(channel, ()):
+                        if subscriber is not peer:
+                            frame = frame or _pack(OP_MSG, channel, frame_type, data)
+                            subscriber.send(frame)
+                    self.relayed += 1
+                elif op == OP_SUB:
+                    self.subscribers.setdefault(channel, set()).add(peer)
+                    self._assign_owner(channel)
+                elif op == OP_UNSUB:
+                    self._unsubscribe(peer, channel)
+                elif op in (OP_RULE, OP_UNRULE):
+                    if op == OP_RULE:
+                        self.alert_rules[channel] = data
+                    else:
+                        self.alert_rules.pop(channel, None)
+                    for other in self.peers:
+                        if other is not peer:
+                            other.send(_pack(op, channel, "", data))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # Worker exited or closed its connection
+        except Exception as e:
+            logger.error(f"Broker dropping {peer.name}: {e}")
+        finally:
+            self.peers.discard(peer)
+            for channel in [channel for channel, subscribers in self.subscribers.items() if peer in subscribers]:
+                self._unsubscribe(peer, channel)
+            for channel in [channel for channel, owner in self.owners.items() if owner is peer]:
+                del self.owners[channel]
+                self._assign_owner(channel) # Hand over to another worker with clients
+            writer.close()
+
+    def _unsubscribe(self, peer: _Peer, channel: str):
+        subscribers = self.subscribers.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(peer)
+        if subscribers:
+            return
+        del self.subscribers[channel]
+        owner = self.owners.pop(channel, None)
+        if owner is not None:
+            owner.send(_pack(OP_DISOWN, channel))
+            logger.info(f"Broker: no clients left for #{channel}, {owner.name} stops ingesting it")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.peers),
+            "channels": len(self.subscribers),
+            "owned_channels": len(self.owners),
+            "alert_rules": len(self.alert_rules),
+            "relayed": self.relayed,
+            "dropped": sum(peer.dropped for peer in self.peers)
+        }
+
+# --- Worker Side ---
+
+class ClusterPublisher:
+    """Stands in for the ConnectionManager of an owned channel's pipeline: frames go to
+    this worker's clients directly and to the other workers through the broker."""
+
+    def __init__(self, client: "ClusterClient", manager: ConnectionManager):
+        self.client = client
+        self.manager = manager
+
+    async def broadcast_to_streamer(self, streamer_name: str, message: dict):
+        text = encode_message(message) # Encoded once, for local JSON clients and the broker
+        self.client.publish(streamer_name.lower(), message.get("type", ""), text)
+        await self.manager.broadcast_to_streamer(streamer_name, message, encoded=text)
+
+class ClusterClient:
+    """One worker's link to the broker.
+
+    Subscribes to the channels this worker has WebSocket clients for, starts and stops
+    ingestion when the broker hands it ownership, and delivers frames relayed from
+    other workers to its local clients. Reconnects (and re-runs the broker election)
+    if the broker goes away; channels owned until then are stopped, since the broker
+    that replaces it reassigns them. Keeps `rules` in step with the other workers'.
+    """
+
+    def __init__(self, path: str, manager: ConnectionManager,
+                 start_channel: Callable[[str, ClusterPublisher], Awaitable[Any]],
+                 stop_channel: Callable[[str], Awaitable[Any]], rules: Optional[AlertRuleSet] = None):
+        if fcntl is None:
+            raise RuntimeError("WORKER_BROKER_SOCKET needs a Unix system")
+        self.path = path
+        self.manager = manager
+        self.publisher = ClusterPublisher(self, manager)
+        self._start_channel = start_channel
+        self._stop_channel = stop_channel
+        self.rules = rules
+        if rules is not None:
+            rules.id_prefix = f"{os.getpid()}-" # Rules added on different workers get distinct ids
+        self.subscribed: Set[str] = set()
+        self.owned: Set[str] = set()
+        self.broker: Optional[Broker] = None
+        self._lock_file = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+        self.published = 0
+        self.received = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.transport.is_closing()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="ClusterClient")
+        # Wait briefly so the first WebSocket clients find the broker up
+        try:
+            await asyncio.wait_for(self._connected.wait(), 5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Not connected to the worker broker at {self.path} yet; retrying in the background")
+
+    async def _try_host_broker(self):
+        """Hosts the broker if no other worker does (held flock on `<path>.lock`)."""
+        if self.broker is not None:
+            return
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return # Another worker hosts it
+        broker = Broker(self.path)
+        try:
+            await broker.start()
+        except OSError as e:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            logger.error(f"Failed to start the worker broker on {self.path}: {e}")
+            return
+        self.broker = broker
+
+    async def _run(self):
+        while True:
+            try:
+                await self._try_host_broker()
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except (OSError, ConnectionError) as e:
+                logger.debug(f"Worker broker not reachable at {self.path}: {e}")
+                await asyncio.sleep(BROKER_RECONNECT_DELAY)
+                continue
+            self._writer = writer
+            for channel in self.subscribed:
+                writer.write(_pack(OP_SUB, channel))
+            if self.rules is not None:
+                for rule in self.rules.to_list():
+                    writer.write(self._rule_frame(rule))
+            self._connected.set()
+            logger.info(f"Worker {os.getpid()} connected to the broker at {self.path}"
+                        f"{' (hosting it)' if self.broker else ''}")
+            try:
+                while True:
+                    op, payload = await _read_frame(reader)
+                    await self._on_frame(op, payload)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning(f"Worker {os.getpid()} lost the broker connection")
+            except asyncio.CancelledError:
+                writer.close()
+                raise
+            except Exception as e:
+                logger.error(f"Worker broker connection failed: {e}", exc_info=True)
+            self._writer = None
+            self._connected.clear()
+            writer.close()
+            # The next broker reassigns ownership; stop ingesting so no channel runs twice
+            for channel in list(self.owned):
+                self.owned.discard(channel)
+                await self._stop_channel(channel)
+            await asyncio.sleep(BROKER_RECONNECT_DELAY)
+
+    async def _on_frame(self, op: int, payload: bytes):
+        channel, frame_type, data = _unpack(op, payload)
+        if op == OP_MSG:
+            self.received += 1
+            await self.manager.broadcast_encoded(channel, frame_type, data.decode("utf-8"))
+        elif op == OP_OWN:
+            if channel not in self.owned:
+                self.owned.add(channel)
+                logger.info(f"Worker {os.getpid()} now ingests #{channel}")
+                await self._start_channel(channel, self.publisher)
+        elif op == OP_DISOWN:
+            if channel in self.owned:
+                self.owned.discard(channel)
+                logger.info(f"Worker {os.getpid()} stops ingesting #{channel}")
+                await self._stop_channel(channel)
+        elif op == OP_RULE and self.rules is not None:
+            try:
+                self.rules.add(json.loads(data))
+            except ValueError as e:
+                logger.error(f"Ignoring relayed alert rule {channel}: {e}")
+        elif op == OP_UNRULE and self.rules is not None:
+            self.rules.remove(channel)
+
+    def _send(self, frame: bytes):
+        if self.connected:
+            self._writer.write(frame)
+
+    def subscribe(self, channel: str):
+        """Registers interest in a channel (this worker has clients for it)."""
+        if channel not in self.subscribed:
+            self.subscribed.add(channel)
+            self._send(_pack(OP_SUB, channel))
+
+    def unsubscribe(self, channel: str):
+        if channel in self.subscribed:
+            self.subscribed.discard(channel)
+            self._send(_pack(OP_UNSUB, channel))
+
+    def publish(self, channel: str, frame_type: str, text: str):
+        """Sends an encoded frame of an owned channel to the other workers."""
+        if self.connected:
+            self._writer.write(_pack(OP_PUB, channel, frame_type, text.encode("utf-8")))
+            self.published += 1
+
+    @staticmethod
+    def _rule_frame(rule: Dict[str, Any]) -> bytes:
+        return _pack(OP_RULE, rule["id"], "", json.dumps(rule).encode("utf-8"))
+
+    def publish_rule(self, rule: Dict[str, Any]):
+        """Relays an alert rule added or replaced on this worker to the other workers."""
+        self._send(self._rule_frame(rule))
+
+    def publish_rule_removal(self, rule_id: str):
+        self._send(_pack(OP_UNRULE, rule_id))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self.broker is not None:
+            await self.broker.close()
+            self.broker = None
+        if self._lock_file is not None:
+            self._lock_file.close() # Releases the flock, another worker takes over
+            self._lock_file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "socket": self.path,
+            "connected": self.connected,
+            "hosting_broker": self.broker is not None,
+            "broker": self.broker.stats() if self.broker is not None else None,
+            "subscribed": sorted(self.subscribed),
+            "owned": sorted(self.owned),
+            "published": self.published,
+            "received": self.received
+        }
+
+def create_cluster_client(manager: ConnectionManager,
+                          start_channel: Callable[[str, ClusterPublisher], Awaitable[Any]],
+                          stop_channel: Callable[[str], Awaitable[Any]],
+                          rules: Optional[AlertRuleSet] = None,
+                          path: str = WORKER_BROKER_SOCKET) -> Optional[ClusterClient]:
+    """Returns a ClusterClient if WORKER_BROKER_SOCKET is set (multi-worker mode), otherwise None."""
+    if not path:
+        return None
+    return ClusterClient(path, manager, start_channel, stop_channel, rules)
@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Set, List, Optional, FrozenSet, Callable, Any
+
+from nlp_executor import NLPResult
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Near-duplicate detection groups repeated messages (copypasta, spam waves) into
+# clusters that share one sentiment/keyword analysis
+COPYPASTA_ENABLED = os.getenv("COPYPASTA_ENABLED", "1").lower() not in ("0", "false", "no")
+# A cluster is forgotten this many seconds after its last message
+COPYPASTA_WINDOW_SECONDS = float(os.getenv("COPYPASTA_WINDOW_SECONDS", "60"))
+# Minimum Jaccard similarity of word (and word pair) sets for a message to join a cluster
+COPYPASTA_SIMILARITY = float(os.getenv("COPYPASTA_SIMILARITY", "0.6"))
+# Messages with fewer distinct words only join clusters of the exact same (normalized) text
+COPYPASTA_MIN_WORDS = int(os.getenv("COPYPASTA_MIN_WORDS", "3"))
+# Clusters remembered per channel; the least recently seen ones go first
+COPYPASTA_MAX_CLUSTERS = int(os.getenv("COPYPASTA_MAX_CLUSTERS", "5000"))
+# Clusters with at least this many messages count as a copypasta wave in aggregates
+COPYPASTA_MIN_WAVE_SIZE = int(os.getenv("COPYPASTA_MIN_WAVE_SIZE", "3"))
+
+# Candidates are found through a bottom-k MinHash sketch of each message's word
+# triples: a cluster is indexed under the SKETCH_SIZE smallest triple hashes of its
+# first message, and a message whose triples overlap with it by a share J finds it
+# with probability of at least 1 - (1 - J)^SKETCH_SIZE. Triples rather than single
+# words keep common words from piling thousands of clusters onto one key.
+# Candidates are then checked against the exact similarity.
+SKETCH_SIZE = 4
+WAVE_LABEL_LENGTH = 80
+
+# Characters chatters add to get around Twitch's duplicate message filter
+_INVISIBLE = dict.fromkeys(map(ord, "\U000e0000\u200b\u200c\u200d\u2060\ufeff"), None)
+_PUNCTUATION = dict.fromkeys(map(ord, ".,!?:;\"'()[]{}…"), None)
+
+def normalize_message(text: str) -> str:
+    """Case-folded text without invisible filler characters and repeated whitespace."""
+    if text.isascii():
+        return " ".join(text.lower().split())
+    return " ".join(text.translate(_INVISIBLE).casefold().split())
+
+def message_words(normalized: str) -> List[str]:
+    """Words of a normalized message, punctuation removed."""
+    return normalized.translate(_PUNCTUATION).split()
+
+def message_features(words: List[str]) -> FrozenSet[str]:
+    """The words and adjacent word pairs similarity is measured on."""
+    features = set(words)
+    features.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return frozenset(features)
+
+def message_sketch(words: List[str]) -> List[int]:
+    """Smallest hashes of the message's word triples. Built on hash(), so only
+    comparable within one process."""
+    return sorted({hash(triple) for triple in zip(words, words[1:], words[2:])})[:SKETCH_SIZE]
+
+class CopypastaCluster:
+    """Messages that are (nearly) the same text. The first message's analysis result
+    is shared with every later member."""
+    __slots__ = ('id', 'text', 'key', 'words', '_features', 'sketch', 'size', 'first_seen', 'last_seen',
+                 'result', 'pending')
+
+    def __init__(self, cluster_id: int, text: str, key: str, words: List[str], sketch: List[int], now: float):
+        self.id = cluster_id
+        self.text = text # First member, as sent
+        self.key = key # Its normalized text
+        self.words = words
+        self._features: Optional[FrozenSet[str]] = None
+        self.sketch = sketch
+        self.size = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.result: Optional[NLPResult] = None
+        # Set while one member's analysis is running; others wait for it instead of queueing their own
+        self.pending: Optional[asyncio.Future] = None
+
+    @property
+    def features(self) -> FrozenSet[str]:
+        # Built when a later message is first compared with this one; most never are
+        if self._features is None:
+            self._features = message_features(self.words)
+        return self._features
+
+    @property
+    def label(self) -> str:
+        return self.text if len(self.text) <= WAVE_LABEL_LENGTH else self.text[:WAVE_LABEL_LENGTH - 1] + "…"
+
+    @property
+    def wave_members(self) -> int:
+        """Messages the latest member adds to this cluster's wave count: none below the
+        wave size, all members so far when it is reached, then one per message."""
+        if self.size < COPYPASTA_MIN_WAVE_SIZE:
+            return 0
+        return self.size if self.size == COPYPASTA_MIN_WAVE_SIZE else 1
+
+    async def shared_result(self, score_table_version: Optional[str]) -> Optional[NLPResult]:
+        """The cluster's analysis, waiting for it if another member's is running. None if
+        there is none yet or it was computed with another emote score table."""
+        if self.pending is not None:
+            await asyncio.shield(self.pending)
+        if self.result is None or self.result.score_table_version != score_table_version:
+            return None
+        return self.result
+
+    def start_analysis(self) -> bool:
+        """Claims the cluster's analysis for the calling member; False if another member
+        already produced or is producing it."""
+        if self.pending is not None or self.result is not None:
+            return False
+        self.pending = asyncio.get_running_loop().create_future()
+        return True
+
+    def finish_analysis(self, result: Optional[NLPResult]):
+        if result is not None:
+            self.result = result
+        pending, self.pending = self.pending, None
+        if pending is not None and not pending.done():
+            pending.set_result(None)
+
+class CopypastaDetector:
+    """Streaming near-duplicate detection for one channel's chat.
+
+    Every message joins the most similar live cluster (Jaccard similarity of its word
+    and word pair sets at least `similarity`) or starts a new one. Clusters live for
+    `window` seconds after their last message, in least-recently-seen order, so
+    expiry and the `max_clusters` bound only ever look at the oldest ones.
+    """
+
+    def __init__(self, window: float = COPYPASTA_WINDOW_SECONDS, similarity: float = COPYPASTA_SIMILARITY,
+                 min_words: int = COPYPASTA_MIN_WORDS, max_clusters: int = COPYPASTA_MAX_CLUSTERS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.similarity = similarity
+        self.min_words = min_words
+        self.max_clusters = max(1, max_clusters)
+        self._clock = clock
+        self._clusters: "OrderedDict[int, CopypastaCluster]" = OrderedDict()
+        self._by_text: Dict[str, CopypastaCluster] = {}
+        self._by_sketch: Dict[int, Set[CopypastaCluster]] = {}
+        self._next_id = 1
+        # Counters
+        self.messages = 0
+        self.duplicates = 0
+        self.shared_analyses = 0
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def assign(self, text: str) -> CopypastaCluster:
+        """Adds a message to its cluster (a new one if nothing similar is live) and returns it."""
+        now = self._clock()
+        self._expire(now)
+        self.messages += 1
+        normalized = normalize_message(text)
+        cluster = self._by_text.get(normalized)
+        words: List[str] = []
+        sketch: List[int] = []
+        if cluster is None:
+            words = message_words(normalized)
+            if len(set(words)) >= self.min_words:
+                sketch = message_sketch(words)
+                cluster = self._most_similar(words, sketch)
+        if cluster is None:
+            cluster = CopypastaCluster(self._next_id, text, normalized, words, sketch, now)
+            self._next_id += 1
+            self._clusters[cluster.id] = cluster
+            self._by_text[normalized] = cluster
+            for value in sketch:
+                self._by_sketch.setdefault(value, set()).add(cluster)
+            if len(self._clusters) > self.max_clusters:
+                self._remove(next(iter(self._clusters.values())))
+        else:
+            self.duplicates += 1
+            self._clusters.move_to_end(cluster.id)
+        cluster.size += 1
+        cluster.last_seen = now
+        return cluster
+
+    def _most_similar(self, words: List[str], sketch: List[int]) -> Optional[CopypastaCluster]:
+        candidates: Set[CopypastaCluster] = set()
+        for value in sketch:
+            members = self._by_sketch.get(value)
+            if members:
+                candidates.update(members)
+        if not candidates:
+            return None
+        features = message_features(words)
+        best, best_similarity = None, self.similarity
+        for candidate in candidates:
+            shared = len(features & candidate.features)
+            similarity = shared / (len(features) + len(candidate.features) - shared)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._clusters:
+            oldest = next(iter(self._clusters.values()))
+            if oldest.last_seen > cutoff:
+                break
+            self._remove(oldest)
+
+    def _remove(self, cluster: CopypastaCluster):
+        del self._clusters[cluster.id]
+        if self._by_text.get(cluster.key) is cluster:
+            del self._by_text[cluster.key]
+        for value in cluster.sketch:
+            members = self._by_sketch.get(value)
+            if members is not None:
+                members.discard(cluster)
+                if not members:
+                    del self._by_sketch[value]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clusters": len(self._clusters),
+            "messages": self.messages,
+            "duplicates": self.duplicates,
+            "shared_analyses": self.shared_analyses
+        }
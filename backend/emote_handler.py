@@ -1,7 +1,15 @@
+import os
+import re
+import json
+import time
 import logging
 import httpx
 import asyncio
-from typing import Set, Dict, Optional, Tuple, List, TypedDict
+import itertools
+from types import MappingProxyType
+from typing import Set, Dict, Optional, Tuple, List, TypedDict, NamedTuple, Mapping, Any, Callable, Awaitable, FrozenSet
+
+from http_client import coalesced_get
 
 logger = logging.getLogger(__name__)
 
@@ -10,33 +18,45 @@ class EmoteData(TypedDict):
     name: str
     url: str # Typically the smallest size URL (1x)
     sentiment_score: Optional[float]  # Added sentiment score field
-    # Optionally add source: Literal['ffz', '7tv', 'twitch']
+    source: str # One of EMOTE_SOURCES
 
 # Store emote data as {name: url} dictionaries for easier lookup
 EmoteSet = Dict[str, str] 
 
+# Source tags, lowest precedence first (channel emotes override global ones)
+EMOTE_SOURCES = ('7tv_global', 'ffz', '7tv')
+
 # --- Custom Emote Sentiment Scores ---
-# This is populated by nlp_processor.py, we declare it here for reference
-# The actual data is loaded in nlp_processor and imported here
+# The versioned score table is loaded (lazily) and reloaded in nlp_processor
 try:
-    from nlp_processor import emote_sentiment_scores
-    logger.info(f"Imported {len(emote_sentiment_scores)} emote sentiment scores from nlp_processor")
+    from nlp_processor import EmoteScoreTable, get_emote_score_table
 except ImportError:
-    logger.error("Failed to import emote_sentiment_scores from nlp_processor")
-    emote_sentiment_scores = {}
+    logger.error("Failed to import the emote score table from nlp_processor")
+    EmoteScoreTable = Any
+    get_emote_score_table = lambda: None
 
 # --- API Endpoints --- (These might change, verify if needed)
-FFZ_ROOM_API = "https://api.frankerfacez.com/v1/room/{channel_name}"
-SEVENTV_USER_API = "https://7tv.io/v3/users/twitch/{channel_id}" # Requires Twitch User ID
-SEVENTV_GLOBAL_API = "https://7tv.io/v3/emote-sets/global"
+# Base URLs can be overridden, e.g. to point at a local stub server
+FFZ_API_BASE = os.getenv("FFZ_API_BASE", "https://api.frankerfacez.com")
+SEVENTV_API_BASE = os.getenv("SEVENTV_API_BASE", "https://7tv.io")
+TWITCH_API_BASE = os.getenv("TWITCH_API_BASE", "https://api.twitch.tv")
+FFZ_ROOM_API = FFZ_API_BASE + "/v1/room/{channel_name}"
+SEVENTV_USER_API = SEVENTV_API_BASE + "/v3/users/twitch/{channel_id}" # Requires Twitch User ID
+SEVENTV_GLOBAL_API = SEVENTV_API_BASE + "/v3/emote-sets/global"
 
 # --- Twitch API Helper (Placeholder) --- 
 # We need the Twitch User ID for the 7TV API. This requires a Twitch API call.
 # We'll use a placeholder function for now. Needs proper implementation later.
 # Requires adding 'twitchAPI' library or similar and handling authentication.
-TWITCH_API_USERS = "https://api.twitch.tv/helix/users"
+TWITCH_API_USERS = TWITCH_API_BASE + "/helix/users"
+# Memoized login -> user ID map (user IDs never change)
+twitch_user_ids: Dict[str, str] = {}
+
 async def get_twitch_user_id(channel_name: str, client_id: Optional[str], token: Optional[str]) -> Optional[str]:
     # Uses httpx to call Twitch API. Requires client_id and token.
+    login = channel_name.lower()
+    if login in twitch_user_ids:
+        return twitch_user_ids[login]
     if not client_id or not token:
         logger.error("Twitch Client ID or Token missing for User ID lookup.")
         return None
@@ -44,19 +64,19 @@ async def get_twitch_user_id(channel_name: str, client_id: Optional[str], token:
         "Client-ID": client_id,
         "Authorization": f"Bearer {token.replace('oauth:', '')}"
     }
-    params = {"login": channel_name.lower()}
+    params = {"login": login}
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(TWITCH_API_USERS, headers=headers, params=params)
-            response.raise_for_status() # Raise exception for bad status codes
-            data = response.json()
-            if data.get("data") and len(data["data"]) > 0:
-                user_id = data["data"][0]["id"]
-                logger.info(f"Got Twitch User ID for {channel_name}: {user_id}")
-                return user_id
-            else:
-                logger.warning(f"Could not find Twitch User ID for channel: {channel_name}")
-                return None
+        response = await coalesced_get(TWITCH_API_USERS, params=params, headers=headers)
+        response.raise_for_status() # Raise exception for bad status codes
+        data = response.json()
+        if data.get("data") and len(data["data"]) > 0:
+            user_id = data["data"][0]["id"]
+            twitch_user_ids[login] = user_id
+            logger.info(f"Got Twitch User ID for {channel_name}: {user_id}")
+            return user_id
+        else:
+            logger.warning(f"Could not find Twitch User ID for channel: {channel_name}")
+            return None
     except httpx.RequestError as e:
         logger.error(f"HTTP error getting Twitch User ID for {channel_name}: {e}")
         return None
@@ -66,42 +86,43 @@ async def get_twitch_user_id(channel_name: str, client_id: Optional[str], token:
 
 # --- Emote Fetching Functions --- 
 
-async def get_ffz_emotes(channel_name: str) -> EmoteSet:
+async def get_ffz_emotes(channel_name: str) -> Optional[EmoteSet]:
     """Fetches FrankerFaceZ channel emotes.
-    Returns: A dictionary mapping emote name to its 1x URL.
+    Returns: A dictionary mapping emote name to its 1x URL (empty if the channel has
+    none), or None if the request failed.
     """
     emotes: EmoteSet = {}
     url = FFZ_ROOM_API.format(channel_name=channel_name.lower())
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            if response.status_code == 404:
-                logger.info(f"No FFZ room data found for channel: {channel_name}")
-                return emotes # Channel might not use FFZ
-            response.raise_for_status()
-            data = response.json()
-
-            # FFZ data structure: room -> sets -> set_id -> emotes
-            if "sets" in data:
-                for set_id, emote_set in data["sets"].items():
-                    if "emoticons" in emote_set:
-                        for emote in emote_set["emoticons"]:
-                            # Get the smallest URL (usually "1")
-                            emote_url = emote.get('urls', {}).get('1')
-                            if emote_url:
-                                # FFZ URLs might not include protocol, add https:
-                                emotes[emote["name"]] = emote_url if emote_url.startswith('http') else f"https:{emote_url}"
-            logger.info(f"Fetched {len(emotes)} FFZ emotes for channel: {channel_name}")
-            return emotes
+        response = await coalesced_get(url)
+        if response.status_code == 404:
+            logger.info(f"No FFZ room data found for channel: {channel_name}")
+            return emotes # Channel might not use FFZ
+        response.raise_for_status()
+        data = response.json()
+
+        # FFZ data structure: room -> sets -> set_id -> emotes
+        if "sets" in data:
+            for set_id, emote_set in data["sets"].items():
+                if "emoticons" in emote_set:
+                    for emote in emote_set["emoticons"]:
+                        # Get the smallest URL (usually "1")
+                        emote_url = emote.get('urls', {}).get('1')
+                        if emote_url:
+                            # FFZ URLs might not include protocol, add https:
+                            emotes[emote["name"]] = emote_url if emote_url.startswith('http') else f"https:{emote_url}"
+        logger.info(f"Fetched {len(emotes)} FFZ emotes for channel: {channel_name}")
+        return emotes
     except httpx.RequestError as e:
         logger.error(f"HTTP error fetching FFZ emotes for {channel_name}: {e}")
     except Exception as e:
         logger.error(f"Error processing FFZ data for {channel_name}: {e}", exc_info=True)
-    return emotes # Return empty set on error
+    return None
 
-async def get_7tv_emotes(channel_id: str) -> EmoteSet:
+async def get_7tv_emotes(channel_id: str) -> Optional[EmoteSet]:
     """Fetches 7TV channel emotes using Twitch User ID.
-    Returns: A dictionary mapping emote name to its 1x WebP URL.
+    Returns: A dictionary mapping emote name to its 1x WebP URL (empty if the channel
+    has none), or None if the request failed.
     """
     emotes: EmoteSet = {}
     if not channel_id:
@@ -109,96 +130,166 @@ async def get_7tv_emotes(channel_id: str) -> EmoteSet:
 
     url = SEVENTV_USER_API.format(channel_id=channel_id)
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            if response.status_code == 404:
-                 logger.info(f"No 7TV user data found for channel ID: {channel_id}")
-                 return emotes # Channel might not use 7TV
-            response.raise_for_status()
-            data = response.json()
-
-            # 7TV data structure can vary, often has an emote_set -> emotes list
-            emote_list = []
-            emote_set = data.get("emote_set")
-            if emote_set and "emotes" in emote_set:
-                emote_list = emote_set["emotes"]
-            elif "emotes" in data: # Sometimes emotes might be directly in the user data
-                 emote_list = data["emotes"]
+        response = await coalesced_get(url)
+        if response.status_code == 404:
+             logger.info(f"No 7TV user data found for channel ID: {channel_id}")
+             return emotes # Channel might not use 7TV
+        response.raise_for_status()
+        data = response.json()
+
+        # 7TV data structure can vary, often has an emote_set -> emotes list
+        emote_list = []
+        emote_set = data.get("emote_set")
+        if emote_set and "emotes" in emote_set:
+            emote_list = emote_set["emotes"]
+        elif "emotes" in data: # Sometimes emotes might be directly in the user data
+             emote_list = data["emotes"]
             
-            for emote in emote_list:
-                emote_name = emote.get("name")
-                # Get the smallest WebP URL (1x)
-                emote_url = None
-                files = emote.get("data", {}).get("host", {}).get("files", [])
-                for f in files:
-                    if f.get("name") == "1x.webp":
-                        emote_url = f"{emote['data']['host']['url']}/{f['name']}"
-                        break 
-                if emote_name and emote_url:
-                    emotes[emote_name] = emote_url
+        for emote in emote_list:
+            emote_name = emote.get("name")
+            # Get the smallest WebP URL (1x)
+            emote_url = None
+            files = emote.get("data", {}).get("host", {}).get("files", [])
+            for f in files:
+                if f.get("name") == "1x.webp":
+                    emote_url = f"{emote['data']['host']['url']}/{f['name']}"
+                    break 
+            if emote_name and emote_url:
+                emotes[emote_name] = emote_url
 
-            logger.info(f"Fetched {len(emotes)} 7TV emotes for channel ID: {channel_id}")
-            return emotes
+        logger.info(f"Fetched {len(emotes)} 7TV emotes for channel ID: {channel_id}")
+        return emotes
     except httpx.RequestError as e:
         logger.error(f"HTTP error fetching 7TV emotes for {channel_id}: {e}")
     except Exception as e:
         logger.error(f"Error processing 7TV data for {channel_id}: {e}", exc_info=True)
-    return emotes
+    return None
 
-async def get_7tv_global_emotes() -> EmoteSet:
+async def get_7tv_global_emotes() -> Optional[EmoteSet]:
     """Fetches 7TV global emotes.
-    Returns: A dictionary mapping emote name to its 1x WebP URL.
+    Returns: A dictionary mapping emote name to its 1x WebP URL, or None if the request failed.
     """
     emotes: EmoteSet = {}
     url = SEVENTV_GLOBAL_API
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-            if "emotes" in data:
-                for emote in data["emotes"]:
-                    emote_name = emote.get("name")
-                    # Get the smallest WebP URL (1x)
-                    emote_url = None
-                    files = emote.get("data", {}).get("host", {}).get("files", [])
-                    for f in files:
-                        if f.get("name") == "1x.webp":
-                            emote_url = f"{emote['data']['host']['url']}/{f['name']}"
-                            break 
-                    if emote_name and emote_url:
-                        emotes[emote_name] = emote_url
-            logger.info(f"Fetched {len(emotes)} 7TV global emotes.")
-            return emotes
+        response = await coalesced_get(url)
+        response.raise_for_status()
+        data = response.json()
+        if "emotes" in data:
+            for emote in data["emotes"]:
+                emote_name = emote.get("name")
+                # Get the smallest WebP URL (1x)
+                emote_url = None
+                files = emote.get("data", {}).get("host", {}).get("files", [])
+                for f in files:
+                    if f.get("name") == "1x.webp":
+                        emote_url = f"{emote['data']['host']['url']}/{f['name']}"
+                        break 
+                if emote_name and emote_url:
+                    emotes[emote_name] = emote_url
+        logger.info(f"Fetched {len(emotes)} 7TV global emotes.")
+        return emotes
     except httpx.RequestError as e:
         logger.error(f"HTTP error fetching 7TV global emotes: {e}")
     except Exception as e:
         logger.error(f"Error processing 7TV global data: {e}", exc_info=True)
-    return emotes
+    return None
 
-# --- Main Fetch Function & Cache --- 
+# --- Persistent Emote Cache --- 
 
-# Cache maps channel name to tuple: (ffz_dict, 7tv_chan_dict)
-emote_cache: Dict[str, Tuple[EmoteSet, EmoteSet]] = {}
-# Cache for 7TV global emotes
-seventv_global_cache: Optional[EmoteSet] = None
-CACHE_EXPIRY = 3600 # Cache emotes for 1 hour (in seconds) - adjust as needed
+CACHE_EXPIRY = int(os.getenv("EMOTE_CACHE_EXPIRY", "3600")) # Cache emotes for 1 hour (in seconds) - adjust as needed
+EMOTE_CACHE_DIR = os.getenv("EMOTE_CACHE_DIR", os.path.join(os.path.dirname(__file__), 'emote_cache'))
 
-async def fetch_all_emotes_for_channel(channel_name: str, client_id: Optional[str], token: Optional[str]) -> Tuple[EmoteSet, EmoteSet, EmoteSet]:
-    """Fetches FFZ, 7TV channel, and 7TV global emotes for a channel.
-    Returns: A tuple containing: (ffz_emotes_dict, seventv_channel_emotes_dict, seventv_global_emotes_dict)
+class EmoteDiskCache:
+    """TTL-aware emote cache kept in memory and persisted as one JSON file per key.
+
+    Entries outlive their TTL: stale data is still returned (flagged as stale) so
+    callers can serve it immediately and revalidate in the background.
     """
-    global seventv_global_cache
-    channel_name_lower = channel_name.lower()
 
-    # --- Fetch 7TV Global Emotes (if not cached) --- 
-    if seventv_global_cache is None:
-        logger.info("Fetching 7TV global emotes...")
-        seventv_global_cache = await get_7tv_global_emotes()
+    def __init__(self, directory: str = EMOTE_CACHE_DIR, ttl: float = CACHE_EXPIRY):
+        self.directory = directory
+        self.ttl = ttl
+        self._memory: Dict[str, Tuple[float, Any]] = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, re.sub(r'[^a-z0-9_.-]', '_', key.lower()) + '.json')
+
+    def _read(self, key: str) -> Optional[Tuple[float, Any]]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            return float(entry["fetched_at"]), entry["data"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable emote cache entry '{key}': {e}")
+            return None
+
+    def _write(self, key: str, fetched_at: float, data: Any):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"fetched_at": fetched_at, "data": data}, f)
+        os.replace(tmp_path, path) # Atomic, readers never see a partial file
+
+    async def get(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """Returns (data, is_fresh), or None if the key was never cached."""
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read, key)
+            if entry is None:
+                return None
+            self._memory[key] = entry
+        fetched_at, data = entry
+        return data, (time.time() - fetched_at) < self.ttl
+
+    async def put(self, key: str, data: Any, fresh: bool = True):
+        """Stores data. With `fresh` False (e.g. a fetch that failed) it is
+        stored as already expired, so it is served but refetched on the next lookup,
+        after restarts too."""
+        entry = (time.time() if fresh else 0.0, data)
+        self._memory[key] = entry
+        try:
+            await asyncio.to_thread(self._write, key, *entry)
+        except OSError as e:
+            logger.warning(f"Could not persist emote cache entry '{key}': {e}")
 
-    # --- Fetch Channel Specific Emotes --- 
-    # Get Twitch User ID first (needed for 7TV)
-    twitch_user_id = await get_twitch_user_id(channel_name_lower, client_id, token)
+emote_disk_cache = EmoteDiskCache()
+SEVENTV_GLOBAL_CACHE_KEY = "7tv_global"
+
+def _channel_cache_key(channel_name: str) -> str:
+    return f"channel_{channel_name}"
+
+# Callback receiving (ffz_emotes, seventv_channel_emotes, seventv_global_emotes) after a background refresh
+EmoteUpdateCallback = Callable[[EmoteSet, EmoteSet, EmoteSet], Awaitable[None]]
+# Running background revalidations, one per channel
+_revalidation_tasks: Dict[str, asyncio.Task] = {}
+
+# --- Main Fetch Function --- 
+
+async def _refresh_7tv_global_emotes(previous: Optional[EmoteSet] = None) -> EmoteSet:
+    """Fetches 7TV global emotes over the network and caches them."""
+    logger.info("Fetching 7TV global emotes...")
+    emotes = await get_7tv_global_emotes()
+    if emotes is not None:
+        await emote_disk_cache.put(SEVENTV_GLOBAL_CACHE_KEY, emotes)
+        return emotes
+    if previous is None:
+        # Cache nothing that would be trusted; the next lookup tries again
+        await emote_disk_cache.put(SEVENTV_GLOBAL_CACHE_KEY, {}, fresh=False)
+        return {}
+    # Keep serving the old (still expired) entry
+    return previous
+
+async def _refresh_channel_emotes(channel_name_lower: str, client_id: Optional[str], token: Optional[str],
+                                  previous: Optional[Dict[str, Any]] = None) -> Tuple[EmoteSet, EmoteSet]:
+    """Fetches FFZ and 7TV channel emotes over the network and caches them."""
+    # Get Twitch User ID first (needed for 7TV); it never changes, so reuse a cached one
+    twitch_user_id = previous.get("user_id") if previous else None
+    if not twitch_user_id:
+        twitch_user_id = await get_twitch_user_id(channel_name_lower, client_id, token)
 
     # Fetch FFZ and 7TV concurrently
     results = await asyncio.gather(
@@ -207,53 +298,203 @@ async def fetch_all_emotes_for_channel(channel_name: str, client_id: Optional[st
         return_exceptions=True # Don't let one failure stop others
     )
 
-    ffz_emotes = results[0] if not isinstance(results[0], Exception) else {}
-    seventv_channel_emotes = results[1] if not isinstance(results[1], Exception) else {}
-
     if isinstance(results[0], Exception):
         logger.error(f"Exception fetching FFZ for {channel_name_lower}: {results[0]}")
     if isinstance(results[1], Exception):
         logger.error(f"Exception fetching 7TV for {channel_name_lower} (ID: {twitch_user_id}): {results[1]}")
+    # The get_* helpers return None on failure and {} for a channel without emotes
+    ffz_emotes = results[0] if not isinstance(results[0], Exception) else None
+    seventv_channel_emotes = results[1] if not isinstance(results[1], Exception) else None
+    # Without credentials there is no user ID (and no 7TV set) by design; with them, a
+    # missing ID means the lookup failed (or the channel doesn't exist)
+    user_id_failed = not twitch_user_id and bool(client_id and token)
+    failed = ffz_emotes is None or seventv_channel_emotes is None or user_id_failed
+
+    # Keep previously cached sets only for sources whose request failed
+    previous = previous or {}
+    if ffz_emotes is None:
+        ffz_emotes = previous.get("ffz", {})
+    if seventv_channel_emotes is None or user_id_failed:
+        seventv_channel_emotes = previous.get("7tv", {})
+
+    # After a failure the entry is stored expired, so it is refetched on its next use
+    await emote_disk_cache.put(_channel_cache_key(channel_name_lower), {
+        "user_id": twitch_user_id,
+        "ffz": ffz_emotes,
+        "7tv": seventv_channel_emotes
+    }, fresh=not failed)
+    return ffz_emotes, seventv_channel_emotes
+
+async def _revalidate_channel(channel_name_lower: str, client_id: Optional[str], token: Optional[str],
+                              global_emotes: EmoteSet, refresh_global: bool,
+                              channel_entry: Dict[str, Any], refresh_channel: bool,
+                              on_update: Optional[EmoteUpdateCallback]):
+    """Background refresh of stale cache entries; reports the new sets through on_update."""
+    try:
+        if refresh_global:
+            global_emotes = await _refresh_7tv_global_emotes(global_emotes)
+        ffz_emotes, seventv_channel_emotes = channel_entry.get("ffz", {}), channel_entry.get("7tv", {})
+        if refresh_channel:
+            ffz_emotes, seventv_channel_emotes = await _refresh_channel_emotes(channel_name_lower, client_id, token, channel_entry)
+        logger.info(f"Revalidated cached emotes for {channel_name_lower}")
+        if on_update:
+            await on_update(ffz_emotes, seventv_channel_emotes, global_emotes)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Error revalidating emotes for {channel_name_lower}: {e}", exc_info=True)
+    finally:
+        if _revalidation_tasks.get(channel_name_lower) is asyncio.current_task():
+            del _revalidation_tasks[channel_name_lower]
+
+def cancel_emote_revalidation(channel_name: str):
+    """Cancels a channel's background revalidation, e.g. when its pipeline stops, so
+    its `on_update` callback is never called afterwards.
+    """
+    task = _revalidation_tasks.pop(channel_name.lower(), None)
+    if task is not None and not task.done():
+        task.cancel()
+
+async def fetch_all_emotes_for_channel(channel_name: str, client_id: Optional[str], token: Optional[str],
+                                       on_update: Optional[EmoteUpdateCallback] = None) -> Tuple[EmoteSet, EmoteSet, EmoteSet]:
+    """Fetches FFZ, 7TV channel, and 7TV global emotes for a channel.
+    Cached data (in memory or on disk) is returned right away, even if it is older than
+    CACHE_EXPIRY; stale entries are then refreshed in the background and the fresh sets
+    are passed to `on_update`.
+    Returns: A tuple containing: (ffz_emotes_dict, seventv_channel_emotes_dict, seventv_global_emotes_dict)
+    """
+    channel_name_lower = channel_name.lower()
+
+    # --- 7TV Global Emotes --- 
+    cached_global = await emote_disk_cache.get(SEVENTV_GLOBAL_CACHE_KEY)
+    if cached_global is None:
+        global_emotes, global_fresh = await _refresh_7tv_global_emotes(), True
+    else:
+        global_emotes, global_fresh = cached_global
+
+    # --- Channel Specific Emotes --- 
+    cached_channel = await emote_disk_cache.get(_channel_cache_key(channel_name_lower))
+    if cached_channel is None:
+        ffz_emotes, seventv_channel_emotes = await _refresh_channel_emotes(channel_name_lower, client_id, token)
+        channel_entry, channel_fresh = {}, True
+    else:
+        channel_entry, channel_fresh = cached_channel
+        ffz_emotes, seventv_channel_emotes = channel_entry.get("ffz", {}), channel_entry.get("7tv", {})
 
-    # --- Update Cache --- 
-    emote_cache[channel_name_lower] = (ffz_emotes, seventv_channel_emotes)
-    # logger.info(f"Cached emotes for {channel_name_lower}: FFZ({len(ffz_emotes)}), 7TV({len(seventv_channel_emotes)})")
+    # --- Stale-While-Revalidate --- 
+    if (not global_fresh or not channel_fresh) and channel_name_lower not in _revalidation_tasks:
+        logger.info(f"Serving stale cached emotes for {channel_name_lower}; revalidating in background")
+        _revalidation_tasks[channel_name_lower] = asyncio.create_task(
+            _revalidate_channel(channel_name_lower, client_id, token,
+                                global_emotes, not global_fresh,
+                                channel_entry, not channel_fresh, on_update),
+            name=f"EmoteRevalidate-{channel_name_lower}"
+        )
 
-    return ffz_emotes, seventv_channel_emotes, seventv_global_cache or {}
+    return ffz_emotes, seventv_channel_emotes, global_emotes
 
 
+# --- Emote Index ---
+
+class IndexedEmote(NamedTuple):
+    name: str
+    url: str
+    source: str # One of EMOTE_SOURCES
+    sentiment_score: Optional[float]
+
+class EmoteIndex:
+    """Immutable, versioned name -> emote lookup for one channel.
+
+    Built once per emote fetch with precedence already resolved, so detection
+    is a plain dictionary lookup per word. Never modified after construction;
+    a refresh (or an emote score reload) builds a new index and swaps the reference.
+    """
+    __slots__ = ('version', 'score_table_version', 'emotes', 'scored', 'keyword_skip')
+
+    def __init__(self, emotes: Dict[str, IndexedEmote], version: int, score_table_version: Optional[str] = None):
+        self.version = version
+        # Version of the EmoteScoreTable the sentiment scores were taken from
+        self.score_table_version = score_table_version
+        self.emotes: Mapping[str, IndexedEmote] = MappingProxyType(emotes)
+        # Only emotes with a sentiment score are reported by detect_emotes_in_message
+        self.scored: Mapping[str, IndexedEmote] = MappingProxyType(
+            {name: emote for name, emote in emotes.items() if emote.sentiment_score is not None}
+        )
+        # Lower-cased names; the channel's emotes are reported as emotes, not keywords
+        self.keyword_skip: FrozenSet[str] = frozenset(name.lower() for name in emotes)
+
+    def __len__(self) -> int:
+        return len(self.emotes)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.emotes
+
+    def get(self, name: str) -> Optional[IndexedEmote]:
+        return self.emotes.get(name)
+
+_emote_index_versions = itertools.count(1)
+EMPTY_EMOTE_INDEX = EmoteIndex({}, version=0)
+
+def build_emote_index(ffz_emotes: EmoteSet, seventv_emotes: EmoteSet, global_seventv_emotes: EmoteSet,
+                      score_table: Optional[EmoteScoreTable] = None) -> EmoteIndex:
+    """Builds an EmoteIndex from the fetched emote sets, scored with `score_table`
+    (the current emote score table by default).
+    Channel-specific emotes override global ones if names clash (7TV channel > FFZ > 7TV global).
+    """
+    if score_table is None:
+        score_table = get_emote_score_table()
+    scores = score_table.scores if score_table is not None else {}
+    emotes: Dict[str, IndexedEmote] = {}
+    for source, emote_set in zip(EMOTE_SOURCES, (global_seventv_emotes, ffz_emotes, seventv_emotes)):
+        for name, url in emote_set.items():
+            emotes[name] = IndexedEmote(name, url, source, scores.get(name))
+    return EmoteIndex(
+        emotes,
+        version=next(_emote_index_versions),
+        score_table_version=score_table.version if score_table is not None else None
+    )
+
 # --- Emote Detection --- 
 
-def detect_emotes_in_message(message_content: str, ffz_emotes: EmoteSet, seventv_emotes: EmoteSet, global_seventv_emotes: EmoteSet) -> List[EmoteData]:
+def detect_emotes_in_message(message_content: str, emote_index: EmoteIndex) -> List[EmoteData]:
     """Detects known FFZ and 7TV emotes in a message string.
-    Returns: A list of detected emote data (name, URL, and sentiment score if available).
-    Prioritizes emotes from emoji_sentiment_scores.csv.
+    Returns: A list of detected emote data (name, URL, source and sentiment score).
+    Only emotes with a score in emoji_sentiment_scores.csv are reported.
     """
     detected: List[EmoteData] = []
-    words = message_content.split()
-    
-    # Combine emote dictionaries for efficient lookup
-    # Channel-specific emotes override global ones if names clash
-    combined_emotes: EmoteSet = {**global_seventv_emotes, **ffz_emotes, **seventv_emotes} 
-
-    for word in words:
-        if word in combined_emotes:
-            # Check if this emote is in our sentiment scores dataset
-            has_sentiment = word in emote_sentiment_scores
-            
-            emote_data: EmoteData = {
-                "name": word, 
-                "url": combined_emotes[word],
-                "sentiment_score": None  # Default to None
-            }
-            
-            # Add sentiment score if available in our custom dataset
-            if has_sentiment:
-                emote_data["sentiment_score"] = emote_sentiment_scores[word]
-                detected.append(emote_data)
-            # If we want to strictly only use emotes from emoji_sentiment_scores.csv, we can
-            # remove this else block. If we want to include all but prioritize, keep it.
-            # else:
-            #    detected.append(emote_data)
-
-    return detected 
\ No newline at end of file
+    lookup = emote_index.scored.get
+    for word in message_content.split():
+        emote = lookup(word)
+        if emote is not None:
+            detected.append({
+                "name": emote.name,
+                "url": emote.url,
+                "sentiment_score": emote.sentiment_score,
+                "source": emote.source
+            })
+    return detected
+
+def parse_twitch_emote_tag(emote_tag: str, message_content: str) -> List[Tuple[str, str, int]]:
+    """Parses the IRCv3 `emotes` tag of a Twitch chat message (`id:start-end,start-end/id:...`,
+    inclusive code point offsets) into (emote id, name, start) for every range, in message order.
+    Malformed parts and ranges outside the message are skipped.
+    """
+    emotes: List[Tuple[str, str, int]] = []
+    if not emote_tag:
+        return emotes
+    length = len(message_content)
+    for emote_part in emote_tag.split('/'):
+        emote_id, _, ranges = emote_part.partition(':')
+        if not emote_id or not ranges:
+            continue
+        for emote_range in ranges.split(','):
+            start, _, end = emote_range.partition('-')
+            try:
+                start, end = int(start), int(end)
+            except ValueError:
+                logger.warning(f"Skipping malformed Twitch emote range '{emote_range}' in tag '{emote_tag}'")
+                continue
+            if 0 <= start <= end < length:
+                emotes.append((emote_id, message_content[start:end + 1], start))
+    emotes.sort(key=lambda emote: emote[2])
+    return emotes
@@ -0,0 +1,82 @@
+import os
+import asyncio
+import logging
+import httpx
+from typing import Dict, Optional, Tuple, Hashable, Callable, Awaitable, Any
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10.0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+# --- Shared Client ---
+# One pooled client for all emote/user lookups, so TLS connections are reused.
+# Opened on application startup (or lazily on first use) and closed on shutdown.
+_client: Optional[httpx.AsyncClient] = None
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it if needed."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+def set_http_client(client: httpx.AsyncClient):
+    """Replaces the shared client, e.g. with one bound to a local stub server."""
+    global _client
+    _client = client
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Shared HTTP client closed.")
+    _client = None
+
+# --- Request Coalescing ---
+
+class SingleFlight:
+    """Merges concurrent calls with the same key into one in-flight call.
+
+    Every caller gets the shared result (or exception). A caller that is cancelled
+    does not cancel the shared call for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+_get_flights = SingleFlight()
+
+async def coalesced_get(url: str, params: Optional[Dict[str, str]] = None,
+                        headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+    """GETs `url` with the shared client; identical requests already in flight are joined.
+    The returned response is fully read and may be shared between callers.
+    """
+    key: Tuple = (
+        url,
+        tuple(sorted((params or {}).items())),
+        tuple(sorted((headers or {}).items()))
+    )
+    return await _get_flights.do(key, lambda: get_http_client().get(url, params=params, headers=headers))
@@ -0,0 +1,183 @@
+import os
+import logging
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Iterable, Callable, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Bounded memo sizes; chat vocabulary is small and repetitive, so these hit most of the time
+KEYWORD_TAG_CACHE_SIZE = int(os.getenv("KEYWORD_TAG_CACHE_SIZE", "65536"))
+KEYWORD_LEMMA_CACHE_SIZE = int(os.getenv("KEYWORD_LEMMA_CACHE_SIZE", "16384"))
+
+# Relevant POS tags for keywords (Nouns, Proper Nouns)
+KEYWORD_POS_TAGS = frozenset({'NN', 'NNS', 'NNP', 'NNPS'})
+
+def tokenize_for_keywords(text: str) -> List[str]:
+    """Simple split and lowercasing, keeping alphabetic tokens only (same as before)."""
+    return [word.lower() for word in text.split() if word.isalpha()]
+
+class KeywordEngine:
+    """Keyword extraction with memoized POS tag and lemma decisions.
+
+    Produces the same tags as nltk's averaged perceptron tagger (`nltk.pos_tag`):
+    - Words in the tagger's tag dictionary always get the same tag, so they are
+      looked up directly.
+    - For other words the perceptron only looks at the word, the two previous
+      tags and a five-word context window. Its decision is cached under exactly
+      those inputs, so a repeated phrase is never scored twice.
+    - Repeated messages reuse the tags of the whole token sequence.
+    A batch is tagged in one pass: its distinct, not yet memoized token sequences
+    are laid out back to back in a single context stream and walked once.
+    Lemmas are cached per word. Stopwords and known emotes (`skip_words`) are
+    dropped before tagging; emotes are reported separately as emotes.
+    """
+
+    def __init__(self, tagger: Any, lemmatize: Callable[[str], str], stop_words: Iterable[str],
+                 skip_words: Iterable[str] = (),
+                 tag_cache_size: int = KEYWORD_TAG_CACHE_SIZE,
+                 lemma_cache_size: int = KEYWORD_LEMMA_CACHE_SIZE):
+        self._tagger = tagger # nltk.tag.perceptron.PerceptronTagger
+        self._tagdict: Dict[str, str] = tagger.tagdict
+        self._start = list(tagger.START)
+        self._end = list(tagger.END)
+        self._stop_words = frozenset(stop_words)
+        self._skip_words = frozenset()
+        self.set_skip_words(skip_words)
+        self._predict = lru_cache(maxsize=tag_cache_size)(self._predict_tag)
+        # Whole token sequences too: chat repeats itself (copypasta, spam, commands)
+        self._sequences: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._sequence_cache_size = max(1, tag_cache_size // 4)
+        self._sequence_hits = 0
+        self._sequence_misses = 0
+        self._lemmatize = lru_cache(maxsize=lemma_cache_size)(lemmatize)
+
+    def set_skip_words(self, words: Iterable[str]):
+        """Replaces the set of tokens (e.g. emote names) excluded from keywords."""
+        self._skip_words = frozenset(word.lower() for word in words)
+
+    def _predict_tag(self, word: str, prev: str, prev2: str, context: tuple) -> str:
+        # `context` is the five normalized words around `word`; _get_features offsets
+        # the index by len(START), so index 0 points at the middle of the window
+        features = self._tagger._get_features(0, word, context, prev, prev2)
+        tag, _ = self._tagger.model.predict(features)
+        return tag
+
+    def tag(self, tokens: List[str]) -> List[str]:
+        """Tags one message's tokens, as PerceptronTagger.tag would."""
+        return list(self.tag_batch([tuple(tokens)])[0])
+
+    def tag_batch(self, sequences: List[tuple]) -> List[tuple]:
+        """Tags many token sequences at once. Returns one tag tuple per sequence, in order."""
+        found: Dict[tuple, tuple] = {}
+        pending: List[tuple] = []
+        for tokens in sequences:
+            if tokens in found:
+                continue
+            tags = self._sequences.get(tokens)
+            if tags is None:
+                self._sequence_misses += 1
+                found[tokens] = ()
+                pending.append(tokens)
+            else:
+                self._sequence_hits += 1
+                self._sequences.move_to_end(tokens)
+                found[tokens] = tags
+        if pending:
+            for tokens, tags in zip(pending, self._tag_tokens_batch(pending)):
+                found[tokens] = tags
+                self._sequences[tokens] = tags
+            while len(self._sequences) > self._sequence_cache_size:
+                self._sequences.popitem(last=False)
+        return [found[tokens] for tokens in sequences]
+
+    def _tag_tokens_batch(self, sequences: List[tuple]) -> List[tuple]:
+        # Every sequence is padded with START/END in one shared context stream, so
+        # each word's five-word window is a plain slice of it
+        normalize = self._tagger.normalize
+        pad = len(self._start)
+        context: List[str] = []
+        firsts: List[int] = [] # Index of each sequence's first token in the stream
+        for tokens in sequences:
+            context.extend(self._start)
+            firsts.append(len(context))
+            context.extend(normalize(word) for word in tokens)
+            context.extend(self._end)
+        results = []
+        for tokens, first in zip(sequences, firsts):
+            prev, prev2 = self._start
+            tags = []
+            for i, word in enumerate(tokens):
+                tag = self._tagdict.get(word)
+                if not tag:
+                    start = first + i - pad
+                    tag = self._predict(word, prev, prev2, tuple(context[start:start + 5]))
+                tags.append(tag)
+                prev2 = prev
+                prev = tag
+            results.append(tuple(tags))
+        return results
+
+    def _keyword_tokens(self, text: str) -> tuple:
+        return tuple(
+            word for word in tokenize_for_keywords(text)
+            if word not in self._stop_words and word not in self._skip_words
+        )
+
+    def _keywords(self, tokens: tuple, tags: tuple, max_keywords: int) -> List[str]:
+        keywords = [
+            self._lemmatize(word)
+            for word, tag in zip(tokens, tags)
+            if tag in KEYWORD_POS_TAGS
+        ]
+        # Counter.most_common keeps first-seen order for ties, like nltk.FreqDist
+        return [keyword for keyword, _ in Counter(keywords).most_common(max_keywords)]
+
+    def extract(self, text: str, max_keywords: int = 5) -> List[str]:
+        """Returns up to `max_keywords` lemmatized nouns, most frequent first."""
+        tokens = self._keyword_tokens(text)
+        if not tokens:
+            return []
+        return self._keywords(tokens, self.tag_batch([tokens])[0], max_keywords)
+
+    def extract_batch(self, texts: List[str], max_keywords: int = 5) -> List[List[str]]:
+        """Extracts keywords for many messages, tagging the whole batch in one pass.
+        If the batch fails, messages are retried one at a time; a failing message gets [].
+        """
+        try:
+            sequences = [self._keyword_tokens(text) for text in texts]
+            tagged = self.tag_batch([tokens for tokens in sequences if tokens])
+            results = []
+            tag_iter = iter(tagged)
+            for tokens in sequences:
+                results.append(self._keywords(tokens, next(tag_iter), max_keywords) if tokens else [])
+            return results
+        except Exception as e:
+            logger.error(f"Error extracting keywords for a batch of {len(texts)} messages: {e}", exc_info=False)
+        results = []
+        for text in texts:
+            try:
+                results.append(self.extract(text, max_keywords))
+            except Exception as e:
+                logger.error(f"Error extracting keywords from text '{text[:50]}...': {e}", exc_info=False)
+                results.append([])
+        return results
+
+    def cache_info(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters of the memo caches."""
+        return {
+            "sequence": {"hits": self._sequence_hits, "misses": self._sequence_misses,
+                         "maxsize": self._sequence_cache_size, "currsize": len(self._sequences)},
+            "tag": self._predict.cache_info()._asdict(),
+            "lemma": self._lemmatize.cache_info()._asdict()
+        }
+
+def load_pos_tagger() -> Optional[Any]:
+    """Loads nltk's English perceptron tagger (the one nltk.pos_tag uses). Returns None if its data is missing."""
+    try:
+        from nltk.tag.perceptron import PerceptronTagger
+        return PerceptronTagger()
+    except (LookupError, OSError) as e:
+        logger.error(f"Could not load the NLTK POS tagger: {e}")
+        return None
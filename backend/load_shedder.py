@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+from typing import Callable, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Adaptive sampling of sentiment/keyword analysis per channel. Emote detection and
+# message counting always see every message; only the NLP stage is sampled.
+LOAD_SHEDDING_ENABLED = os.getenv("LOAD_SHEDDING_ENABLED", "1").lower() not in ("0", "false", "no")
+# NLP lag (time from a message arriving to its analysis result) the sampler aims to stay under
+SHED_TARGET_LAG_MS = float(os.getenv("SHED_TARGET_LAG_MS", "250"))
+# Never analyze fewer than this share of messages
+SHED_MIN_SAMPLE_RATE = float(os.getenv("SHED_MIN_SAMPLE_RATE", "0.02"))
+# Messages of one channel waiting for the NLP executor at most; beyond that new ones
+# skip analysis, which bounds latency even before the lag feedback reacts
+SHED_MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", "256"))
+
+# Controller tuning: lag is smoothed with an EWMA and the rate adjusted at most once
+# per interval, cut multiplicatively when over target and raised slowly when well under
+LAG_EWMA_ALPHA = 0.2
+ADJUST_INTERVAL = 0.25
+DECREASE_FACTOR = 0.7
+INCREASE_FACTOR = 1.1
+INCREASE_STEP = 0.02
+
+class AdaptiveSampler:
+    """Decides, per message, whether one channel's message gets NLP analysis.
+
+    Watches the lag of analyzed messages and the number still in flight and adapts
+    `sample_rate` (AIMD): lag above `target_lag` cuts the rate, lag below half of it
+    slowly restores it towards 1. Sampling is deterministic (every 1/rate-th message),
+    so a burst cannot starve analysis by bad luck.
+    """
+
+    def __init__(self, channel: str, enabled: bool = LOAD_SHEDDING_ENABLED,
+                 target_lag: float = SHED_TARGET_LAG_MS / 1000.0,
+                 min_rate: float = SHED_MIN_SAMPLE_RATE, max_in_flight: int = SHED_MAX_IN_FLIGHT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.channel = channel
+        self.enabled = enabled
+        self.target_lag = target_lag
+        self.min_rate = min(1.0, max(0.0001, min_rate))
+        self.max_in_flight = max(1, max_in_flight)
+        self._clock = clock
+        self.sample_rate = 1.0
+        self.lag_ewma = 0.0
+        self.in_flight = 0
+        self._credit = 0.0
+        self._last_adjust = clock()
+        # Counters
+        self.analyzed = 0
+        self.skipped = 0
+
+    def admit(self) -> bool:
+        """True if the next message should be analyzed. Call finish() once its analysis is done."""
+        if not self.enabled:
+            self.in_flight += 1
+            self.analyzed += 1
+            return True
+        if self.in_flight >= self.max_in_flight:
+            self.skipped += 1
+            return False
+        self._credit += self.sample_rate
+        if self._credit < 1.0:
+            self.skipped += 1
+            return False
+        self._credit -= 1.0
+        self.in_flight += 1
+        self.analyzed += 1
+        return True
+
+    def finish(self, lag: float):
+        """Reports the lag (seconds) of an analyzed message and adapts the rate."""
+        self.in_flight -= 1
+        if not self.enabled:
+            return
+        self.lag_ewma += LAG_EWMA_ALPHA * (lag - self.lag_ewma)
+        now = self._clock()
+        if now - self._last_adjust < ADJUST_INTERVAL:
+            return
+        self._last_adjust = now
+        previous = self.sample_rate
+        if self.lag_ewma > self.target_lag:
+            self.sample_rate = max(self.min_rate, self.sample_rate * DECREASE_FACTOR)
+        elif self.lag_ewma < self.target_lag / 2:
+            self.sample_rate = min(1.0, self.sample_rate * INCREASE_FACTOR + INCREASE_STEP)
+        if previous == 1.0 and self.sample_rate < 1.0:
+            logger.warning(f"NLP lag for {self.channel} at {self.lag_ewma * 1000:.0f} ms, sampling analysis")
+        elif previous < 1.0 and self.sample_rate == 1.0:
+            logger.info(f"NLP lag for {self.channel} recovered, analyzing every message again")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": round(self.sample_rate, 4),
+            "lag_ms": round(self.lag_ewma * 1000, 1),
+            "in_flight": self.in_flight,
+            "analyzed": self.analyzed,
+            "skipped": self.skipped
+        }
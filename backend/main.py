@@ -1,11 +1,25 @@
+import time
+# Startup time is measured from here, before the heavier imports below
+_import_started_at = time.perf_counter()
+
+import os
 import logging
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from typing import Optional, Dict, Any
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 
 from websocket_manager import ConnectionManager
-from twitch_irc import start_twitch_bot, stop_twitch_bot, active_bots
+from wire_format import parse_wire_format
+from cluster import create_cluster_client
+import metrics
+from http_client import get_http_client, close_http_client
+from twitch_irc import start_twitch_bot, stop_twitch_bot, active_bots, nlp_executor, connection_pool, chat_recorder
+import nlp_processor
+from rollups import RollupStore, RESOLUTIONS
+from alerts import alert_rules
 
 # Configure logging
 logging.basicConfig(
@@ -14,6 +28,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Time from import to the end of the startup hook (serving) should stay within this budget.
+# NLP resources load afterwards in the background; /ready reports when they are done.
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1000"))
+
 app = FastAPI(title="Twitch Chat Analyzer Backend")
 
 # Configure CORS
@@ -32,19 +50,77 @@ app.add_middleware(
 )
 
 manager = ConnectionManager()
+# Multi-worker mode (WORKER_BROKER_SOCKET): channels are ingested by the worker the
+# broker assigns them to, which then calls start_twitch_bot/stop_twitch_bot here
+# Alert rule changes are relayed to the other workers, so they reach the channel's owner
+cluster = create_cluster_client(manager, start_twitch_bot, stop_twitch_bot, alert_rules)
+
+# Gauges read from live state at scrape time
+metrics.gauge(
+    "websocket_clients", "Connected WebSocket clients, per channel.", ("channel",),
+    callback=lambda: {(streamer,): len(conns) for streamer, conns in manager.active_connections.items()}
+)
+metrics.gauge(
+    "websocket_send_queue_frames", "Frames waiting in all WebSocket clients' send queues.",
+    callback=lambda: sum(client.queued for client in list(manager.clients.values()))
+)
+metrics.gauge("analyzed_channels", "Channels being analyzed.", callback=lambda: len(active_bots))
+metrics.gauge(
+    "nlp_sample_rate", "Share of messages getting sentiment/keyword analysis, per channel.", ("channel",),
+    callback=lambda: {(streamer,): pipeline.sampler.sample_rate for streamer, pipeline in list(active_bots.items())}
+)
+metrics.gauge("irc_connections", "Open IRC connections.", callback=lambda: len(connection_pool.shards))
+metrics.gauge(
+    "unique_chatters", "Estimated unique chatters, per channel and window (1m, 5m, session).", ("channel", "window"),
+    callback=lambda: {
+        (streamer, window): unique
+        for streamer, pipeline in list(active_bots.items())
+        for window, unique in pipeline.aggregator.chatters.unique().items()
+    }
+)
+metrics.gauge("alert_rules", "Configured alert rules.", callback=lambda: len(alert_rules.rules))
+if chat_recorder is not None:
+    metrics.gauge("chat_store_queued_messages", "Messages waiting for the chat recorder.",
+                  callback=lambda: chat_recorder.stats()["queued"])
+    metrics.gauge("chat_store_dropped_messages", "Messages the chat recorder dropped since startup.",
+                  callback=lambda: chat_recorder.dropped)
+
+# History queries are answered from the rollups the chat recorder maintains
+history_store = RollupStore(chat_recorder.directory, chat_recorder.rollups) if chat_recorder is not None else None
+HISTORY_DEFAULT_SECONDS = 24 * 3600
+
+startup_ms: Optional[float] = None
+nlp_init_task: Optional[asyncio.Task] = None
+
+async def initialize_nlp():
+    """Loads NLP resources and starts the NLP workers without holding up startup."""
+    try:
+        await asyncio.to_thread(nlp_processor.init_nlp_resources)
+        score_table = nlp_processor.get_emote_score_table()
+        logger.info(f"Loaded {len(score_table)} emoji sentiment scores from emoji_sentiment_scores.csv (version {score_table.version})")
+        await nlp_executor.warm_up()
+        logger.info("NLP executor workers started.")
+    except Exception as e:
+        # Messages still trigger loading on first use, so this is not fatal
+        logger.error(f"Background NLP initialization failed: {e}", exc_info=True)
 
 @app.on_event("startup")
 async def startup_event():
+    global startup_ms, nlp_init_task
     logger.info("Starting FastAPI application...")
-    
-    # Confirm that emoji sentiment scores are loaded
-    try:
-        from nlp_processor import emote_sentiment_scores
-        logger.info(f"Loaded {len(emote_sentiment_scores)} emoji sentiment scores from emoji_sentiment_scores.csv for keyword analysis")
-    except ImportError:
-        logger.warning("Failed to import emote_sentiment_scores from nlp_processor")
-    
-    # Perform any other startup tasks here if needed
+    # Open the pooled HTTP client used for emote and user lookups
+    get_http_client()
+    if cluster is not None:
+        await cluster.start() # Connects to (or hosts) the worker broker
+
+    # Emoji sentiment scores, NLTK data and VADER load in the background
+    nlp_init_task = asyncio.create_task(initialize_nlp(), name="NLPInit")
+
+    startup_ms = (time.perf_counter() - _import_started_at) * 1000
+    if startup_ms > STARTUP_BUDGET_MS:
+        logger.warning(f"Startup took {startup_ms:.0f} ms, over the {STARTUP_BUDGET_MS:.0f} ms budget")
+    else:
+        logger.info(f"Startup took {startup_ms:.0f} ms")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -54,30 +130,160 @@ async def shutdown_event():
     shutdown_tasks = [stop_twitch_bot(name) for name in streamer_names]
     await asyncio.gather(*shutdown_tasks) # Run shutdowns concurrently
     logger.info("All Twitch bots stopped.")
+    if cluster is not None:
+        await cluster.close()
+    if nlp_init_task is not None and not nlp_init_task.done():
+        nlp_init_task.cancel()
+    await nlp_executor.close()
+    if chat_recorder is not None:
+        await asyncio.to_thread(chat_recorder.close) # Writes out and fsyncs what's queued
+    await close_http_client()
 
 @app.get("/")
 async def read_root():
     return {"message": "Twitch Chat Analyzer Backend is running"}
 
+@app.get("/ready")
+async def get_ready():
+    """Readiness probe: 503 until NLP resources are loaded and the NLP workers are up."""
+    ready = nlp_processor.is_nlp_ready() and nlp_executor.warmed_up
+    nlp_init_ms = nlp_processor.nlp_init_seconds
+    body = {
+        "ready": ready,
+        "startup_ms": round(startup_ms, 1) if startup_ms is not None else None,
+        "nlp_init_ms": round(nlp_init_ms * 1000, 1) if nlp_init_ms is not None else None
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/status")
 async def get_status():
     active_streamers = list(active_bots.keys())
     return {
         "message": "Twitch Chat Analyzer Backend Status",
         "active_analysis_count": len(active_streamers),
-        "analyzing_streamers": active_streamers
+        "analyzing_streamers": active_streamers,
+        "irc_connections": connection_pool.stats(),
+        "broadcast_stats": manager.get_stats(),
+        "client_stats": manager.get_client_stats(),
+        "chat_store": chat_recorder.stats() if chat_recorder is not None else None,
+        "load_shedding": {streamer: pipeline.sampler.stats() for streamer, pipeline in active_bots.items()},
+        "copypasta": {streamer: pipeline.copypasta.stats() for streamer, pipeline in active_bots.items()
+                      if pipeline.copypasta is not None},
+        "analysis_cache": {streamer: pipeline.analysis_cache.stats() for streamer, pipeline in active_bots.items()},
+        "chatters": {streamer: pipeline.aggregator.chatters.stats() for streamer, pipeline in active_bots.items()},
+        "alerts": {streamer: {"rules": pipeline.alerts.rule_count, "alerts_fired": pipeline.alerts.alerts_fired}
+                   for streamer, pipeline in active_bots.items()},
+        "cluster": cluster.stats() if cluster is not None else None
     }
 
+def _history_range(start: Optional[float], end: Optional[float]):
+    """Resolves a query's [start, end) in unix seconds: the last 24 hours by default."""
+    end = time.time() if end is None else end
+    start = end - HISTORY_DEFAULT_SECONDS if start is None else start
+    return start, end
+
+def _history_error(streamer_name: str, start: float, end: float) -> Optional[JSONResponse]:
+    if history_store is None:
+        return JSONResponse({"error": "Chat history is disabled (set CHAT_STORE_DIR)"}, status_code=404)
+    if not streamer_name.strip():
+        return JSONResponse({"error": "Empty streamer name"}, status_code=400)
+    if end <= start:
+        return JSONResponse({"error": "end must be after start"}, status_code=400)
+    return None
+
+@app.get("/history/{streamer_name}/sessions")
+async def get_history_sessions(streamer_name: str):
+    """Past (and the live) analysis sessions of a channel."""
+    streamer_name = streamer_name.lower().strip()
+    error = _history_error(streamer_name, 0, 1)
+    if error is not None:
+        return error
+    sessions = await asyncio.to_thread(history_store.sessions, streamer_name)
+    return {"streamer": streamer_name, "sessions": sessions}
+
+@app.get("/history/{streamer_name}")
+async def get_history(streamer_name: str, start: Optional[float] = None, end: Optional[float] = None,
+                      resolution: Optional[str] = None, top: int = 10):
+    """Sentiment over time, top emotes, top keywords and message rate of a channel
+    between `start` and `end` (unix seconds, default: the last 24 hours).
+    `resolution` is "minute" or "hour" (default: minute for ranges up to 3 hours).
+    """
+    streamer_name = streamer_name.lower().strip()
+    start, end = _history_range(start, end)
+    error = _history_error(streamer_name, start, end)
+    if error is not None:
+        return error
+    if resolution is None:
+        resolution = "minute" if end - start <= 3 * 3600 else "hour"
+    if resolution not in RESOLUTIONS:
+        return JSONResponse({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}, status_code=400)
+    top = max(1, min(top, 100))
+
+    def query():
+        query_started = time.perf_counter()
+        summary = history_store.summary(streamer_name, start, end, top)
+        timeline = history_store.timeline(streamer_name, start, end, RESOLUTIONS[resolution])
+        summary["query_ms"] = round((time.perf_counter() - query_started) * 1000, 2)
+        return summary, timeline
+
+    summary, timeline = await asyncio.to_thread(query)
+    return {"streamer": streamer_name, "resolution": resolution, "summary": summary, "timeline": timeline}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline stage timings, message rates and WebSocket counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/alerts/rules")
+async def get_alert_rules():
+    """All alert rules; rules without a channel apply to every channel."""
+    return {"rules": alert_rules.to_list()}
+
+@app.post("/alerts/rules")
+async def add_alert_rule(spec: Dict[str, Any] = Body(...)):
+    """Adds an alert rule, or replaces the rule with the given `id`. Analyzed channels
+    pick it up within a second; a replaced rule starts over with a fresh baseline.
+    """
+    try:
+        rule = alert_rules.add(spec)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if cluster is not None:
+        cluster.publish_rule(rule.to_dict())
+    await asyncio.to_thread(alert_rules.save, alert_rules.snapshot())
+    return rule.to_dict()
+
+@app.delete("/alerts/rules/{rule_id}")
+async def delete_alert_rule(rule_id: str):
+    if not alert_rules.remove(rule_id):
+        return JSONResponse({"error": f"No alert rule {rule_id}"}, status_code=404)
+    if cluster is not None:
+        cluster.publish_rule_removal(rule_id)
+    await asyncio.to_thread(alert_rules.save, alert_rules.snapshot())
+    return {"deleted": rule_id}
+
+@app.get("/alerts/{streamer_name}")
+async def get_alerts(streamer_name: str):
+    """Recent alerts of a channel being analyzed (by this worker)."""
+    streamer_name = streamer_name.lower().strip()
+    pipeline = active_bots.get(streamer_name)
+    if pipeline is None:
+        return JSONResponse({"error": f"{streamer_name} is not being analyzed"}, status_code=404)
+    return {"streamer": streamer_name, **pipeline.alerts.stats()}
+
 @app.post("/reload-emoji-sentiments")
 async def reload_emoji_sentiments():
-    """Reloads emoji sentiment scores from the CSV file without restarting the server."""
+    """Reloads emoji sentiment scores from the CSV file without restarting the server.
+    The new table is built in a worker thread and swapped in atomically.
+    """
     try:
-        from nlp_processor import reload_emote_sentiment_scores
-        emote_count = reload_emote_sentiment_scores()
+        score_table = await asyncio.to_thread(nlp_processor.reload_emote_sentiment_scores)
+        emote_count = len(score_table)
         return {
             "message": f"Successfully reloaded {emote_count} emoji sentiment scores",
             "success": True,
-            "emote_count": emote_count
+            "emote_count": emote_count,
+            "version": score_table.version
         }
     except Exception as e:
         logger.error(f"Error reloading emoji sentiment scores: {e}")
@@ -95,23 +301,35 @@ async def websocket_endpoint(websocket: WebSocket, streamer_name: str):
         await websocket.close(code=1008) # Policy Violation
         return
 
-    await manager.connect(websocket, streamer_name)
+    # Optional compact encoding, e.g. ?encoding=msgpack&fields=author,content&emote_refs=1
+    try:
+        wire = parse_wire_format(websocket.query_params)
+    except ValueError as e:
+        logger.warning(f"Rejecting WebSocket connection for {streamer_name}: {e}")
+        await websocket.close(code=1008) # Policy Violation
+        return
+
+    await manager.connect(websocket, streamer_name, wire=wire)
     logger.info(f"WebSocket client connected for streamer: {streamer_name}")
 
     try:
-        # Pass the connection manager to the bot starter
-        bot_instance = await start_twitch_bot(streamer_name, manager)
-        if bot_instance:
-            logger.info(f"Twitch bot is running or was started for {streamer_name}")
-            # Optionally send confirmation back to the specific client
-            # await websocket.send_json({"type": "status", "payload": f"Connected to analysis for {streamer_name}"})
+        if cluster is not None:
+            # The worker owning the channel (possibly this one) runs its bot
+            cluster.subscribe(streamer_name)
         else:
-            # Handle case where bot failed to start (e.g., auth error)
-            logger.error(f"Failed to ensure Twitch bot is running for {streamer_name}")
-            # Error message should have been broadcast by start_twitch_bot
-            # Consider closing the websocket connection if the bot is essential
-            # await websocket.close(code=1011) # Internal Error
-            pass # Keep connection open for now, error was broadcast
+            # Pass the connection manager to the bot starter
+            bot_instance = await start_twitch_bot(streamer_name, manager)
+            if bot_instance:
+                logger.info(f"Twitch bot is running or was started for {streamer_name}")
+                # Optionally send confirmation back to the specific client
+                # await websocket.send_json({"type": "status", "payload": f"Connected to analysis for {streamer_name}"})
+            else:
+                # Handle case where bot failed to start (e.g., auth error)
+                logger.error(f"Failed to ensure Twitch bot is running for {streamer_name}")
+                # Error message should have been broadcast by start_twitch_bot
+                # Consider closing the websocket connection if the bot is essential
+                # await websocket.close(code=1011) # Internal Error
+                pass # Keep connection open for now, error was broadcast
 
     except Exception as e:
         logger.error(f"Error starting Twitch bot for {streamer_name}: {e}", exc_info=True)
@@ -135,7 +353,10 @@ async def websocket_endpoint(websocket: WebSocket, streamer_name: str):
     finally:
         logger.info(f"Cleaning up WebSocket connection for {streamer_name}")
         await manager.disconnect(websocket, streamer_name)
-        if streamer_name not in manager.active_connections:
+        if streamer_name not in manager.active_connections and cluster is not None:
+            # The broker stops the channel's bot once no worker has clients for it
+            cluster.unsubscribe(streamer_name)
+        elif streamer_name not in manager.active_connections:
             logger.info(f"Last client disconnected for {streamer_name}. Requesting bot stop.")
             try:
                 stopped = await stop_twitch_bot(streamer_name)
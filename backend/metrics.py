@@ -0,0 +1,252 @@
+import math
+import bisect
+import logging
+from typing import Dict, List, Tuple, Optional, Callable, Sequence, Iterable
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics ---
+# A small in-process registry rendered in the Prometheus text format by GET /metrics.
+# Updates are plain attribute arithmetic (a bisect for histograms) with no locking:
+# every metric is only updated from the event loop thread. Hot paths resolve their
+# labelled children once (e.g. per pipeline) instead of per message.
+
+# Seconds; covers sub-10 µs tokenizer calls up to multi-second stalls
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+# Seconds; network fetches
+FETCH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class _GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # Last slot: above the largest bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """The child for these label values (created on first use). Keep the result
+        around on hot paths."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values: str):
+        """Drops a labelled series, e.g. when a channel stops being analyzed."""
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+class Gauge(_Metric):
+    """A gauge set directly, or computed at scrape time by `callback`, which returns
+    {label values tuple: value} (or a number for an unlabelled gauge)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.warning(f"Metric callback for {self.name} failed: {e}")
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+            for key, value in values.items():
+                yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            return
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (),
+          callback: Optional[Callable[[], object]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    return REGISTRY.render()
+
+# --- Pipeline Metrics ---
+# Defined here so every module updates the same series
+
+# Stages of ChannelPipeline.process_message. `sentiment` and `keywords` are measured
+# in the NLP worker (keywords run per batch and are split evenly over its messages);
+# `nlp_wait` is the time a message spends batched and queued for the NLP executor.
+PIPELINE_STAGES = ("tag_parsing", "nlp_wait", "sentiment", "keywords", "emote_detection", "broadcast")
+stage_seconds = histogram(
+    "chat_pipeline_stage_seconds", "Time spent per chat message in each pipeline stage.", ("stage",)
+)
+messages_total = counter(
+    "chat_messages_total", "Chat messages processed, per channel.", ("channel",)
+)
+copypasta_shared_total = counter(
+    "chat_copypasta_shared_analyses_total",
+    "Messages that reused the sentiment/keyword analysis of their copypasta cluster, per channel.", ("channel",)
+)
+analysis_cache_lookups_total = counter(
+    "chat_analysis_cache_lookups_total",
+    "Lookups of a message's text in its channel's analysis cache, per channel and result (hit/miss).",
+    ("channel", "result")
+)
+alerts_fired_total = counter(
+    "chat_alerts_fired_total", "Alerts fired, per channel and watched metric.", ("channel", "metric")
+)
+emote_fetch_seconds = histogram(
+    "emote_fetch_seconds", "Time to load a channel's FFZ/7TV emotes (cache or API).", ("result",),
+    buckets=FETCH_BUCKETS
+)
+ws_send_failures_total = counter(
+    "websocket_send_failures_total", "WebSocket sends that failed (the client is then disconnected)."
+)
+ws_frames_dropped_total = counter(
+    "websocket_frames_dropped_total", "Frames dropped from slow clients' send queues."
+)
+ws_slow_disconnects_total = counter(
+    "websocket_slow_client_disconnects_total", "Clients disconnected for falling too far behind."
+)
@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, NamedTuple
+
+# Import NLP functions (also makes them available inside pool workers)
+from nlp_processor import (
+    analyze_sentiment, analyze_sentiment_batch, extract_keywords, extract_keywords_batch,
+    EmoteScoreTable, get_emote_score_table, sync_emote_score_table, is_nlp_ready
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# NLP_EXECUTOR selects where the NLP stage runs:
+#   "process" - a process pool (default, keeps the event loop free)
+#   "thread"  - a thread pool (no extra processes, still GIL-bound)
+#   "inline"  - directly on the event loop (old behaviour, useful for debugging)
+NLP_EXECUTOR_MODE = os.getenv("NLP_EXECUTOR", "process").lower()
+NLP_WORKERS = int(os.getenv("NLP_WORKERS", "2"))
+NLP_BATCH_MAX_SIZE = int(os.getenv("NLP_BATCH_MAX_SIZE", "64"))
+NLP_BATCH_MAX_LATENCY_MS = float(os.getenv("NLP_BATCH_MAX_LATENCY_MS", "20"))
+
+class NLPResult(NamedTuple):
+    sentiment_score: Optional[float]
+    sentiment_words: Dict[str, float]
+    keywords: List[str]
+    # Version of the emote score table the sentiment was computed with
+    score_table_version: Optional[str] = None
+    # Time spent on this message in the worker (keywords: its share of the batch)
+    sentiment_seconds: float = 0.0
+    keywords_seconds: float = 0.0
+
+# --- Worker Side ---
+
+def _analyze_sentiment_safe(text: str, score_table: Optional[EmoteScoreTable] = None) -> Tuple[Optional[float], Dict[str, float]]:
+    try:
+        return analyze_sentiment(text, score_table)
+    except Exception as e:
+        logger.error(f"Error calling analyze_sentiment for '{text[:50]}...': {e}")
+        return 0.0, {} # Default to neutral on error
+
+def _analyze_sentiment_batch_safe(texts: List[str], score_table: EmoteScoreTable) -> List[Tuple[Optional[float], Dict[str, float]]]:
+    try:
+        return analyze_sentiment_batch(texts, score_table)
+    except Exception as e:
+        logger.error(f"Error calling analyze_sentiment_batch for {len(texts)} messages: {e}")
+        return [_analyze_sentiment_safe(text, score_table) for text in texts] # One at a time instead
+
+def analyze_text(text: str) -> NLPResult:
+    """Runs sentiment analysis and keyword extraction for a single message."""
+    score_table = get_emote_score_table()
+    sentiment_score, sentiment_words = _analyze_sentiment_safe(text, score_table)
+    keywords = extract_keywords(text)
+    return NLPResult(sentiment_score, sentiment_words, keywords, score_table.version)
+
+def analyze_batch(texts: List[str], score_table_version: Optional[str] = None) -> List[NLPResult]:
+    """Analyzes a batch of messages. Results are returned in input order.
+    Sentiment and keywords for the whole batch are each computed in one call.
+    `score_table_version` is the caller's emote score table version; a pool worker
+    holding a different one reloads the CSV first. The whole batch uses one table.
+    Must stay a module-level function so it can be pickled for the process pool.
+    """
+    if score_table_version is not None:
+        score_table = sync_emote_score_table(score_table_version)
+    else:
+        score_table = get_emote_score_table()
+    started = time.perf_counter()
+    keywords = extract_keywords_batch(texts)
+    keywords_seconds = (time.perf_counter() - started) / max(1, len(texts))
+    started = time.perf_counter()
+    sentiments = _analyze_sentiment_batch_safe(texts, score_table)
+    sentiment_seconds = (time.perf_counter() - started) / max(1, len(texts))
+    return [
+        NLPResult(sentiment_score, sentiment_words, text_keywords, score_table.version,
+                  sentiment_seconds, keywords_seconds)
+        for (sentiment_score, sentiment_words), text_keywords in zip(sentiments, keywords)
+    ]
+
+def _init_worker():
+    """Pool initializer. Loads the NLP resources in the worker and touches them
+    once so the first real batch is not slowed down.
+    """
+    analyze_batch(["warm up"])
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+# --- Event Loop Side ---
+
+class NLPExecutor:
+    """Collects messages into small batches and scores them off the event loop.
+
+    A batch is flushed once it holds `max_batch_size` messages or the oldest
+    message has waited `max_batch_latency` seconds, whichever comes first.
+    Batches may finish out of order in the pool, but their results are released
+    strictly in arrival order.
+    """
+
+    def __init__(self, pool: Optional[Executor] = None,
+                 max_batch_size: int = NLP_BATCH_MAX_SIZE,
+                 max_batch_latency: float = NLP_BATCH_MAX_LATENCY_MS / 1000.0):
+        self._pool = pool # None means run inline on the event loop
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_latency = max(0.0, max_batch_latency)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Completion future of the most recently scheduled batch, used to keep order
+        self._last_batch_done: Optional[asyncio.Future] = None
+        self._batch_tasks: set[asyncio.Task] = set()
+        self._closed = False
+        # Inline execution has no workers to start
+        self.warmed_up = pool is None
+
+    async def analyze(self, text: str) -> NLPResult:
+        """Queues a message for analysis and waits for its result."""
+        if self._closed:
+            raise RuntimeError("NLPExecutor is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_batch_latency, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        previous_done = self._last_batch_done
+        self._last_batch_done = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(
+            self._run_batch(batch, previous_done, self._last_batch_done),
+            name="NLPBatch"
+        )
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]],
+                         previous_done: Optional[asyncio.Future], done: asyncio.Future):
+        texts = [text for text, _ in batch]
+        try:
+            if self._pool is None:
+                results = analyze_batch(texts)
+            else:
+                loop = asyncio.get_running_loop()
+                # Until this process has loaded its table, workers just use their own
+                score_table_version = get_emote_score_table().version if is_nlp_ready() else None
+                results = await loop.run_in_executor(self._pool, analyze_batch, texts, score_table_version)
+        except Exception as e:
+            logger.error(f"NLP batch of {len(texts)} messages failed: {e}", exc_info=True)
+            results = [NLPResult(0.0, {}, []) for _ in texts]
+
+        try:
+            # Release results only after every earlier batch has released its own
+            if previous_done is not None:
+                await asyncio.shield(previous_done)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            if not done.done():
+                done.set_result(None)
+
+    async def warm_up(self, workers: int = NLP_WORKERS):
+        """Starts the pool workers ahead of the first batch, so chat doesn't wait for them."""
+        if self._pool is not None and not self.warmed_up:
+            loop = asyncio.get_running_loop()
+            # Each job that finds no idle worker makes the pool start another one
+            await asyncio.gather(*(
+                loop.run_in_executor(self._pool, _worker_pid) for _ in range(max(1, workers))
+            ))
+        self.warmed_up = True
+
+    async def close(self):
+        """Flushes pending messages, waits for in-flight batches and stops the pool."""
+        self._closed = True
+        self._flush()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        logger.info("NLP executor closed.")
+
+def create_nlp_executor(mode: str = NLP_EXECUTOR_MODE, workers: int = NLP_WORKERS) -> NLPExecutor:
+    """Builds an NLPExecutor from configuration. Pool workers are spawned lazily."""
+    pool: Optional[Executor] = None
+    if mode == "process":
+        # 'spawn' avoids forking a process that is running an event loop and threads
+        pool = ProcessPoolExecutor(
+            max_workers=max(1, workers),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+    elif mode == "thread":
+        pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="nlp")
+    elif mode != "inline":
+        logger.warning(f"Unknown NLP_EXECUTOR mode '{mode}', falling back to inline execution.")
+        mode = "inline"
+    logger.info(f"NLP executor mode: {mode} (workers={workers if pool else 0}, "
+                f"batch<= {NLP_BATCH_MAX_SIZE} msgs / {NLP_BATCH_MAX_LATENCY_MS} ms)")
+    return NLPExecutor(pool)
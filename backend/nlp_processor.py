@@ -1,12 +1,19 @@
 import logging
-import nltk
-from nltk.corpus import stopwords
+# NLTK itself is imported lazily (see init_nlp_resources); importing it costs a few hundred ms
 # from nltk.tokenize import word_tokenize # No longer using word_tokenize
-from nltk.stem import WordNetLemmatizer
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from typing import List, Dict, Tuple, Optional
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer, BOOSTER_DICT, normalize
+from typing import List, Dict, Set, Tuple, Optional, Mapping
+from types import MappingProxyType
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import os # Import os for path manipulation
 import csv # Added for CSV reading
+import time
+import hashlib
+import threading
+
+from keyword_engine import KeywordEngine, KEYWORD_POS_TAGS, load_pos_tagger, tokenize_for_keywords
+from sentiment_engine import BatchSentimentScorer, create_sentiment_scorer, vader_compound
 
 logger = logging.getLogger(__name__)
 
@@ -18,63 +25,126 @@ NLTK_DATA_DIR = os.path.join(BACKEND_DIR, 'nltk_data')
 # Path to the emoji sentiment scores CSV
 EMOJI_SENTIMENT_CSV = os.path.join(os.path.dirname(BACKEND_DIR), 'emoji_sentiment_scores.csv')
 
-# --- Load Emoji Sentiment Scores ---
-emote_sentiment_scores: Dict[str, float] = {}
+# --- Emoji Sentiment Score Table ---
+
+class EmoteScoreTable:
+    """Immutable snapshot of the emote sentiment scores from the CSV.
 
-def load_emote_sentiment_scores():
-    """Loads emote sentiment scores from the CSV file."""
-    global emote_sentiment_scores
+    Never modified after construction: a reload builds a new table and swaps the
+    module-level reference, so readers see either the old or the new table, never
+    a partial one. `version` is a digest of the contents, so processes that load
+    the same CSV (e.g. NLP pool workers) agree on it.
+    """
+    __slots__ = ('version', 'scores', 'folded')
+
+    def __init__(self, scores: Dict[str, float]):
+        self.scores: Mapping[str, float] = MappingProxyType(dict(scores))
+        # Case-folded lookups only ever hit entries whose name is already lower case
+        self.folded: Mapping[str, float] = MappingProxyType(
+            {name: score for name, score in scores.items() if name == name.lower()}
+        )
+        digest = hashlib.blake2b(repr(sorted(scores.items())).encode('utf-8'), digest_size=4)
+        self.version: str = digest.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.scores
+
+    def get(self, name: str) -> Optional[float]:
+        return self.scores.get(name)
+
+    def lookup(self, word: str, folded_word: Optional[str] = None) -> Optional[float]:
+        """Returns the score for `word` (original case first, then lower case).
+        Pass `folded_word` if the caller has already lower-cased the word.
+        """
+        score = self.scores.get(word)
+        if score is None:
+            score = self.folded.get(folded_word if folded_word is not None else word.lower())
+        return score
+
+EMPTY_SCORE_TABLE = EmoteScoreTable({})
+# Current table; only ever replaced as a whole (see install_emote_score_table)
+emote_score_table: EmoteScoreTable = EMPTY_SCORE_TABLE
+
+def load_emote_score_table(path: str = EMOJI_SENTIMENT_CSV) -> EmoteScoreTable:
+    """Reads the CSV into a new EmoteScoreTable. The current table is left untouched."""
+    scores: Dict[str, float] = {}
     try:
-        if os.path.exists(EMOJI_SENTIMENT_CSV):
-            with open(EMOJI_SENTIMENT_CSV, 'r', encoding='utf-8') as csvfile:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as csvfile:
                 reader = csv.DictReader(csvfile)
                 for row in reader:
                     emote_name = row.get('EmoteName')
                     sentiment_score = row.get('SentimentScore')
                     if emote_name and sentiment_score:
                         try:
-                            emote_sentiment_scores[emote_name] = float(sentiment_score)
+                            scores[emote_name] = float(sentiment_score)
                         except ValueError:
                             logger.warning(f"Invalid sentiment score for emote {emote_name}: {sentiment_score}")
-            logger.info(f"Loaded {len(emote_sentiment_scores)} emote sentiment scores from CSV")
+            logger.info(f"Loaded {len(scores)} emote sentiment scores from CSV")
         else:
-            logger.warning(f"Emote sentiment scores CSV file not found at {EMOJI_SENTIMENT_CSV}")
+            logger.warning(f"Emote sentiment scores CSV file not found at {path}")
     except Exception as e:
         logger.error(f"Error loading emote sentiment scores: {e}")
-
-# Load emote sentiment scores when module is loaded
-load_emote_sentiment_scores()
-
-def reload_emote_sentiment_scores():
-    """Reloads emote sentiment scores from CSV file.
-    Can be called to update scores at runtime without restarting application.
-    Returns: Number of loaded emotes.
+    return EmoteScoreTable(scores)
+
+def install_emote_score_table(table: EmoteScoreTable):
+    """Makes `table` the current score table (a single reference swap)."""
+    global emote_score_table
+    emote_score_table = table
+    if keyword_engine is not None:
+        keyword_engine.set_skip_words(table.scores)
+
+def get_emote_score_table() -> EmoteScoreTable:
+    return emote_score_table
+
+def reload_emote_sentiment_scores() -> EmoteScoreTable:
+    """Reloads emote sentiment scores from the CSV file.
+    Can be called to update scores at runtime without restarting application; the
+    new table is built on the side and swapped in, so concurrent readers never see
+    a partial table. Returns: The new table.
     """
-    old_count = len(emote_sentiment_scores)
-    # Clear existing scores first
-    emote_sentiment_scores.clear()
-    # Reload from file
-    load_emote_sentiment_scores()
-    new_count = len(emote_sentiment_scores)
-    logger.info(f"Reloaded emoji sentiment scores: {old_count} -> {new_count} emotes")
-    return new_count
-
-# Ensure this directory exists
-if not os.path.exists(NLTK_DATA_DIR):
-    try:
-        os.makedirs(NLTK_DATA_DIR)
-        logger.info(f"Created NLTK data directory: {NLTK_DATA_DIR}")
-    except OSError as e:
-        logger.error(f"Could not create NLTK data directory {NLTK_DATA_DIR}: {e}")
-        # Proceed, but download might fail if directory is needed and couldn't be created
+    old_table = emote_score_table
+    new_table = load_emote_score_table()
+    install_emote_score_table(new_table)
+    logger.info(f"Reloaded emoji sentiment scores: {len(old_table)} -> {len(new_table)} emotes "
+                f"(version {old_table.version} -> {new_table.version})")
+    return new_table
+
+_last_sync_request: Optional[str] = None
+
+def sync_emote_score_table(version: str) -> EmoteScoreTable:
+    """Used by NLP pool workers: reloads the CSV if the caller's table version differs.
+    Tried once per requested version; if the CSV has changed again in the meantime the
+    worker keeps its own table (and reports its version) until the next reload.
+    """
+    global _last_sync_request
+    if emote_score_table.version != version and version != _last_sync_request:
+        _last_sync_request = version
+        install_emote_score_table(load_emote_score_table())
+    return emote_score_table
+
+def configure_nltk_data_path():
+    import nltk
+    # Ensure this directory exists
+    if not os.path.exists(NLTK_DATA_DIR):
+        try:
+            os.makedirs(NLTK_DATA_DIR)
+            logger.info(f"Created NLTK data directory: {NLTK_DATA_DIR}")
+        except OSError as e:
+            logger.error(f"Could not create NLTK data directory {NLTK_DATA_DIR}: {e}")
+            # Proceed, but download might fail if directory is needed and couldn't be created
 
-# Add the local directory to NLTK's data path *before* trying to download or find
-if NLTK_DATA_DIR not in nltk.data.path:
-    nltk.data.path.append(NLTK_DATA_DIR)
-    logger.info(f"Appended local path to NLTK data search paths: {NLTK_DATA_DIR}")
+    # Add the local directory to NLTK's data path *before* trying to download or find
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.append(NLTK_DATA_DIR)
+        logger.info(f"Appended local path to NLTK data search paths: {NLTK_DATA_DIR}")
 
 # Check and download NLTK data if missing
 def download_nltk_data():
+    import nltk
     required_packages = ['punkt', 'averaged_perceptron_tagger', 'stopwords', 'wordnet', 'omw-1.4']
     download_needed = False
     for package_id in required_packages:
@@ -110,34 +180,130 @@ def download_nltk_data():
         logger.info("All required NLTK data packages found (likely in search paths).")
         return True
 
-# Run the download check when the module is loaded
-NLTK_DATA_READY = download_nltk_data()
-
-# --- Initialization (Continues after check/download attempt) --- 
+# --- NLP Resources --- 
+# Populated by init_nlp_resources(), not at import time
+NLTK_DATA_READY = False
+vader_analyzer: Optional[SentimentIntensityAnalyzer] = None
+lemmatizer = None # nltk WordNetLemmatizer
+stop_words: Set[str] = set()
+pos_tagger = None # nltk PerceptronTagger
+
+# --- Token Score Cache ---
+# Maximum number of tokens outside the precomputed table kept in the LRU
+TOKEN_SCORE_CACHE_SIZE = 8192
+
+class TokenScoreCache:
+    """Per-token sentiment scores used for the word breakdown in analyze_sentiment.
+
+    On its own, a plain alphabetic token scores exactly its normalized VADER lexicon
+    valence (0 for booster words), so those scores are precomputed once. Tokens that
+    VADER treats specially (emoticons, emoji, punctuation) are scored by VADER the
+    first time they are seen and kept in a bounded LRU.
+    Emote scores from the CSV are looked up in the EmoteScoreTable instead.
+    """
 
-# Initialize VADER sentiment analyzer
-vader_analyzer = SentimentIntensityAnalyzer()
+    def __init__(self, analyzer: SentimentIntensityAnalyzer, max_unseen: int = TOKEN_SCORE_CACHE_SIZE):
+        self._analyzer = analyzer
+        # Lowercased lexicon word -> rounded compound score (neutral words left out)
+        self._lexicon_scores: Dict[str, float] = {}
+        for word, valence in analyzer.lexicon.items():
+            if word in BOOSTER_DICT:
+                continue # Boosters have no valence on their own
+            score = normalize(valence)
+            if score != 0.0:
+                self._lexicon_scores[word] = round(score, 3)
+        self._unseen_score = lru_cache(maxsize=max_unseen)(self._vader_token_score)
+
+    def _vader_token_score(self, word: str) -> float:
+        return round(self._analyzer.polarity_scores(word)['compound'], 3)
+
+    def vader_score(self, word: str, folded_word: Optional[str] = None) -> float:
+        """Returns VADER's compound score for a single token, as polarity_scores(word) would."""
+        if word.isalpha():
+            return self._lexicon_scores.get(folded_word if folded_word is not None else word.lower(), 0.0)
+        return self._unseen_score(word)
+
+token_score_cache: Optional[TokenScoreCache] = None
+# Vectorized batch scorer; None if NumPy is missing or SENTIMENT_ENGINE=vader
+sentiment_scorer: Optional[BatchSentimentScorer] = None
+# Batched, memoized keyword extraction; None if the NLTK data is missing
+keyword_engine: Optional[KeywordEngine] = None
+
+# --- Deferred Initialization --- 
+# Loading runs once, either in the background on application startup or on first use.
+_init_lock = threading.Lock()
+_nlp_ready = threading.Event()
+nlp_init_seconds: Optional[float] = None
+
+def _load_nltk_resources():
+    global NLTK_DATA_READY, lemmatizer, stop_words, pos_tagger
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    configure_nltk_data_path()
+    NLTK_DATA_READY = download_nltk_data()
+
+    # Initialize NLTK components (lemmatizer, stopwords)
+    lemmatizer = WordNetLemmatizer()
+    try:
+        # This should now hopefully find the data in NLTK_DATA_DIR if downloaded
+        stop_words = set(stopwords.words('english'))
+    except LookupError:
+        logger.error("NLTK stopwords lookup failed EVEN AFTER check/download attempt.")
+        logger.error("Verify the NLTK_DATA_DIR and permissions.")
+        stop_words = set() # Fallback to empty set
+    if NLTK_DATA_READY:
+        pos_tagger = load_pos_tagger()
 
-# Initialize NLTK components (lemmatizer, stopwords)
-lemmatizer = WordNetLemmatizer()
-try:
-    # This should now hopefully find the data in NLTK_DATA_DIR if downloaded
-    stop_words = set(stopwords.words('english'))
-except LookupError:
-    logger.error("NLTK stopwords lookup failed EVEN AFTER check/download attempt.")
-    logger.error("Verify the NLTK_DATA_DIR and permissions.")
-    stop_words = set() # Fallback to empty set
+def _load_vader():
+    global vader_analyzer
+    vader_analyzer = SentimentIntensityAnalyzer()
 
-# Define relevant POS tags for keywords (Nouns, Proper Nouns)
-KEYWORD_POS_TAGS = {'NN', 'NNS', 'NNP', 'NNPS'}
+def init_nlp_resources() -> float:
+    """Loads the emote CSV, NLTK data and VADER lexicon, in parallel.
+    Safe to call from several threads; only the first call does the work.
+    Returns: Seconds the initialization took.
+    """
+    global token_score_cache, sentiment_scorer, keyword_engine, nlp_init_seconds
+    with _init_lock:
+        if _nlp_ready.is_set():
+            return nlp_init_seconds
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="nlp-init") as pool:
+            table_future = pool.submit(load_emote_score_table)
+            futures = [
+                table_future,
+                pool.submit(_load_nltk_resources),
+                pool.submit(_load_vader)
+            ]
+            for future in futures:
+                future.result() # Re-raise failures; a later call will retry
+        token_score_cache = TokenScoreCache(vader_analyzer)
+        sentiment_scorer = create_sentiment_scorer(vader_analyzer, token_score_cache.vader_score)
+        if pos_tagger is not None:
+            # Emote names are reported as emotes, so they're kept out of the keywords
+            keyword_engine = KeywordEngine(pos_tagger, lemmatizer.lemmatize, stop_words)
+        install_emote_score_table(table_future.result())
+        nlp_init_seconds = time.perf_counter() - start
+        _nlp_ready.set()
+        logger.info(f"NLP resources ready in {nlp_init_seconds * 1000:.0f} ms")
+        return nlp_init_seconds
+
+def ensure_nlp_ready():
+    """Blocks until NLP resources are loaded, loading them if nobody has yet."""
+    if not _nlp_ready.is_set():
+        init_nlp_resources()
+
+def is_nlp_ready() -> bool:
+    return _nlp_ready.is_set()
 
 # --- Functions --- 
 
-def analyze_sentiment(text: str) -> Tuple[Optional[float], Dict[str, float]]:
+def analyze_sentiment(text: str, score_table: Optional[EmoteScoreTable] = None) -> Tuple[Optional[float], Dict[str, float]]:
     """Analyzes the sentiment of a text string using VADER and returns word scores.
 
     Args:
         text: The input text.
+        score_table: Emote score table to use; defaults to the current one.
 
     Returns:
         A tuple containing:
@@ -147,42 +313,42 @@ def analyze_sentiment(text: str) -> Tuple[Optional[float], Dict[str, float]]:
     """
     if not text:
         return 0.0, {}
+    ensure_nlp_ready()
+    if score_table is None:
+        score_table = emote_score_table # One read; reloads swap the table, never mutate it
 
     word_scores: Dict[str, float] = {}
     compound_score: Optional[float] = None
-    words_in_text = text.split()
+    # Each word is lower-cased once, for both the emote and the lexicon lookup
+    words_in_text = [(word, word.lower()) for word in text.split()]
 
     # 1. Check for emotes from our CSV and assign their scores first
     found_csv_emotes = False
-    for word in words_in_text:
+    for word, folded_word in words_in_text:
         # Check original case and lower case for emotes
-        if word in emote_sentiment_scores:
-            word_scores[word] = emote_sentiment_scores[word]
+        emote_score = score_table.lookup(word, folded_word)
+        if emote_score is not None:
+            word_scores[word] = emote_score
             found_csv_emotes = True
-        elif word.lower() in emote_sentiment_scores:
-             word_scores[word] = emote_sentiment_scores[word.lower()]
-             found_csv_emotes = True
 
     # 2. Use VADER for the whole text to get compound score and initial word breakdown
     try:
-        vs = vader_analyzer.polarity_scores(text)
-        compound_score = round(vs['compound'], 3)
+        if found_csv_emotes:
+            # CSV emotes contribute their own scores to the compound score (see sentiment_engine)
+            compound_score = round(vader_compound(vader_analyzer, text, score_table.lookup), 3)
+        else:
+            vs = vader_analyzer.polarity_scores(text)
+            compound_score = round(vs['compound'], 3)
 
-        # 3. Extract VADER scores for non-emote words (Simplified Approach)
+        # 3. Look up precomputed VADER scores for non-emote words (Simplified Approach)
         # Get scores for words NOT already scored as emotes
         # This ignores VADER's context handling but gives individual word polarity
-        for word in words_in_text:
-            if word not in word_scores and word.lower() not in word_scores:
-                word_vs = vader_analyzer.polarity_scores(word)
+        for word, folded_word in words_in_text:
+            if word not in word_scores and folded_word not in word_scores:
+                word_score = token_score_cache.vader_score(word, folded_word)
                 # We only store non-neutral scores to highlight impactful words
-                if word_vs['compound'] != 0.0:
-                    word_scores[word] = round(word_vs['compound'], 3)
-                    
-        # --- Refinement for Emote Blending (Not currently implemented) --- 
-        # If we found CSV emotes, we could re-calculate the compound score
-        # by blending VADER's score with the CSV emote scores. 
-        # For simplicity, we return VADER's compound score for the whole text 
-        # and the word_scores dictionary which prioritizes CSV emotes.
+                if word_score != 0.0:
+                    word_scores[word] = word_score
 
     except Exception as e:
         logger.error(f"Error during VADER sentiment analysis for text '{text[:50]}...': {e}")
@@ -191,12 +357,26 @@ def analyze_sentiment(text: str) -> Tuple[Optional[float], Dict[str, float]]:
 
     return compound_score, word_scores
 
+def analyze_sentiment_batch(texts: List[str], score_table: Optional[EmoteScoreTable] = None) -> List[Tuple[Optional[float], Dict[str, float]]]:
+    """analyze_sentiment for a batch of messages, in input order. Uses the vectorized
+    scorer if available, which returns the same results (compound scores up to float
+    rounding) at a fraction of the cost per message.
+    """
+    ensure_nlp_ready()
+    if score_table is None:
+        score_table = emote_score_table
+    if sentiment_scorer is None or not texts:
+        return [analyze_sentiment(text, score_table) for text in texts]
+    return sentiment_scorer.analyze_batch(texts, score_table)
+
 def analyze_emote_sentiment(text: str) -> float | None:
     """DEPRECATED (sentiment analysis now integrated). Checks text for emotes and returns score."""
+    ensure_nlp_ready()
     # Trim whitespace and check if the text is a single emote
     text = text.strip()
-    if text in emote_sentiment_scores:
-        return emote_sentiment_scores[text]
+    table = emote_score_table
+    if text in table:
+        return table.get(text)
     
     # No emotes found or single word that's not an emote
     return None
@@ -211,16 +391,34 @@ def extract_keywords(text: str, max_keywords: int = 5) -> List[str]:
     Returns:
         A list of keywords (lemmatized nouns).
     """
+    return extract_keywords_batch([text], max_keywords)[0]
+
+def extract_keywords_batch(texts: List[str], max_keywords: int = 5) -> List[List[str]]:
+    """Extracts keywords for a batch of messages with the memoized keyword engine.
+    Returns one keyword list per input text, in order.
+    """
+    ensure_nlp_ready()
+    if not NLTK_DATA_READY or keyword_engine is None:
+        logger.warning("NLTK data not ready, skipping keyword extraction.")
+        return [[] for _ in texts]
+    return keyword_engine.extract_batch(texts, max_keywords)
+
+def extract_keywords_nltk(text: str, max_keywords: int = 5) -> List[str]:
+    """Reference implementation: tags and lemmatizes every message from scratch.
+    Kept to check and benchmark the keyword engine against.
+    """
+    ensure_nlp_ready()
     if not NLTK_DATA_READY:
         logger.warning("NLTK data not ready, skipping keyword extraction.")
         return []
 
     try:
+        import nltk
         # Tokenize using VADER's method for better consistency (handles punctuation, case)
         # Directly using text.split() might be too naive for POS tagging
         # Alternative: Use nltk.word_tokenize if vader method is inaccessible/complex
         # For now, using simple split and lowercasing, acknowledging limitations
-        tokens = [word.lower() for word in text.split() if word.isalpha()] # Basic tokenization
+        tokens = tokenize_for_keywords(text) # Basic tokenization
 
         # Remove stopwords
         filtered_tokens = [w for w in tokens if not w in stop_words]
@@ -247,7 +445,7 @@ def extract_keywords(text: str, max_keywords: int = 5) -> List[str]:
 
 # --- Example Usage --- 
 if __name__ == "__main__":
-    # The download check now runs automatically when the script starts
+    init_nlp_resources()
 
     test_texts = [
         "This game is amazing and fun! Really enjoying the stream. LUL",
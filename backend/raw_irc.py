@@ -0,0 +1,310 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import aiohttp
+from datetime import datetime, timezone
+from typing import Dict, Set, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Twitch chat over WebSocket, as twitchio connects to it
+DEFAULT_IRC_URL = "wss://irc-ws.chat.twitch.tv:443"
+# Seconds to wait before reconnecting after the connection dropped
+IRC_RECONNECT_DELAY = float(os.getenv("IRC_RECONNECT_DELAY", "2"))
+# A JOIN that is not confirmed within this many seconds counts as failed
+IRC_JOIN_TIMEOUT = float(os.getenv("IRC_JOIN_TIMEOUT", "15"))
+# WebSocket ping interval; a connection that stops answering is reconnected
+IRC_HEARTBEAT_SECONDS = 30.0
+
+# Message tags (emotes, timestamps) and Twitch's own commands (RECONNECT, NOTICE)
+CAPABILITIES = "twitch.tv/tags twitch.tv/commands"
+# Any password works for anonymous (justinfan) logins
+ANONYMOUS_PASS = "SCHMOOPIIE"
+LOGIN_FAILURE_NOTICES = ("Login unsuccessful", "Login authentication failed", "Improperly formatted auth")
+
+class IrcLoginError(Exception):
+    """Twitch rejected the login (bad or expired token)."""
+
+# --- Parsing ---
+
+_TAG_ESCAPE = re.compile(r"\\(.?)")
+_TAG_UNESCAPED = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+def unescape_tag_value(value: str) -> str:
+    """Undoes IRCv3 tag value escaping (\\s for a space, \\: for a semicolon, ...)."""
+    if "\\" not in value:
+        return value
+    return _TAG_ESCAPE.sub(lambda match: _TAG_UNESCAPED.get(match.group(1), match.group(1)), value)
+
+def parse_tags(tags: str) -> Dict[str, str]:
+    """Parses an IRCv3 tag section (without the leading '@')."""
+    parsed: Dict[str, str] = {}
+    for tag in tags.split(";"):
+        key, _, value = tag.partition("=")
+        if key:
+            parsed[key] = unescape_tag_value(value)
+    return parsed
+
+class ChatLine:
+    """One PRIVMSG, parsed only as far as it is read.
+
+    parse_privmsg() finds the channel, author and text with a few string searches.
+    The tags are parsed (and unescaped) on first access of `tags`; `tag()` reads a
+    single one without parsing the others.
+    """
+    __slots__ = ('line', 'channel', 'author', 'content', '_tags_end', '_tags')
+
+    def __init__(self, line: str, channel: str, author: str, content: str, tags_end: int):
+        self.line = line
+        self.channel = channel
+        self.author = author # Login name, from the message prefix
+        self.content = content
+        self._tags_end = tags_end # Index of the space after the tags, 0 if there are none
+        self._tags: Optional[Dict[str, str]] = None
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        if self._tags is None:
+            self._tags = parse_tags(self.line[1:self._tags_end]) if self._tags_end else {}
+        return self._tags
+
+    def tag(self, key: str) -> Optional[str]:
+        if self._tags is not None or not self._tags_end:
+            return self.tags.get(key)
+        line, end = self.line, self._tags_end
+        prefix = f"{key}="
+        if line.startswith(prefix, 1):
+            start = 1 + len(prefix)
+        else:
+            start = line.find(f";{prefix}", 0, end)
+            if start < 0:
+                return None
+            start += 1 + len(prefix)
+        value_end = line.find(";", start, end)
+        return unescape_tag_value(line[start:value_end if value_end >= 0 else end])
+
+    @property
+    def timestamp(self) -> datetime:
+        """When Twitch received the message (`tmi-sent-ts`), as a naive UTC datetime like twitchio's."""
+        try:
+            seconds = int(self.tag("tmi-sent-ts")) / 1000
+        except (TypeError, ValueError):
+            seconds = time.time()
+        return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+def parse_privmsg(line: str) -> Optional[ChatLine]:
+    """The ChatLine of a PRIVMSG line (`@tags :nick!user@host PRIVMSG #channel :text`), None for other lines."""
+    tags_end = 0
+    position = 0
+    if line.startswith("@"):
+        tags_end = line.find(" ")
+        if tags_end < 0:
+            return None
+        position = tags_end + 1
+    if not line.startswith(":", position):
+        return None
+    prefix_end = line.find(" ", position)
+    if prefix_end < 0 or not line.startswith("PRIVMSG #", prefix_end + 1):
+        return None
+    channel_start = prefix_end + 10
+    channel_end = line.find(" ", channel_start)
+    if channel_end < 0:
+        return None
+    content_start = channel_end + 2 if line.startswith(":", channel_end + 1) else channel_end + 1
+    content = line[content_start:]
+    if content.startswith("\x01ACTION ") and content.endswith("\x01"):
+        content = content[8:-1] # /me message; emote offsets refer to the text inside
+    author_end = line.find("!", position, prefix_end)
+    author = line[position + 1:author_end if author_end >= 0 else prefix_end]
+    return ChatLine(line, line[channel_start:channel_end], author, content, tags_end)
+
+def _command(line: str) -> List[str]:
+    """[prefix, command, params...] of a non-PRIVMSG line, tags dropped; the trailing
+    parameter (after ' :') is kept whole."""
+    if line.startswith("@"):
+        line = line.partition(" ")[2]
+    prefix = ""
+    if line.startswith(":"):
+        prefix, _, line = line[1:].partition(" ")
+    line, separator, trailing = line.partition(" :")
+    parts = [prefix] + line.split()
+    if separator:
+        parts.append(trailing)
+    return parts
+
+# --- Client ---
+
+class RawIrcConnection:
+    """Minimal Twitch chat client: IRCv3 over WebSocket, without twitchio's per-line
+    parsing and Message/Chatter/Channel objects.
+
+    Only PRIVMSG, PING, RECONNECT, the welcome (001), JOIN confirmations and login
+    NOTICEs are looked at; every other line is dropped after a prefix check. Each
+    PRIVMSG is handed to `event_chat_line` as a ChatLine in its own task, as twitchio
+    dispatches its events. Reconnects after the connection drops; `event_ready` runs
+    after every login, so subclasses rejoin their channels there.
+    """
+
+    def __init__(self, nick: str, token: str = "", url: str = DEFAULT_IRC_URL, name: str = "irc"):
+        self.nick = nick.lower()
+        self.token = token[6:] if token.startswith("oauth:") else token
+        self.url = url
+        self.name = name
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._closing = False
+        self._tasks: Set[asyncio.Task] = set()
+        self._join_timeouts: Dict[str, asyncio.TimerHandle] = {}
+        # Counters
+        self.lines = 0
+        self.chat_lines = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    # --- Events (overridden by subclasses) ---
+
+    async def event_ready(self):
+        pass
+
+    async def event_chat_line(self, line: ChatLine):
+        pass
+
+    async def event_channel_joined(self, channel: str):
+        pass
+
+    async def event_channel_join_failure(self, channel: str):
+        pass
+
+    async def event_error(self, error: Exception, data: Optional[str] = None):
+        logger.error(f"IRC error on {self.name}: {error}")
+
+    async def event_close(self):
+        pass
+
+    # --- Connection ---
+
+    async def start(self):
+        """Connects and reads chat until close(), reconnecting whenever the connection drops."""
+        self._session = aiohttp.ClientSession()
+        try:
+            while not self._closing:
+                try:
+                    self._ws = await self._session.ws_connect(self.url, heartbeat=IRC_HEARTBEAT_SECONDS)
+                except (aiohttp.ClientError, OSError) as e:
+                    logger.error(f"IRC connection to {self.url} failed on {self.name}: {e}")
+                    await asyncio.sleep(IRC_RECONNECT_DELAY)
+                    continue
+                try:
+                    # The connection can already drop here; that too ends in a reconnect
+                    await self._send(
+                        f"CAP REQ :{CAPABILITIES}",
+                        f"PASS oauth:{self.token}" if self.token else f"PASS {ANONYMOUS_PASS}",
+                        f"NICK {self.nick}"
+                    )
+                    async for message in self._ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self._handle_frame(message.data)
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            break
+                except Exception as e:
+                    logger.error(f"IRC connection on {self.name} failed: {e}", exc_info=True)
+                await self._ws.close()
+                self._clear_join_timeouts()
+                await self.event_close()
+                if not self._closing:
+                    await asyncio.sleep(IRC_RECONNECT_DELAY)
+        finally:
+            await self._session.close()
+            self._session = None
+
+    async def close(self):
+        self._closing = True
+        self._clear_join_timeouts()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def _send(self, *lines: str):
+        if self.connected:
+            await self._ws.send_str("".join(f"{line}\r\n" for line in lines))
+
+    async def join_channels(self, channels: List[str]):
+        channels = [channel.lower() for channel in channels]
+        if not channels or not self.connected:
+            return
+        loop = asyncio.get_running_loop()
+        for channel in channels:
+            if channel in self._join_timeouts:
+                self._join_timeouts[channel].cancel()
+            self._join_timeouts[channel] = loop.call_later(IRC_JOIN_TIMEOUT, self._join_timed_out, channel)
+        await self._send("JOIN " + ",".join(f"#{channel}" for channel in channels))
+
+    async def part_channels(self, channels: List[str]):
+        for channel in channels:
+            timeout = self._join_timeouts.pop(channel.lower(), None)
+            if timeout is not None:
+                timeout.cancel()
+        if channels:
+            await self._send("PART " + ",".join(f"#{channel.lower()}" for channel in channels))
+
+    def _join_timed_out(self, channel: str):
+        del self._join_timeouts[channel]
+        self._spawn(self.event_channel_join_failure(channel))
+
+    def _clear_join_timeouts(self):
+        for timeout in self._join_timeouts.values():
+            timeout.cancel()
+        self._join_timeouts.clear()
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"IRC event handler on {self.name} failed: {task.exception()}", exc_info=task.exception())
+
+    # --- Incoming Lines ---
+
+    def _handle_frame(self, data: str):
+        for line in data.split("\r\n"):
+            if not line:
+                continue
+            self.lines += 1
+            chat_line = parse_privmsg(line)
+            if chat_line is not None:
+                self.chat_lines += 1
+                self._spawn(self.event_chat_line(chat_line))
+            else:
+                self._handle_command(line)
+
+    def _handle_command(self, line: str):
+        parts = _command(line)
+        command = parts[1] if len(parts) > 1 else ""
+        if command == "PING":
+            self._spawn(self._send(f"PONG :{parts[-1] if len(parts) > 2 else 'tmi.twitch.tv'}"))
+        elif command == "001":
+            logger.info(f"Logged into Twitch IRC as {self.nick} on {self.name}")
+            self._spawn(self.event_ready())
+        elif command == "JOIN" and len(parts) > 2:
+            if parts[0].partition("!")[0] == self.nick:
+                channel = parts[2].lstrip("#")
+                timeout = self._join_timeouts.pop(channel, None)
+                if timeout is not None:
+                    timeout.cancel()
+                self._spawn(self.event_channel_joined(channel))
+        elif command == "RECONNECT":
+            logger.info(f"Twitch asked {self.name} to reconnect")
+            self._spawn(self._ws.close())
+        elif command == "NOTICE" and any(notice in parts[-1] for notice in LOGIN_FAILURE_NOTICES):
+            self._closing = True # Retrying with the same token would fail the same way
+            self._spawn(self.event_error(IrcLoginError(parts[-1]), line))
+            self._spawn(self._ws.close())
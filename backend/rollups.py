@@ -0,0 +1,385 @@
+import os
+import json
+import math
+import time
+import bisect
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Optional, Tuple, Iterable
+
+from chat_store import _safe_channel
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Emotes/keywords kept per stored bucket (the long tail is dropped when a bucket is written)
+ROLLUP_MINUTE_TOP_ITEMS = int(os.getenv("ROLLUP_MINUTE_TOP_ITEMS", "50"))
+ROLLUP_HOUR_TOP_ITEMS = int(os.getenv("ROLLUP_HOUR_TOP_ITEMS", "200"))
+# A bucket is written out this many seconds after it ends, to catch late messages
+ROLLUP_FLUSH_DELAY = float(os.getenv("ROLLUP_FLUSH_DELAY", "5"))
+
+# --- Rollup Files ---
+# Next to a channel's chat segments (`<dir>/<channel>/`), one JSON object per line:
+#   minutes.jsonl, hours.jsonl: {"t": bucket start (unix s), "n": messages,
+#       "first"/"last": first and last message time,
+#       "s_sum": sentiment sum, "s_n": messages with a sentiment, "pos"/"neg": positive and
+#       negative messages, "emotes": {name: count}, "keywords": {word: count}}
+#   Sentiment and keyword figures of messages analyzed while analysis was sampled under
+#   load are weighted by 1 / sample rate, so they may be fractional.
+#   sessions.jsonl: {"start": unix s, "end": unix s, "messages": count}
+# Lines are only appended. A bucket that received messages after it was written appears
+# again with just the late messages; readers add rows with the same "t" together.
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = {"minute": MINUTE, "hour": HOUR}
+ROLLUP_FILES = {MINUTE: "minutes.jsonl", HOUR: "hours.jsonl"}
+SESSIONS_FILE = "sessions.jsonl"
+
+# Same thresholds the frontend uses to call a message positive or negative
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+def _compact_number(value: float):
+    """Ints stay ints; weighted counts are rounded."""
+    return value if isinstance(value, int) else round(value, 2)
+
+class RollupBucket:
+    """Aggregates of one channel's messages in one minute or hour."""
+    __slots__ = ('t', 'n', 'first', 'last', 's_sum', 's_n', 'pos', 'neg', 'emotes', 'keywords')
+
+    def __init__(self, t: int):
+        self.t = t
+        self.n = 0
+        self.first = float("inf")
+        self.last = float("-inf")
+        self.s_sum = 0.0
+        self.s_n = 0
+        self.pos = 0
+        self.neg = 0
+        self.emotes: Counter = Counter()
+        self.keywords: Counter = Counter()
+
+    def add(self, timestamp: float, sentiment_score: Optional[float], emotes: Iterable[str],
+            keywords: Iterable[str], weight: float = 1.0):
+        self.n += 1
+        self.first = min(self.first, timestamp)
+        self.last = max(self.last, timestamp)
+        if sentiment_score is not None:
+            self.s_sum += sentiment_score * weight
+            self.s_n += weight
+            if sentiment_score >= POSITIVE_THRESHOLD:
+                self.pos += weight
+            elif sentiment_score <= NEGATIVE_THRESHOLD:
+                self.neg += weight
+        self.emotes.update(emotes)
+        if weight == 1.0:
+            self.keywords.update(keywords)
+        else:
+            for keyword in keywords:
+                self.keywords[keyword] += weight
+
+    def merge(self, other: "RollupBucket"):
+        self.n += other.n
+        self.first = min(self.first, other.first)
+        self.last = max(self.last, other.last)
+        self.s_sum += other.s_sum
+        self.s_n += other.s_n
+        self.pos += other.pos
+        self.neg += other.neg
+        self.emotes.update(other.emotes)
+        self.keywords.update(other.keywords)
+
+    def to_row(self, top_items: Optional[int] = None) -> dict:
+        return {
+            "t": self.t, "n": self.n, "first": round(self.first, 3), "last": round(self.last, 3),
+            "s_sum": round(self.s_sum, 4), "s_n": _compact_number(self.s_n),
+            "pos": _compact_number(self.pos), "neg": _compact_number(self.neg),
+            "emotes": dict(self.emotes.most_common(top_items)),
+            "keywords": {word: _compact_number(count) for word, count in self.keywords.most_common(top_items)}
+        }
+
+    @classmethod
+    def from_row(cls, row: dict) -> "RollupBucket":
+        bucket = cls(int(row["t"]))
+        bucket.n = row.get("n", 0)
+        bucket.first = row.get("first", bucket.t)
+        bucket.last = row.get("last", bucket.t)
+        bucket.s_sum = row.get("s_sum", 0.0)
+        bucket.s_n = row.get("s_n", 0)
+        bucket.pos = row.get("pos", 0)
+        bucket.neg = row.get("neg", 0)
+        bucket.emotes = Counter(row.get("emotes") or {})
+        bucket.keywords = Counter(row.get("keywords") or {})
+        return bucket
+
+def _channel_dir(directory: str, channel: str) -> str:
+    return os.path.join(directory, _safe_channel(channel))
+
+def _append_lines(path: str, rows: List[dict]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows))
+
+# --- Building ---
+
+class _ChannelRollups:
+    __slots__ = ('buckets', 'session_start', 'session_end', 'session_messages')
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[int, int], RollupBucket] = {} # (size, t) -> open bucket
+        self.session_start: Optional[float] = None
+        self.session_end = 0.0
+        self.session_messages = 0
+
+class RollupBuilder:
+    """Maintains a channel's minute and hour rollups as messages come in.
+
+    add() updates the open buckets in memory; flush() appends buckets that ended at
+    least `flush_delay` seconds ago to the rollup files. Meant to be driven by the chat
+    recorder's writer thread, but every method is thread-safe so queries can read the
+    open buckets.
+    """
+
+    def __init__(self, directory: str, flush_delay: float = ROLLUP_FLUSH_DELAY):
+        self.directory = directory
+        self.flush_delay = flush_delay
+        self._channels: Dict[str, _ChannelRollups] = {}
+        self._lock = threading.Lock()
+        self.rows_written = 0
+
+    def add(self, channel: str, timestamp: float, sentiment_score: Optional[float],
+            emotes: Iterable[str], keywords: Iterable[str], sample_rate: float = 1.0):
+        emotes = list(emotes)
+        keywords = list(keywords)
+        weight = 1.0 / sample_rate if sample_rate > 0 else 1.0
+        channel = _safe_channel(channel)
+        with self._lock:
+            state = self._channels.get(channel)
+            if state is None:
+                state = self._channels[channel] = _ChannelRollups()
+            for size in (MINUTE, HOUR):
+                t = int(timestamp // size) * size
+                bucket = state.buckets.get((size, t))
+                if bucket is None:
+                    bucket = state.buckets[(size, t)] = RollupBucket(t)
+                bucket.add(timestamp, sentiment_score, emotes, keywords, weight)
+            if state.session_start is None:
+                state.session_start = timestamp
+            state.session_end = max(state.session_end, timestamp)
+            state.session_messages += 1
+
+    def flush(self, now: Optional[float] = None):
+        """Writes out (and forgets) every bucket that ended before now - flush_delay."""
+        cutoff = (time.time() if now is None else now) - self.flush_delay
+        pending: Dict[str, Dict[int, List[dict]]] = {}
+        with self._lock:
+            for channel, state in self._channels.items():
+                for (size, t), bucket in list(state.buckets.items()):
+                    if t + size <= cutoff:
+                        del state.buckets[(size, t)]
+                        top = ROLLUP_MINUTE_TOP_ITEMS if size == MINUTE else ROLLUP_HOUR_TOP_ITEMS
+                        pending.setdefault(channel, {}).setdefault(size, []).append(bucket.to_row(top))
+        self._write(pending)
+
+    def end_session(self, channel: str):
+        """Closes the channel's current session: writes its open buckets and a sessions.jsonl entry."""
+        channel = _safe_channel(channel)
+        with self._lock:
+            state = self._channels.pop(channel, None)
+        if state is None or state.session_start is None:
+            return
+        pending: Dict[int, List[dict]] = {}
+        for (size, _), bucket in sorted(state.buckets.items()):
+            top = ROLLUP_MINUTE_TOP_ITEMS if size == MINUTE else ROLLUP_HOUR_TOP_ITEMS
+            pending.setdefault(size, []).append(bucket.to_row(top))
+        self._write({channel: pending})
+        session = {"start": round(state.session_start, 3), "end": round(state.session_end, 3),
+                   "messages": state.session_messages}
+        try:
+            _append_lines(os.path.join(_channel_dir(self.directory, channel), SESSIONS_FILE), [session])
+        except OSError as e:
+            logger.error(f"Failed to write session rollup for {channel}: {e}")
+
+    def close(self):
+        for channel in list(self._channels):
+            self.end_session(channel)
+
+    def _write(self, pending: Dict[str, Dict[int, List[dict]]]):
+        for channel, by_size in pending.items():
+            channel_dir = _channel_dir(self.directory, channel)
+            for size, rows in by_size.items():
+                try:
+                    _append_lines(os.path.join(channel_dir, ROLLUP_FILES[size]), rows)
+                    self.rows_written += len(rows)
+                except OSError as e:
+                    logger.error(f"Failed to write {ROLLUP_FILES[size]} for {channel}: {e}")
+
+    def open_buckets(self, channel: str, size: int) -> List[RollupBucket]:
+        """Copies of the channel's not yet written buckets of the given size."""
+        with self._lock:
+            state = self._channels.get(_safe_channel(channel))
+            if state is None:
+                return []
+            copies = []
+            for (bucket_size, _), bucket in state.buckets.items():
+                if bucket_size == size:
+                    copy = RollupBucket(bucket.t)
+                    copy.merge(bucket)
+                    copies.append(copy)
+            return copies
+
+    def open_session(self, channel: str) -> Optional[dict]:
+        with self._lock:
+            state = self._channels.get(_safe_channel(channel))
+            if state is None or state.session_start is None:
+                return None
+            return {"start": round(state.session_start, 3), "end": round(state.session_end, 3),
+                    "messages": state.session_messages, "live": True}
+
+# --- Querying ---
+
+class _RollupFile:
+    """Rows of one rollup file, read incrementally: only lines appended since the last
+    read are parsed."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.buckets: Dict[int, RollupBucket] = {}
+        self.times: List[int] = []
+
+    def refresh(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size < self.offset: # Replaced or truncated
+            self.offset = 0
+            self.buckets.clear()
+        if size == self.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        complete = data.rfind(b"\n") + 1 # A line still being written is read next time
+        for line in data[:complete].splitlines():
+            try:
+                bucket = RollupBucket.from_row(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping bad rollup line in {self.path}: {e}")
+                continue
+            existing = self.buckets.get(bucket.t)
+            if existing is None:
+                self.buckets[bucket.t] = bucket
+            else:
+                existing.merge(bucket)
+        self.offset += complete
+        self.times = sorted(self.buckets)
+
+    def range(self, start: float, end: float) -> List[RollupBucket]:
+        """Buckets with start <= t < end, oldest first."""
+        low = bisect.bisect_left(self.times, start)
+        high = bisect.bisect_left(self.times, end)
+        return [self.buckets[t] for t in self.times[low:high]]
+
+class RollupStore:
+    """Answers history queries from the rollup files (plus the builder's open buckets).
+
+    A range is covered by hour rollups where it spans whole hours and by minute
+    rollups at its edges, so a query touches at most a few hundred rows however long
+    the range is. Times are rounded to whole minutes.
+    """
+
+    def __init__(self, directory: str, builder: Optional[RollupBuilder] = None):
+        self.directory = directory
+        self.builder = builder
+        self._files: Dict[Tuple[str, int], _RollupFile] = {}
+        self._lock = threading.Lock()
+
+    def _buckets(self, channel: str, size: int, start: float, end: float) -> List[RollupBucket]:
+        key = (channel, size)
+        with self._lock:
+            rollup_file = self._files.get(key)
+            if rollup_file is None:
+                rollup_file = self._files[key] = _RollupFile(
+                    os.path.join(_channel_dir(self.directory, channel), ROLLUP_FILES[size]))
+            rollup_file.refresh()
+            buckets = rollup_file.range(start, end)
+        if self.builder is None:
+            return buckets
+        live = [bucket for bucket in self.builder.open_buckets(channel, size) if start <= bucket.t < end]
+        if not live:
+            return buckets
+        merged: Dict[int, RollupBucket] = {}
+        for bucket in buckets + live:
+            existing = merged.get(bucket.t)
+            if existing is None:
+                merged[bucket.t] = copy = RollupBucket(bucket.t)
+                copy.merge(bucket)
+            else:
+                existing.merge(bucket)
+        return [merged[t] for t in sorted(merged)]
+
+    def timeline(self, channel: str, start: float, end: float, resolution: int) -> List[dict]:
+        """Message count, rate and sentiment per bucket of `resolution` seconds."""
+        points = []
+        start = math.floor(start / resolution) * resolution # Include the bucket `start` falls in
+        for bucket in self._buckets(channel, resolution, start, end):
+            points.append({
+                "t": bucket.t,
+                "messages": bucket.n,
+                "messages_per_minute": round(bucket.n * MINUTE / resolution, 2),
+                "sentiment_avg": round(bucket.s_sum / bucket.s_n, 4) if bucket.s_n else None,
+                "positive": round(bucket.pos),
+                "negative": round(bucket.neg)
+            })
+        return points
+
+    def summary(self, channel: str, start: float, end: float, top: int = 10) -> dict:
+        """Totals over [start, end): messages, message rate, sentiment, top emotes and keywords."""
+        start = math.floor(start / MINUTE) * MINUTE
+        end = math.ceil(end / MINUTE) * MINUTE
+        first_hour = math.ceil(start / HOUR) * HOUR
+        last_hour = math.floor(end / HOUR) * HOUR
+        if first_hour < last_hour:
+            buckets = (self._buckets(channel, MINUTE, start, first_hour)
+                       + self._buckets(channel, HOUR, first_hour, last_hour)
+                       + self._buckets(channel, MINUTE, last_hour, end))
+        else:
+            buckets = self._buckets(channel, MINUTE, start, end)
+        total = RollupBucket(int(start))
+        for bucket in buckets:
+            total.merge(bucket)
+        # Rate over the part of the range that has chat, not the idle time around it
+        active_minutes = max(1.0, (total.last - total.first) / MINUTE) if total.n else 0.0
+        return {
+            "start": start,
+            "end": end,
+            "messages": total.n,
+            "messages_per_minute": round(total.n / active_minutes, 2) if active_minutes > 0 else 0.0,
+            "sentiment_avg": round(total.s_sum / total.s_n, 4) if total.s_n else None,
+            "positive": round(total.pos),
+            "negative": round(total.neg),
+            "top_emotes": [{"name": name, "count": count} for name, count in total.emotes.most_common(top)],
+            "top_keywords": [{"keyword": word, "count": round(count)} for word, count in total.keywords.most_common(top)]
+        }
+
+    def sessions(self, channel: str) -> List[dict]:
+        """Recorded sessions of the channel, oldest first, plus the live one if any."""
+        path = os.path.join(_channel_dir(self.directory, channel), SESSIONS_FILE)
+        sessions = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        sessions.append(json.loads(line))
+                    except ValueError:
+                        continue # Line still being written
+        except FileNotFoundError:
+            pass
+        if self.builder is not None:
+            live = self.builder.open_session(channel)
+            if live is not None:
+                sessions.append(live)
+        return sessions
@@ -0,0 +1,357 @@
+import os
+import math
+import string
+import logging
+from typing import List, Dict, Tuple, Optional, Callable, Any
+
+from vaderSentiment.vaderSentiment import (
+    SentimentIntensityAnalyzer, SentiText, BOOSTER_DICT, SPECIAL_CASES, NEGATE, C_INCR, N_SCALAR
+)
+
+# NumPy is optional; without it every message is scored by VADER itself
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# SENTIMENT_ENGINE selects how batches are scored:
+#   "vector" - VADER's rules applied to whole batches with NumPy (default if NumPy is installed)
+#   "vader"  - SentimentIntensityAnalyzer.polarity_scores per message
+SENTIMENT_ENGINE = os.getenv("SENTIMENT_ENGINE", "vector").lower()
+# Distinct tokens the vector engine keeps attributes for; it starts over when full
+SENTIMENT_VOCAB_SIZE = int(os.getenv("SENTIMENT_VOCAB_SIZE", "200000"))
+# Largest difference allowed between the vector engine's compound scores and
+# analyze_sentiment's: one unit of the rounded (3 decimals) score, for float summation
+# order and the double rounding. Checked by `python -m benchmarks.stages`.
+COMPOUND_TOLERANCE = 0.001
+
+# --- Emote Blending ---
+# CSV emote scores are compound-style scores in [-1, 1]. An emote token contributes the
+# VADER valence whose normalized score is the emote's score (so a message of just that
+# emote scores exactly its CSV score), in place of whatever VADER gives that token.
+# VADER's "but" rule and the punctuation emphasis apply to it like to any other token.
+NORMALIZE_ALPHA = 15
+MAX_EMOTE_SCORE = 0.99
+
+def emote_valence(score: float) -> float:
+    score = max(-MAX_EMOTE_SCORE, min(MAX_EMOTE_SCORE, score))
+    return score * math.sqrt(NORMALIZE_ALPHA / (1.0 - score * score))
+
+def replace_emojis(text: str, emojis: Dict[str, str]) -> str:
+    """Replaces emoji with their descriptions, as polarity_scores does."""
+    if text.isascii():
+        return text.strip()
+    parts = []
+    prev_space = True
+    for char in text:
+        description = emojis.get(char)
+        if description is not None:
+            if not prev_space:
+                parts.append(' ')
+            parts.append(description)
+            prev_space = False
+        else:
+            parts.append(char)
+            prev_space = char == ' '
+    return "".join(parts).strip()
+
+def vader_compound(analyzer: SentimentIntensityAnalyzer, text: str,
+                   emote_score: Callable[[str], Optional[float]]) -> float:
+    """polarity_scores(text)['compound'] with emote scores blended in: tokens for which
+    `emote_score` returns a score contribute its valence instead of VADER's."""
+    text = replace_emojis(text, analyzer.emojis)
+    sentitext = SentiText(text)
+    words = sentitext.words_and_emoticons
+    raw_words = text.split() # Same tokens, before punctuation stripping
+    sentiments: List[float] = []
+    for i, item in enumerate(words):
+        score = emote_score(raw_words[i])
+        if score is not None:
+            sentiments.append(emote_valence(score))
+            continue
+        if item.lower() in BOOSTER_DICT:
+            sentiments.append(0)
+            continue
+        if i < len(words) - 1 and item.lower() == "kind" and words[i + 1].lower() == "of":
+            sentiments.append(0)
+            continue
+        sentiments = analyzer.sentiment_valence(0, sentitext, item, i, sentiments)
+    sentiments = analyzer._but_check(words, sentiments)
+    return analyzer.score_valence(sentiments, text)['compound']
+
+# --- Vectorized Scoring ---
+
+# Word classes VADER's rules compare neighbouring words against
+_NO, _OR_NOR, _LEAST, _AT_VERY, _NEVER, _SO_THIS, _WITHOUT, _DOUBT, _BUT = range(1, 10)
+_WORD_CODES = {
+    "no": _NO, "or": _OR_NOR, "nor": _OR_NOR, "least": _LEAST, "at": _AT_VERY, "very": _AT_VERY,
+    "never": _NEVER, "so": _SO_THIS, "this": _SO_THIS, "without": _WITHOUT, "doubt": _DOUBT, "but": _BUT
+}
+# Multi-word idioms and boosters. The few messages containing one are scored by
+# vader_compound, which runs VADER's own idiom checks.
+_PHRASES = tuple(phrase for phrase in list(SPECIAL_CASES) + list(BOOSTER_DICT) if " " in phrase)
+_PHRASE_WORDS = frozenset(word for phrase in _PHRASES for word in phrase.split())
+_NEGATE = frozenset(NEGATE)
+
+def _strip_punctuation(token: str) -> str:
+    stripped = token.strip(string.punctuation)
+    return token if len(stripped) <= 2 else stripped # Short leftovers were emoticons
+
+class BatchSentimentScorer:
+    """Scores batches of messages with VADER's rules, vectorized with NumPy.
+
+    Every distinct token gets an id and its attributes (lexicon valence, booster
+    scalar, ALL CAPS, negation, emote score, ...) once. A batch then becomes one
+    array of token ids, and VADER's per-token rules (negation of the preceding
+    words, "no", boosters and dampeners with their distance discount, ALL CAPS
+    emphasis, "least", "but") are array operations over all of its tokens. Since
+    every rule only reads the attributes of neighbouring tokens, never their
+    valences, no rule depends on another token's result.
+
+    VADER's "but" rule looks valences up by value, so repeated valences are rescaled
+    at the wrong positions; for the messages with a "but", its own _but_check is
+    replayed on the token valences instead. Compound scores equal vader_compound's
+    within COMPOUND_TOLERANCE, the word scores exactly.
+    """
+
+    def __init__(self, analyzer: SentimentIntensityAnalyzer, token_score: Callable[[str, str], float],
+                 max_vocab: int = SENTIMENT_VOCAB_SIZE):
+        if np is None:
+            raise RuntimeError("BatchSentimentScorer needs NumPy")
+        self._analyzer = analyzer
+        self._lexicon = analyzer.lexicon
+        self._token_score = token_score # Per-token score for the word breakdown
+        self.max_vocab = max(1024, max_vocab)
+        self._score_table: Any = None
+        self._reset()
+
+    def _reset(self, capacity: int = 4096):
+        self._ids: Dict[str, int] = {}
+        self._tokens: List[str] = []
+        self._folded: List[str] = []
+        self._emote_scores: List[Optional[float]] = []
+        self._word_scores: List[float] = []
+        self._phrase_words: List[bool] = []
+        self._size = 0
+        self._valence = np.zeros(capacity)
+        self._in_lexicon = np.zeros(capacity, dtype=bool)
+        self._booster = np.zeros(capacity)
+        self._is_booster = np.zeros(capacity, dtype=bool)
+        self._upper = np.zeros(capacity, dtype=bool)
+        self._negation = np.zeros(capacity, dtype=bool)
+        self._code = np.zeros(capacity, dtype=np.int8)
+        self._emote_valence = np.zeros(capacity)
+        self._is_emote = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        capacity = len(self._valence) * 2
+        for name in ('_valence', '_in_lexicon', '_booster', '_is_booster', '_upper',
+                     '_negation', '_code', '_emote_valence', '_is_emote'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _add(self, token: str) -> int:
+        if self._size >= len(self._valence):
+            self._grow()
+        token_id = self._size
+        self._size += 1
+        self._ids[token] = token_id
+        self._tokens.append(token)
+        folded = token.lower()
+        item = _strip_punctuation(token)
+        item_lower = item.lower()
+        self._folded.append(folded)
+        emote_score = self._score_table.lookup(token, folded)
+        self._emote_scores.append(emote_score)
+        self._word_scores.append(self._token_score(token, folded))
+        self._phrase_words.append(item_lower in _PHRASE_WORDS)
+        valence = self._lexicon.get(item_lower)
+        if valence is not None:
+            self._valence[token_id] = valence
+            self._in_lexicon[token_id] = True
+        booster = BOOSTER_DICT.get(item_lower)
+        if booster is not None:
+            self._booster[token_id] = booster
+            self._is_booster[token_id] = True
+        self._upper[token_id] = item.isupper()
+        self._negation[token_id] = item_lower in _NEGATE or "n't" in item_lower
+        self._code[token_id] = _WORD_CODES.get(item_lower, 0)
+        if emote_score is not None:
+            self._emote_valence[token_id] = emote_valence(emote_score)
+            self._is_emote[token_id] = True
+        return token_id
+
+    def _id(self, token: str) -> int:
+        token_id = self._ids.get(token)
+        return token_id if token_id is not None else self._add(token)
+
+    def analyze_batch(self, texts: List[str], score_table: Any) -> List[Tuple[float, Dict[str, float]]]:
+        """(compound score, word scores) for each text, as analyze_sentiment returns them."""
+        if score_table is not self._score_table or self._size >= self.max_vocab:
+            # Emote attributes depend on the table; a new one starts a new vocabulary
+            self._score_table = score_table
+            self._reset()
+        emojis = self._analyzer.emojis
+        token_ids: List[int] = []
+        lengths: List[int] = []
+        amplifiers: List[float] = []
+        results: List[Tuple[float, Dict[str, float]]] = []
+        fallback: List[int] = []
+        for index, text in enumerate(texts):
+            raw_ids = [self._id(token) for token in text.split()]
+            results.append((0.0, self._word_breakdown(raw_ids)))
+            vader_text = replace_emojis(text, emojis)
+            vader_ids = raw_ids if text.isascii() else [self._id(token) for token in vader_text.split()]
+            if sum(self._phrase_words[token_id] for token_id in vader_ids) >= 2 and self._has_phrase(vader_ids):
+                fallback.append(index)
+                vader_ids = []
+            token_ids.extend(vader_ids)
+            lengths.append(len(vader_ids))
+            amplifiers.append(_punctuation_emphasis(vader_text))
+
+        compounds = self._compound_scores(token_ids, lengths, amplifiers)
+        for index, compound in enumerate(compounds):
+            results[index] = (round(compound, 3), results[index][1])
+        for index in fallback:
+            compound = vader_compound(self._analyzer, texts[index], score_table.lookup)
+            results[index] = (round(compound, 3), results[index][1])
+        return results
+
+    def _has_phrase(self, token_ids: List[int]) -> bool:
+        folded = " ".join(_strip_punctuation(self._folded[token_id]) for token_id in token_ids)
+        return any(phrase in folded for phrase in _PHRASES)
+
+    def _word_breakdown(self, token_ids: List[int]) -> Dict[str, float]:
+        """analyze_sentiment's word scores: emotes from the CSV first, then VADER's
+        score of each other word on its own (non-zero ones only)."""
+        if not token_ids:
+            return {}
+        tokens = [self._tokens[token_id] for token_id in token_ids]
+        word_scores: Dict[str, float] = {}
+        for token, token_id in zip(tokens, token_ids):
+            emote_score = self._emote_scores[token_id]
+            if emote_score is not None:
+                word_scores[token] = emote_score
+        for token, token_id in zip(tokens, token_ids):
+            if token not in word_scores and self._folded[token_id] not in word_scores:
+                word_score = self._word_scores[token_id]
+                if word_score != 0.0:
+                    word_scores[token] = word_score
+        return word_scores
+
+    def _compound_scores(self, token_ids: List[int], lengths: List[int], amplifiers: List[float]) -> List[float]:
+        """Compound score per message; `token_ids` holds all messages' tokens back to back."""
+        count = len(lengths)
+        if not token_ids:
+            return [0.0] * count
+        ids = np.array(token_ids, dtype=np.int64)
+        lengths_arr = np.array(lengths, dtype=np.int64)
+        starts = np.cumsum(lengths_arr) - lengths_arr
+        message = np.repeat(np.arange(count), lengths_arr)
+        position = np.arange(len(ids)) - starts[message]
+        message_length = lengths_arr[message]
+
+        lexicon = self._valence[ids]
+        in_lexicon = self._in_lexicon[ids]
+        booster = self._booster[ids]
+        is_booster = self._is_booster[ids]
+        upper = self._upper[ids]
+        negation = self._negation[ids]
+        code = self._code[ids]
+
+        def before(values, distance, fill):
+            shifted = np.full_like(values, fill)
+            shifted[distance:] = values[:-distance]
+            return shifted
+
+        # Some but not all words in ALL CAPS
+        upper_count = np.bincount(message, weights=upper, minlength=count)
+        cap_diff = ((upper_count > 0) & (upper_count < lengths_arr))[message]
+
+        code_1, code_2, code_3 = before(code, 1, 0), before(code, 2, 0), before(code, 3, 0)
+        has_1, has_2, has_3 = position > 0, position > 1, position > 2
+
+        valence = lexicon.copy()
+        # "no" before a lexicon word only negates it
+        next_in_lexicon = np.zeros_like(in_lexicon)
+        next_in_lexicon[:-1] = in_lexicon[1:]
+        valence[(code == _NO) & (position < message_length - 1) & next_in_lexicon] = 0.0
+        after_no = ((has_1 & (code_1 == _NO)) | (has_2 & (code_2 == _NO))
+                    | (has_3 & (code_3 == _NO) & (code_1 == _OR_NOR)))
+        valence = np.where(after_no, lexicon * N_SCALAR, valence)
+        # ALL CAPS emphasis
+        valence = np.where(upper & cap_diff, np.where(valence > 0, valence + C_INCR, valence - C_INCR), valence)
+
+        # Boosters/dampeners and negations up to three words back
+        for distance, has in ((1, has_1), (2, has_2), (3, has_3)):
+            applies = has & ~before(in_lexicon, distance, True)
+            scalar = before(booster, distance, 0.0)
+            scalar = np.where(valence < 0, -scalar, scalar)
+            caps_booster = before(is_booster, distance, False) & before(upper, distance, False) & cap_diff
+            scalar = np.where(caps_booster, np.where(valence > 0, scalar + C_INCR, scalar - C_INCR), scalar)
+            if distance == 2:
+                scalar = scalar * 0.95
+            elif distance == 3:
+                scalar = scalar * 0.9
+            valence = np.where(applies, valence + scalar, valence)
+            negated = before(negation, distance, False)
+            if distance == 1:
+                valence = np.where(applies & negated, valence * N_SCALAR, valence)
+                continue
+            if distance == 2:
+                emphasis = (code_2 == _NEVER) & (code_1 == _SO_THIS)
+                no_doubt = (code_2 == _WITHOUT) & (code_1 == _DOUBT)
+            else:
+                emphasis = ((code_3 == _NEVER) & (code_2 == _SO_THIS)) | (code_1 == _SO_THIS)
+                no_doubt = (code_3 == _WITHOUT) & ((code_2 == _DOUBT) | (code_1 == _DOUBT))
+            valence = np.where(applies & emphasis, valence * 1.25,
+                               np.where(applies & ~no_doubt & negated, valence * N_SCALAR, valence))
+
+        # "least" before a word negates it, except in "at least" / "very least"
+        least = has_1 & (code_1 == _LEAST) & ~before(in_lexicon, 1, True)
+        valence = np.where(least & ~(has_2 & (code_2 == _AT_VERY)), valence * N_SCALAR, valence)
+
+        # Only non-booster lexicon words carry valence; emotes carry their own
+        valence = np.where(in_lexicon & ~is_booster, valence, 0.0)
+        valence = np.where(self._is_emote[ids], self._emote_valence[ids], valence)
+
+        sums = np.bincount(message, weights=valence, minlength=count)
+        # Words before the first "but" count half, words after it one and a half, as
+        # VADER's own _but_check applies it (quirks included) to each message with one
+        is_but = code == _BUT
+        if is_but.any():
+            for index in np.unique(message[is_but]).tolist():
+                start, end = int(starts[index]), int(starts[index] + lengths[index])
+                but_index = int(np.flatnonzero(is_but[start:end])[0])
+                words = [""] * (end - start)
+                words[but_index] = "but"
+                sums[index] = sum(SentimentIntensityAnalyzer._but_check(words, valence[start:end].tolist()))
+
+        amplifier = np.array(amplifiers)
+        sums = np.where(sums > 0, sums + amplifier, np.where(sums < 0, sums - amplifier, sums))
+        compound = np.clip(sums / np.sqrt(sums * sums + NORMALIZE_ALPHA), -1.0, 1.0)
+        return [round(value, 4) for value in compound.tolist()]
+
+def _punctuation_emphasis(text: str) -> float:
+    """VADER's emphasis from exclamation points (up to 4) and question marks (2 or more)."""
+    amplifier = min(text.count("!"), 4) * 0.292
+    question_marks = text.count("?")
+    if question_marks > 1:
+        amplifier += question_marks * 0.18 if question_marks <= 3 else 0.96
+    return amplifier
+
+def create_sentiment_scorer(analyzer: SentimentIntensityAnalyzer, token_score: Callable[[str, str], float],
+                            engine: str = SENTIMENT_ENGINE) -> Optional[BatchSentimentScorer]:
+    """The batch scorer for the configured engine, or None to score with VADER per message."""
+    if engine == "vector":
+        if np is not None:
+            return BatchSentimentScorer(analyzer, token_score)
+        logger.info("NumPy is not installed, scoring sentiment with VADER per message.")
+    elif engine != "vader":
+        logger.warning(f"Unknown SENTIMENT_ENGINE '{engine}', scoring sentiment with VADER per message.")
+    return None
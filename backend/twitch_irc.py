@@ -1,21 +1,35 @@
 import os
+import time
 import asyncio
 import logging
+import aiohttp
+import twitchio.websocket
 from twitchio.ext import commands
 from twitchio.errors import AuthenticationError
 from dotenv import load_dotenv
-from typing import Set, Optional, List, Dict
+from datetime import datetime
+from typing import Set, Optional, List, Dict, Tuple, Any
 
 from websocket_manager import ConnectionManager
-# Import NLP functions
-from nlp_processor import analyze_sentiment, extract_keywords
+# Import NLP executor (sentiment + keywords run off the event loop)
+from nlp_executor import NLPExecutor, NLPResult, create_nlp_executor
+from aggregator import ChannelAggregator
+from chat_store import ChatRecorder, ChatEvent, create_chat_recorder
+from metrics import (
+    stage_seconds, messages_total, emote_fetch_seconds, copypasta_shared_total, analysis_cache_lookups_total,
+    alerts_fired_total
+)
+from load_shedder import AdaptiveSampler
+from copypasta import CopypastaDetector, CopypastaCluster, COPYPASTA_ENABLED
+from analysis_cache import AnalysisCache, CachedAnalysis
+from alerts import AlertEngine, ALERT_METRICS
 # Import emote handler and new type
-from emote_handler import fetch_all_emotes_for_channel, detect_emotes_in_message, EmoteSet, EmoteData
-# Import emote sentiment scores, if available
-try:
-    from nlp_processor import emote_sentiment_scores
-except ImportError:
-    emote_sentiment_scores = {}
+from emote_handler import (
+    fetch_all_emotes_for_channel, cancel_emote_revalidation, detect_emotes_in_message, build_emote_index,
+    parse_twitch_emote_tag, EmoteSet, EmoteData, EmoteIndex, EMPTY_EMOTE_INDEX
+)
+from nlp_processor import ensure_nlp_ready, get_emote_score_table
+from raw_irc import RawIrcConnection, ChatLine, IrcLoginError, DEFAULT_IRC_URL
 
 # Load environment variables for Twitch credentials
 load_dotenv()
@@ -23,44 +37,72 @@ load_dotenv()
 TWITCH_ACCESS_TOKEN = os.getenv("TWITCH_ACCESS_TOKEN", "")
 TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID", "")
 BOT_NICKNAME = os.getenv("BOT_NICKNAME", "justinfan123") # Use an anonymous user if no specific bot account
+# Chat server URL, e.g. a local fake TMI server for benchmarks (twitchio has no setting for it)
+TWITCH_IRC_URL = os.getenv("TWITCH_IRC_URL")
+if TWITCH_IRC_URL:
+    twitchio.websocket.HOST = TWITCH_IRC_URL
+
+# --- Connection Pool Settings ---
+# Channels are sharded across IRC connections, at most this many per connection
+IRC_CHANNELS_PER_CONNECTION = int(os.getenv("IRC_CHANNELS_PER_CONNECTION", "50"))
+# Twitch allows 20 JOINs per 10 seconds for regular accounts
+IRC_JOIN_RATE_LIMIT = int(os.getenv("IRC_JOIN_RATE_LIMIT", "20"))
+IRC_JOIN_RATE_WINDOW = float(os.getenv("IRC_JOIN_RATE_WINDOW", "10"))
+# IRC_CLIENT selects the chat client:
+#   "twitchio" - twitchio's Bot (default)
+#   "raw"      - raw_irc's minimal client, which parses only what the pipeline reads
+IRC_CLIENT = os.getenv("IRC_CLIENT", "twitchio").lower()
 
 logger = logging.getLogger(__name__)
 
-class TwitchBot(commands.Bot):
-    def __init__(self, streamer_channel: str, ws_manager: ConnectionManager):
+class ChannelPipeline:
+    """Per-channel state and message processing.
+
+    Holds the channel's emotes, aggregator and background tasks. Pipelines do not
+    own an IRC connection; a ChatShard dispatches the channel's messages here.
+    """
+
+    def __init__(self, streamer_channel: str, ws_manager: ConnectionManager, nlp_executor: NLPExecutor,
+                 chat_recorder: Optional[ChatRecorder] = None):
         self.streamer_channel = streamer_channel.lower()
         self.ws_manager = ws_manager
+        self.nlp_executor = nlp_executor
+        # Optional on-disk history of processed messages
+        self.chat_recorder = chat_recorder
         # Store emotes as dictionaries {name: url}
         self.ffz_emotes: EmoteSet = {}
         self.seventv_channel_emotes: EmoteSet = {}
         self.seventv_global_emotes: EmoteSet = {}
+        # Compiled lookup used for detection; replaced as a whole when emotes are (re)fetched
+        self.emote_index: EmoteIndex = EMPTY_EMOTE_INDEX
         self._emote_fetch_task: Optional[asyncio.Task] = None
-        
-        # Import and store emote sentiment scores
-        try:
-            self.emote_sentiment_scores = emote_sentiment_scores
-            logger.info(f"Loaded {len(self.emote_sentiment_scores)} emote sentiment scores for TwitchBot {streamer_channel}")
-        except Exception as e:
-            logger.error(f"Failed to load emote sentiment scores: {e}")
-            self.emote_sentiment_scores = {}
-
-        # Initialize the bot with credentials and the channel to join
-        # Use anonymous login if no token is provided
-        irc_token = TWITCH_ACCESS_TOKEN if TWITCH_ACCESS_TOKEN else None
-        nick = BOT_NICKNAME if not irc_token else None # twitchio handles nick from token if provided
-
-        super().__init__(
-            token=irc_token,
-            client_id=TWITCH_CLIENT_ID,
-            nick=nick,
-            prefix='!thisprefixisunused', # Required, but we don't use commands
-            initial_channels=[self.streamer_channel]
-        )
-        logger.info(f"TwitchBot initialized for channel: {self.streamer_channel}")
-
-    async def event_ready(self):
-        logger.info(f'Logged into Twitch IRC as | {self.nick} for channel {self.streamer_channel}')
-        # Start fetching emotes in the background once connected
+        # Sliding-window statistics, pushed to clients as `aggregate` frames
+        self.aggregator = ChannelAggregator()
+        self._aggregate_task: Optional[asyncio.Task] = None
+        # Metric series, resolved once so the per-message cost is a few additions
+        self._tag_parsing_seconds = stage_seconds.labels("tag_parsing")
+        self._nlp_wait_seconds = stage_seconds.labels("nlp_wait")
+        self._sentiment_seconds = stage_seconds.labels("sentiment")
+        self._keywords_seconds = stage_seconds.labels("keywords")
+        self._emote_detection_seconds = stage_seconds.labels("emote_detection")
+        self._broadcast_seconds = stage_seconds.labels("broadcast")
+        self._messages_total = messages_total.labels(self.streamer_channel)
+        # Samples sentiment/keyword analysis when the NLP stage falls behind
+        self.sampler = AdaptiveSampler(self.streamer_channel)
+        # Groups repeated messages so they share one analysis
+        self.copypasta: Optional[CopypastaDetector] = CopypastaDetector() if COPYPASTA_ENABLED else None
+        self._copypasta_shared = copypasta_shared_total.labels(self.streamer_channel)
+        # Whole analysis of recent message texts, for exact repeats
+        self.analysis_cache = AnalysisCache()
+        self._analysis_cache_hits = analysis_cache_lookups_total.labels(self.streamer_channel, "hit")
+        self._analysis_cache_misses = analysis_cache_lookups_total.labels(self.streamer_channel, "miss")
+        # Alert rules watching this channel, pushed to clients as `alert` frames
+        self.alerts = AlertEngine(self.streamer_channel, on_alert=self._count_alert)
+        self._alerts_task: Optional[asyncio.Task] = None
+
+    async def on_joined(self):
+        """Called by the shard once the channel's JOIN is confirmed (also after reconnects)."""
+        # Start fetching emotes in the background once joined
         if self._emote_fetch_task is None or self._emote_fetch_task.done():
              logger.info(f"Creating emote fetch task for {self.streamer_channel}")
              self._emote_fetch_task = asyncio.create_task(
@@ -70,102 +112,137 @@ class TwitchBot(commands.Bot):
         else:
              logger.warning(f"Emote fetch task for {self.streamer_channel} already running.")
 
+        if self._aggregate_task is None or self._aggregate_task.done():
+            self._aggregate_task = asyncio.create_task(
+                self.aggregator.run(self._publish_aggregate),
+                name=f"Aggregate-{self.streamer_channel}"
+            )
+        if self._alerts_task is None or self._alerts_task.done():
+            self._alerts_task = asyncio.create_task(
+                self.alerts.run(self.broadcast),
+                name=f"Alerts-{self.streamer_channel}"
+            )
+
         await self.ws_manager.broadcast_to_streamer(
             self.streamer_channel,
             {"type": "status", "payload": f"Successfully joined chat for {self.streamer_channel}"}
         )
 
+    async def _publish_aggregate(self, frame: dict):
+        await self.ws_manager.broadcast_to_streamer(self.streamer_channel, frame)
+
+    def _count_alert(self, alert: Dict[str, Any]):
+        alerts_fired_total.labels(self.streamer_channel, alert["metric"]).inc()
+        logger.info(f"Alert '{alert['rule_name']}' fired for {self.streamer_channel}: {alert['metric']} {alert['direction']} (score {alert['score']})")
+
+    async def _apply_emotes(self, ffz: EmoteSet, tv_chan: EmoteSet, tv_glob: EmoteSet):
+        """Stores fetched emote sets and swaps in a freshly built index."""
+        self.ffz_emotes = ffz
+        self.seventv_channel_emotes = tv_chan
+        self.seventv_global_emotes = tv_glob # Store the global set reference
+        # Emote scores load in the background on startup; wait for them off the event loop
+        await asyncio.to_thread(ensure_nlp_ready)
+        # Single reference swap, so detection never sees a half-built index
+        self.emote_index = build_emote_index(ffz, tv_chan, tv_glob, get_emote_score_table())
+        self.analysis_cache.clear() # Entries of the old index would only be dropped on lookup
+        logger.info(f"Successfully fetched emotes for {self.streamer_channel}: FFZ({len(ffz)}), 7TV({len(tv_chan)}), 7TV_Global({len(tv_glob)}), index v{self.emote_index.version}")
+        # Optionally notify clients that emotes are loaded
+        await self.ws_manager.broadcast_to_streamer(
+             self.streamer_channel,
+             {"type": "status", "payload": "FFZ/7TV emote data loaded."}
+        )
+
     async def _fetch_emotes(self):
         """Internal task to fetch emotes and store them.
-           Runs in the background after connection is ready.
+           Runs in the background after the channel is joined.
         """
         logger.info(f"Starting emote fetch for {self.streamer_channel}...")
+        started = time.perf_counter()
         try:
             # Pass client_id and token from environment for Twitch API call
             ffz, tv_chan, tv_glob = await fetch_all_emotes_for_channel(
                 self.streamer_channel,
                 TWITCH_CLIENT_ID, # Fetched from .env
-                TWITCH_ACCESS_TOKEN # Fetched from .env
-            )
-            self.ffz_emotes = ffz
-            self.seventv_channel_emotes = tv_chan
-            self.seventv_global_emotes = tv_glob # Store the global set reference
-            logger.info(f"Successfully fetched emotes for {self.streamer_channel}: FFZ({len(ffz)}), 7TV({len(tv_chan)}), 7TV_Global({len(tv_glob)})")
-            # Optionally notify clients that emotes are loaded
-            await self.ws_manager.broadcast_to_streamer(
-                 self.streamer_channel,
-                 {"type": "status", "payload": "FFZ/7TV emote data loaded."}
+                TWITCH_ACCESS_TOKEN, # Fetched from .env
+                on_update=self._apply_emotes # Called again if cached emotes were stale and got refreshed
             )
+            emote_fetch_seconds.labels("ok").observe(time.perf_counter() - started)
+            await self._apply_emotes(ffz, tv_chan, tv_glob)
         except Exception as e:
+            emote_fetch_seconds.labels("error").observe(time.perf_counter() - started)
             logger.error(f"Error in _fetch_emotes task for {self.streamer_channel}: {e}", exc_info=True)
             await self.ws_manager.broadcast_to_streamer(
                  self.streamer_channel,
                  {"type": "error", "payload": "Failed to load FFZ/7TV emote data."}
             )
 
-    async def event_message(self, message):
-        # Ignore messages from the bot itself if not using anonymous login
-        if message.echo:
-            return
-
-        # Ensure message content exists
-        if not message.content:
-             return
-
-        # Log the raw message content
-        logger.debug(f"#{message.channel.name} - {message.author.name}: {message.content}")
-
+    async def process_message(self, content: str, author: str, timestamp: datetime, tags: Optional[Dict[str, Any]]):
+        """Runs the analysis pipeline for one chat message and broadcasts the result."""
         # --- Data Processing Pipeline --- 
-        # Analyze sentiment (now returns score and word details)
-        # Use a placeholder if analyze_sentiment fails
-        sentiment_score: Optional[float] = None
-        sentiment_words: Dict[str, float] = {}
-        try:
-            sentiment_score, sentiment_words = analyze_sentiment(message.content)
-        except Exception as e:
-            logger.error(f"Error calling analyze_sentiment for '{message.content[:50]}...': {e}")
-            sentiment_score = 0.0 # Default to neutral on error
-            sentiment_words = {}
-
-        # Extract keywords
-        keywords = extract_keywords(message.content)
-
-        # --- Enhanced Emote Processing --- 
-        # Detect FFZ/7TV/BTTV emotes
-        all_custom_emotes: List[EmoteData] = detect_emotes_in_message(
-            message.content,
-            self.ffz_emotes,
-            self.seventv_channel_emotes,
-            self.seventv_global_emotes
-        )
+        # Analyze sentiment (score and word details) and extract keywords.
+        # Batched and run in the NLP executor so the event loop stays responsive.
+        # Under load only a sample of messages is analyzed; the others skip ahead
+        # (possibly overtaking analyzed ones) with no sentiment or keywords.
+        # Repeats of a live copypasta cluster reuse its first member's analysis instead,
+        # and exact repeats of a recent line reuse its whole analysis from the cache.
+        cluster = self.copypasta.assign(content) if self.copypasta is not None else None
+
+        cacheable = self.analysis_cache.cacheable(content)
+        cached = None
+        if cacheable:
+            score_table_version = get_emote_score_table().version
+            cached = self.analysis_cache.get(content, self._current_emote_index().version, score_table_version)
+        if cached is not None:
+            self._analysis_cache_hits.inc()
+            nlp_result, all_custom_emotes = cached.nlp_result, cached.custom_emotes
+            analyzed, sample_rate = True, 1.0
+        else:
+            if cacheable:
+                self._analysis_cache_misses.inc()
+            nlp_result, analyzed, sample_rate, shared = await self._analyze(content, cluster)
+            emote_index = self._current_emote_index()
+            # The NLP workers only skip the CSV emotes; this channel's FFZ/7TV emotes are dropped
+            # here, so a cached entry depends on nothing but the versions stored with it
+            if nlp_result.keywords:
+                nlp_result = nlp_result._replace(keywords=[
+                    keyword for keyword in nlp_result.keywords if keyword not in emote_index.keyword_skip
+                ])
+            # --- Enhanced Emote Processing ---
+            # Detect FFZ/7TV/BTTV emotes
+            started = time.perf_counter()
+            all_custom_emotes: List[EmoteData] = detect_emotes_in_message(content, emote_index)
+            self._emote_detection_seconds.observe(time.perf_counter() - started)
+            # Only results computed for this exact text; a cluster's shared result belongs to another message
+            if analyzed and cacheable and not shared:
+                self.analysis_cache.put(content, CachedAnalysis(
+                    nlp_result, all_custom_emotes, emote_index.version, nlp_result.score_table_version
+                ))
+        sentiment_score: Optional[float] = nlp_result.sentiment_score
+        sentiment_words: Dict[str, float] = nlp_result.sentiment_words
+        keywords = nlp_result.keywords
 
         # Prepare combined list of all detected emotes (Twitch + Custom)
         all_detected_emotes: List[Dict[str, any]] = [] # Use a dictionary for more flexibility
         processed_emote_names = set() # Keep track of emotes added to avoid duplicates
 
         # 1. Process standard Twitch emotes from tags
-        if message.tags and message.tags.get('emotes'):
-            emote_tag = message.tags['emotes']
-            try:
-                for emote_part in emote_tag.split('/'):
-                    emote_id, ranges = emote_part.split(':', 1)
-                    first_range = ranges.split(',')[0]
-                    start, end = map(int, first_range.split('-'))
-                    emote_name = message.content[start:end+1]
-                    if emote_name not in processed_emote_names:
-                        emote_url = f"https://static-cdn.jtvnw.net/emoticons/v2/{emote_id}/default/dark/1.0"
-                        # Use sentiment score if available from analyze_sentiment's word_scores
-                        # (prioritizing CSV scores done within analyze_sentiment)
-                        emote_sentiment = sentiment_words.get(emote_name)
-                        all_detected_emotes.append({
-                            "name": emote_name,
-                            "url": emote_url,
-                            "type": "twitch",
-                            "sentiment_score": emote_sentiment # Can be None
-                        })
-                        processed_emote_names.add(emote_name)
-            except Exception as e:
-                logger.warning(f"Failed to parse Twitch emote tag '{emote_tag}': {e}")
+        started = time.perf_counter()
+        if tags and tags.get('emotes'):
+            # Every range of every emote, so an emote is found even if one of its ranges is off
+            for emote_id, emote_name, _ in parse_twitch_emote_tag(tags['emotes'], content):
+                if emote_name not in processed_emote_names:
+                    emote_url = f"https://static-cdn.jtvnw.net/emoticons/v2/{emote_id}/default/dark/1.0"
+                    # Use sentiment score if available from analyze_sentiment's word_scores
+                    # (prioritizing CSV scores done within analyze_sentiment)
+                    emote_sentiment = sentiment_words.get(emote_name)
+                    all_detected_emotes.append({
+                        "name": emote_name,
+                        "url": emote_url,
+                        "type": "twitch",
+                        "sentiment_score": emote_sentiment # Can be None
+                    })
+                    processed_emote_names.add(emote_name)
+        self._tag_parsing_seconds.observe(time.perf_counter() - started)
 
         # 2. Process custom emotes (FFZ/7TV/BTTV)
         for custom_emote in all_custom_emotes:
@@ -176,7 +253,7 @@ class TwitchBot(commands.Bot):
                  all_detected_emotes.append({
                     "name": emote_name,
                     "url": custom_emote['url'],
-                    "type": custom_emote.get('source', 'custom'), # Track source if available
+                    "type": custom_emote['source'], # ffz, 7tv or 7tv_global
                     "sentiment_score": emote_sentiment # Can be None
                  })
                  processed_emote_names.add(emote_name)
@@ -188,68 +265,373 @@ class TwitchBot(commands.Bot):
         processed_data = {
             "type": "chat_message",
             "payload": {
-                "timestamp": message.timestamp.isoformat(),
-                "author": message.author.name,
-                "content": message.content,
-                "tags": message.tags,
+                "timestamp": timestamp.isoformat(),
+                "author": author,
+                "content": content,
+                "tags": tags,
                 "sentiment_score": sentiment_score, # Use the compound score from analyze_sentiment
                 "sentiment_words": sentiment_words, # <-- ADDED word scores dictionary
                 # "original_sentiment_score": sentiment, # Removed, redundant now
                 "keywords": keywords,
-                "detected_emotes": all_detected_emotes # Includes sentiment if available
+                "detected_emotes": all_detected_emotes, # Includes sentiment if available
+                "score_table_version": nlp_result.score_table_version, # Emote score table used for sentiment_words
+                # False if analysis was skipped under load; aggregates weight analyzed messages by 1 / sample_rate
+                "analyzed": analyzed,
+                "sample_rate": round(sample_rate, 4),
+                # Near-duplicate cluster this message belongs to, once it has repeats
+                "copypasta": {"id": cluster.id, "size": cluster.size} if cluster is not None and cluster.size > 1 else None
             }
         }
 
+        self.aggregator.add_message(
+            sentiment_score, keywords, all_detected_emotes, analyzed, sample_rate,
+            (cluster.id, cluster.label, cluster.wave_members) if cluster is not None and cluster.wave_members else None,
+            author
+        )
+        self.alerts.add_message(sentiment_score, keywords, [emote["name"] for emote in all_detected_emotes], sample_rate)
+        if self.chat_recorder is not None:
+            # Only queues the message; the recorder's thread does the disk work
+            self.chat_recorder.record(self.streamer_channel, ChatEvent(
+                timestamp.timestamp(), author, content, sentiment_score,
+                [emote["name"] for emote in all_detected_emotes], keywords, sample_rate
+            ))
+
         # Send processed data to WebSocket clients for this streamer
+        started = time.perf_counter()
         await self.ws_manager.broadcast_to_streamer(self.streamer_channel, processed_data)
+        self._broadcast_seconds.observe(time.perf_counter() - started)
+        self._messages_total.inc()
+
+    def _current_emote_index(self) -> EmoteIndex:
+        """The emote index, re-scored first if the sentiment scores were reloaded since it was built."""
+        score_table = get_emote_score_table()
+        if self.emote_index.score_table_version != score_table.version and self.emote_index is not EMPTY_EMOTE_INDEX:
+            self.emote_index = build_emote_index(
+                self.ffz_emotes, self.seventv_channel_emotes, self.seventv_global_emotes, score_table
+            )
+        return self.emote_index
+
+    async def _analyze(self, content: str, cluster: Optional[CopypastaCluster]) -> Tuple[NLPResult, bool, float, bool]:
+        """Sentiment/keyword analysis of one message: shared from its copypasta cluster if
+        possible, else run in the NLP executor if the sampler admits it. Returns the result,
+        whether the message counts as analyzed, the sample rate it was weighted with and
+        whether the result was shared from the cluster (computed for another message's text).
+        """
+        score_table_version = get_emote_score_table().version
+        if cluster is not None:
+            shared = await cluster.shared_result(score_table_version)
+            if shared is not None:
+                self.copypasta.shared_analyses += 1
+                self._copypasta_shared.inc()
+                # Every repeat gets the result, so it stands for itself alone
+                return shared, True, 1.0, True
+
+        sample_rate = self.sampler.sample_rate
+        if not self.sampler.admit():
+            return NLPResult(None, {}, []), False, sample_rate, False
+        # The first member of a cluster analyzes for the others
+        claimed = cluster is not None and cluster.start_analysis()
+        nlp_result = None
+        started = time.perf_counter()
+        try:
+            nlp_result = await self.nlp_executor.analyze(content)
+        finally:
+            lag = time.perf_counter() - started
+            self.sampler.finish(lag)
+            if claimed:
+                cluster.finish_analysis(nlp_result)
+        self._nlp_wait_seconds.observe(lag)
+        self._sentiment_seconds.observe(nlp_result.sentiment_seconds)
+        self._keywords_seconds.observe(nlp_result.keywords_seconds)
+        return nlp_result, True, sample_rate, False
+
+    async def broadcast(self, message: dict):
+        await self.ws_manager.broadcast_to_streamer(self.streamer_channel, message)
+
+    def stop(self):
+        logger.info(f"Stopping pipeline for {self.streamer_channel}")
+        # Cancel background tasks
+        if self._emote_fetch_task and not self._emote_fetch_task.done():
+            self._emote_fetch_task.cancel()
+            logger.info(f"Cancelled emote fetch task during stop for {self.streamer_channel}")
+        # A background emote refresh would otherwise call _apply_emotes on this stopped pipeline
+        cancel_emote_revalidation(self.streamer_channel)
+        if self._aggregate_task and not self._aggregate_task.done():
+            self._aggregate_task.cancel()
+        if self._alerts_task and not self._alerts_task.done():
+            self._alerts_task.cancel()
+        if self.chat_recorder is not None:
+            self.chat_recorder.close_channel(self.streamer_channel) # Next session gets its own segment
+        messages_total.remove(self.streamer_channel)
+        copypasta_shared_total.remove(self.streamer_channel)
+        analysis_cache_lookups_total.remove(self.streamer_channel, "hit")
+        analysis_cache_lookups_total.remove(self.streamer_channel, "miss")
+        for metric in ALERT_METRICS:
+            alerts_fired_total.remove(self.streamer_channel, metric)
+
+class ChatShard:
+    """Channel bookkeeping of one IRC connection (shard) carrying the chat of many
+    channels, shared by both chat clients (see IRC_CLIENT).
+
+    Incoming messages are dispatched to the ChannelPipeline of their channel.
+    Channels are joined and parted at runtime by the TwitchConnectionPool.
+    Subclasses provide start(), close(), join_channels() and part_channels().
+    """
+
+    def _init_shard(self, shard_id: int, join_limiter: "JoinRateLimiter"):
+        self.shard_id = shard_id
+        self.join_limiter = join_limiter
+        # Channels assigned to this connection (joined or pending)
+        self.pipelines: Dict[str, ChannelPipeline] = {}
+        self.is_ready = False
+        self._join_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def channel_count(self) -> int:
+        return len(self.pipelines)
+
+    def add_channel(self, pipeline: ChannelPipeline):
+        self.pipelines[pipeline.streamer_channel] = pipeline
+        if self.is_ready:
+            self._schedule_join(pipeline.streamer_channel)
+        # Otherwise event_ready joins all assigned channels
+
+    async def remove_channel(self, streamer_channel: str) -> Optional[ChannelPipeline]:
+        pipeline = self.pipelines.pop(streamer_channel, None)
+        if pipeline and self.is_ready:
+            try:
+                await self.part_channels([streamer_channel])
+            except Exception as e:
+                logger.warning(f"Failed to part #{streamer_channel} on shard {self.shard_id}: {e}")
+        return pipeline
+
+    def _schedule_join(self, streamer_channel: str):
+        task = asyncio.create_task(self._join(streamer_channel), name=f"Join-{streamer_channel}")
+        self._join_tasks.add(task)
+        task.add_done_callback(self._join_tasks.discard)
+
+    async def _join(self, streamer_channel: str):
+        await self.join_limiter.acquire()
+        # The channel may have been removed while waiting for a join slot
+        if streamer_channel in self.pipelines:
+            logger.info(f"Joining #{streamer_channel} on shard {self.shard_id}")
+            await self.join_channels([streamer_channel])
+
+    async def event_ready(self):
+        logger.info(f'Logged into Twitch IRC as | {self.nick} on shard {self.shard_id} ({self.channel_count} channels)')
+        self.is_ready = True
+        # Join (or, after a reconnect, rejoin) every channel assigned to this connection
+        for streamer_channel in list(self.pipelines):
+            self._schedule_join(streamer_channel)
+
+    async def _channel_joined(self, streamer_channel: str):
+        pipeline = self.pipelines.get(streamer_channel.lower())
+        if pipeline:
+            await pipeline.on_joined()
+
+    async def event_channel_join_failure(self, channel: str):
+        logger.error(f"Failed to join #{channel} on shard {self.shard_id}")
+        pipeline = self.pipelines.get(channel.lower())
+        if pipeline:
+            await pipeline.broadcast({"type": "error", "payload": f"Failed to join chat for {channel}."})
+
+    async def _dispatch_message(self, streamer_channel: str, content: str, author: str,
+                                timestamp: datetime, tags: Optional[Dict[str, Any]]):
+        # Ensure message content exists
+        if not content:
+            return
+
+        pipeline = self.pipelines.get(streamer_channel)
+        if pipeline is None:
+            return # Channel was parted while the message was in flight
+
+        # Log the raw message content
+        logger.debug(f"#{streamer_channel} - {author}: {content}")
+
+        await pipeline.process_message(content, author, timestamp, tags)
 
     async def event_error(self, error: Exception, data: str | None = None):
-        logger.error(f"Twitch Bot Error for {self.streamer_channel}: {error}")
-        if isinstance(error, AuthenticationError):
+        logger.error(f"Twitch Bot Error on shard {self.shard_id}: {error}")
+        pipelines = list(self.pipelines.values())
+        if isinstance(error, (AuthenticationError, IrcLoginError)):
             logger.error("Authentication failed. Please check your TWITCH_ACCESS_TOKEN.")
-            await self.ws_manager.broadcast_to_streamer(
-                self.streamer_channel,
-                {"type": "error", "payload": "Twitch authentication failed. Check backend token."}
-            )
+            for pipeline in pipelines:
+                await pipeline.broadcast({"type": "error", "payload": "Twitch authentication failed. Check backend token."})
             # Potentially stop the bot or signal the main application
         # Log additional data if available
         if data:
             logger.error(f"Error Data: {data}")
-        # Propagate error state via WebSocket
-        await self.ws_manager.broadcast_to_streamer(
-            self.streamer_channel,
-            {"type": "error", "payload": f"Twitch IRC error: {str(error)}"}
-        )
+        # Propagate error state via WebSocket to every channel on this connection
+        for pipeline in pipelines:
+            await pipeline.broadcast({"type": "error", "payload": f"Twitch IRC error: {str(error)}"})
         # Default twitchio behavior might try to reconnect, depending on the error.
         # We might need custom handling here based on specific errors.
 
     async def event_close(self):
-        logger.warning(f"Twitch IRC connection closed for {self.streamer_channel}.")
-        # Cancel emote fetch task if running
-        if self._emote_fetch_task and not self._emote_fetch_task.done():
-            self._emote_fetch_task.cancel()
-            logger.info(f"Cancelled emote fetch task for {self.streamer_channel}")
-        await self.ws_manager.broadcast_to_streamer(
-            self.streamer_channel,
-            {"type": "status", "payload": f"IRC connection closed for {self.streamer_channel}."}
-        )
-        # Note: twitchio handles reconnection automatically by default for many cases.
+        logger.warning(f"Twitch IRC connection closed for shard {self.shard_id}.")
+        self.is_ready = False
+        for pipeline in list(self.pipelines.values()):
+            await pipeline.broadcast({"type": "status", "payload": f"IRC connection closed for {pipeline.streamer_channel}."})
+        # Note: both clients reconnect by themselves.
 
     async def stop_bot(self):
-        logger.info(f"Stopping Twitch bot for {self.streamer_channel}")
-        # Cancel emote fetch task
-        if self._emote_fetch_task and not self._emote_fetch_task.done():
-            self._emote_fetch_task.cancel()
-            logger.info(f"Cancelled emote fetch task during stop for {self.streamer_channel}")
+        logger.info(f"Stopping Twitch bot shard {self.shard_id}")
+        for task in list(self._join_tasks):
+            task.cancel()
         await self.close()
-        logger.info(f"Twitch bot for {self.streamer_channel} closed.")
+        logger.info(f"Twitch bot shard {self.shard_id} closed.")
+
+class TwitchBot(ChatShard, commands.Bot):
+    """A shard on a twitchio connection (IRC_CLIENT=twitchio, the default)."""
+
+    def __init__(self, shard_id: int, join_limiter: "JoinRateLimiter"):
+        self._init_shard(shard_id, join_limiter)
+
+        # Initialize the bot with credentials; channels are joined after the connection is ready
+        # Use anonymous login if no token is provided
+        # (chat accepts any PASS for justinfan nicks; twitchio still needs a string)
+        irc_token = TWITCH_ACCESS_TOKEN if TWITCH_ACCESS_TOKEN else "anonymous"
+
+        super().__init__(
+            token=irc_token,
+            client_id=TWITCH_CLIENT_ID,
+            prefix='!thisprefixisunused', # Required, but we don't use commands
+            initial_channels=[]
+        )
+        if not TWITCH_ACCESS_TOKEN:
+            # twitchio handles nick from token if provided; with a preset nick it skips token validation.
+            # This and connect() below use twitchio 2.10 internals, hence the pin in requirements.txt
+            self._http.nick = BOT_NICKNAME
+        logger.info(f"TwitchBot shard {self.shard_id} initialized")
 
-# --- Manager for Bot Instances --- 
-# We need a way to manage multiple bot instances, one per streamer
-active_bots: dict[str, TwitchBot] = {}
+    async def connect(self):
+        if not TWITCH_ACCESS_TOKEN and self._http.session is None:
+            # Token validation normally opens twitchio's HTTP session; anonymous logins skip it
+            self._http.session = aiohttp.ClientSession()
+        await super().connect()
 
-async def start_twitch_bot(streamer_name: str, ws_manager: ConnectionManager) -> Optional[TwitchBot]:
-    """Starts a Twitch bot for the specified streamer if not already running."""
+    async def event_channel_joined(self, channel):
+        await self._channel_joined(channel.name)
+
+    async def event_message(self, message):
+        # Ignore messages from the bot itself if not using anonymous login
+        if message.echo:
+            return
+        await self._dispatch_message(message.channel.name, message.content, message.author.name,
+                                     message.timestamp, message.tags)
+
+class RawTwitchBot(ChatShard, RawIrcConnection):
+    """A shard on a RawIrcConnection (IRC_CLIENT=raw), which skips twitchio's
+    per-line parsing and objects. It never sends chat, so there are no echoes."""
+
+    def __init__(self, shard_id: int, join_limiter: "JoinRateLimiter"):
+        self._init_shard(shard_id, join_limiter)
+        # With a token, BOT_NICKNAME has to be the token's account (twitchio looks it up instead)
+        RawIrcConnection.__init__(self, BOT_NICKNAME, TWITCH_ACCESS_TOKEN, TWITCH_IRC_URL or DEFAULT_IRC_URL,
+                                  name=f"shard {shard_id}")
+        logger.info(f"RawTwitchBot shard {self.shard_id} initialized")
+
+    async def event_channel_joined(self, channel: str):
+        await self._channel_joined(channel)
+
+    async def event_chat_line(self, line: ChatLine):
+        await self._dispatch_message(line.channel, line.content, line.author, line.timestamp, line.tags)
+
+# --- Connection Pool --- 
+
+class JoinRateLimiter:
+    """Sliding-window limiter for JOIN commands, shared by all connections of the pool."""
+
+    def __init__(self, limit: int = IRC_JOIN_RATE_LIMIT, window: float = IRC_JOIN_RATE_WINDOW):
+        self.limit = max(1, limit)
+        self.window = window
+        self._recent: List[float] = []
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                self._recent = [t for t in self._recent if now - t < self.window]
+                if len(self._recent) < self.limit:
+                    self._recent.append(now)
+                    return
+                await asyncio.sleep(self.window - (now - self._recent[0]))
+
+class TwitchConnectionPool:
+    """Shards channels across a small number of IRC connections.
+
+    A channel is placed on the least-loaded connection that still has room;
+    a new connection is opened only when all are full, and a connection is
+    closed once its last channel is parted.
+    """
+
+    def __init__(self, nlp_executor: NLPExecutor, channels_per_connection: int = IRC_CHANNELS_PER_CONNECTION,
+                 chat_recorder: Optional[ChatRecorder] = None):
+        self.nlp_executor = nlp_executor
+        self.chat_recorder = chat_recorder
+        self.channels_per_connection = max(1, channels_per_connection)
+        self.join_limiter = JoinRateLimiter()
+        self.shard_class = RawTwitchBot if IRC_CLIENT == "raw" else TwitchBot
+        self.shards: List[ChatShard] = []
+        self.pipelines: Dict[str, ChannelPipeline] = {}
+        self._channel_shards: Dict[str, ChatShard] = {}
+        self._next_shard_id = 0
+
+    def _pick_shard(self) -> ChatShard:
+        open_shards = [shard for shard in self.shards if shard.channel_count < self.channels_per_connection]
+        if open_shards:
+            return min(open_shards, key=lambda shard: shard.channel_count)
+        shard = self.shard_class(self._next_shard_id, self.join_limiter)
+        self._next_shard_id += 1
+        self.shards.append(shard)
+        asyncio.create_task(shard.start(), name=f"TwitchBotTask-shard{shard.shard_id}")
+        logger.info(f"Opened IRC connection shard {shard.shard_id} ({len(self.shards)} total)")
+        return shard
+
+    def join(self, streamer_name: str, ws_manager: ConnectionManager) -> ChannelPipeline:
+        """Creates the channel's pipeline and assigns it to a connection."""
+        pipeline = ChannelPipeline(streamer_channel=streamer_name, ws_manager=ws_manager,
+                                   nlp_executor=self.nlp_executor, chat_recorder=self.chat_recorder)
+        shard = self._pick_shard()
+        self.pipelines[streamer_name] = pipeline
+        self._channel_shards[streamer_name] = shard
+        shard.add_channel(pipeline)
+        return pipeline
+
+    async def part(self, streamer_name: str) -> bool:
+        """Parts the channel and stops its pipeline. Closes the connection if it became empty."""
+        self.pipelines.pop(streamer_name, None)
+        shard = self._channel_shards.pop(streamer_name, None)
+        if shard is None:
+            return False
+        pipeline = await shard.remove_channel(streamer_name)
+        if pipeline:
+            pipeline.stop()
+        if shard.channel_count == 0:
+            self.shards.remove(shard)
+            await shard.stop_bot()
+            logger.info(f"Closed idle IRC connection shard {shard.shard_id} ({len(self.shards)} remaining)")
+        return True
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"shard": shard.shard_id, "ready": shard.is_ready, "channels": sorted(shard.pipelines)}
+            for shard in self.shards
+        ]
+
+# --- Manager for Channels --- 
+# NLP executor shared by all channels (closed on application shutdown)
+nlp_executor: NLPExecutor = create_nlp_executor()
+# None unless CHAT_STORE_DIR is set
+chat_recorder: Optional[ChatRecorder] = create_chat_recorder()
+connection_pool = TwitchConnectionPool(nlp_executor, chat_recorder=chat_recorder)
+# Pipelines of all channels being analyzed, by channel name
+active_bots: Dict[str, ChannelPipeline] = connection_pool.pipelines
+
+async def start_twitch_bot(streamer_name: str, ws_manager: ConnectionManager) -> Optional[ChannelPipeline]:
+    """Starts analysis for the specified streamer if not already running."""
     streamer_name = streamer_name.lower()
     if streamer_name in active_bots:
         logger.warning(f"Bot for {streamer_name} already running.")
@@ -271,17 +653,11 @@ async def start_twitch_bot(streamer_name: str, ws_manager: ConnectionManager) ->
     if not TWITCH_CLIENT_ID:
          logger.warning("TWITCH_CLIENT_ID not set. 7TV emote fetching will likely fail.")
 
-    logger.info(f"Starting Twitch bot for {streamer_name}")
-    bot = TwitchBot(streamer_channel=streamer_name, ws_manager=ws_manager)
-    active_bots[streamer_name] = bot
-
+    logger.info(f"Starting analysis for {streamer_name}")
     try:
-        # Start the bot in a separate task
-        # loop = asyncio.get_running_loop()
-        # loop.create_task(bot.start())
-        asyncio.create_task(bot.start(), name=f"TwitchBotTask-{streamer_name}")
-        logger.info(f"Twitch bot task created for {streamer_name}")
-        return bot
+        pipeline = connection_pool.join(streamer_name, ws_manager)
+        logger.info(f"Channel {streamer_name} assigned to an IRC connection")
+        return pipeline
 
     except AuthenticationError as e:
         logger.error(f"Authentication error starting bot for {streamer_name}: {e}")
@@ -289,8 +665,7 @@ async def start_twitch_bot(streamer_name: str, ws_manager: ConnectionManager) ->
             streamer_name,
             {"type": "error", "payload": f"Twitch Auth Error: {e}. Check credentials."}
         )
-        if streamer_name in active_bots:
-            del active_bots[streamer_name] # Clean up if entry was added before error
+        await connection_pool.part(streamer_name) # Clean up if entry was added before error
         return None
     except Exception as e:
         logger.error(f"Unexpected error starting bot for {streamer_name}: {e}", exc_info=True)
@@ -298,18 +673,16 @@ async def start_twitch_bot(streamer_name: str, ws_manager: ConnectionManager) ->
             streamer_name,
             {"type": "error", "payload": f"Server error starting analysis: {e}"}
         )
-        if streamer_name in active_bots:
-            del active_bots[streamer_name] # Clean up
+        await connection_pool.part(streamer_name) # Clean up
         return None
 
 async def stop_twitch_bot(streamer_name: str):
-    """Stops the Twitch bot for the specified streamer."""
+    """Stops analysis for the specified streamer and parts its channel."""
     streamer_name = streamer_name.lower()
-    bot = active_bots.pop(streamer_name, None)
-    if bot:
+    if streamer_name in active_bots:
         logger.info(f"Requesting bot stop for {streamer_name}...")
         try:
-            await bot.stop_bot()
+            await connection_pool.part(streamer_name)
             logger.info(f"Bot stop initiated for {streamer_name}.")
             return True
         except Exception as e:
@@ -320,5 +693,5 @@ async def stop_twitch_bot(streamer_name: str):
         return False # Indicate bot was not found
 
 def get_active_bot_count():
-    """Returns the number of currently active bot instances."""
-    return len(active_bots) 
\ No newline at end of file
+    """Returns the number of channels currently being analyzed."""
+    return len(active_bots)
@@ -1,30 +1,272 @@
 from fastapi import WebSocket
+import os
+import json
+import time
+import asyncio
 import logging
-from typing import Dict, List
+from collections import deque
+from typing import Dict, List, Tuple, Any, Deque, Optional, Callable, Union, Set
+
+from wire_format import WireFormat, DEFAULT_WIRE_FORMAT, EmoteRegistry, compact_frames, encode_frame
+from metrics import ws_send_failures_total, ws_frames_dropped_total, ws_slow_disconnects_total
 
 logger = logging.getLogger(__name__)
 
-class ConnectionManager:
+# --- Slow Consumer Handling ---
+# Maximum number of frames waiting to be written to one client
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# What to do when a client's queue is full:
+#   "drop_oldest" - discard the oldest queued frame (default)
+#   "coalesce"    - discard queued chat frames and keep only the latest aggregate
+#   "disconnect"  - close the client
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest").lower()
+# Frame types the coalesce policy may throw away (everything else is always delivered)
+COALESCIBLE_FRAME_TYPES = {"chat_message", "aggregate"}
+# Frames a client cannot do without (later frames refer to them); never dropped on overflow
+UNDROPPABLE_FRAME_TYPES = {"protocol", "emote_defs"}
+
+def encode_message(message: dict) -> str:
+    """Serializes a message the same way WebSocket.send_json does."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class BroadcastStats:
+    """Timing counters for broadcasts to one streamer. A broadcast only encodes and
+    queues its frames; the time writers take to send them is reported per client.
+    """
+    __slots__ = ('broadcasts', 'last_clients', 'last_encode_ms', 'last_enqueue_ms', 'max_enqueue_ms', 'total_enqueue_ms')
+
     def __init__(self):
+        self.broadcasts = 0
+        self.last_clients = 0
+        self.last_encode_ms = 0.0
+        self.last_enqueue_ms = 0.0
+        self.max_enqueue_ms = 0.0
+        self.total_enqueue_ms = 0.0
+
+    def record(self, clients: int, encode_ms: float, enqueue_ms: float):
+        self.broadcasts += 1
+        self.last_clients = clients
+        self.last_encode_ms = encode_ms
+        self.last_enqueue_ms = enqueue_ms
+        self.max_enqueue_ms = max(self.max_enqueue_ms, enqueue_ms)
+        self.total_enqueue_ms += enqueue_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "broadcasts": self.broadcasts,
+            "last_clients": self.last_clients,
+            "last_encode_ms": round(self.last_encode_ms, 3),
+            "last_enqueue_ms": round(self.last_enqueue_ms, 3),
+            "avg_enqueue_ms": round(self.total_enqueue_ms / self.broadcasts, 3) if self.broadcasts else 0.0,
+            "max_enqueue_ms": round(self.max_enqueue_ms, 3),
+        }
+
+class ClientConnection:
+    """One WebSocket client with its own bounded send queue and writer task.
+
+    Broadcasting only appends to the queue, so a stalled client can never block
+    the caller; what happens when the queue is full is decided by the overflow policy.
+    """
+
+    def __init__(self, websocket: WebSocket, streamer_name: str, max_queue: int, policy: str,
+                 on_failure: Callable[["ClientConnection"], None], wire: WireFormat = DEFAULT_WIRE_FORMAT):
+        self.websocket = websocket
+        self.streamer_name = streamer_name
+        self.wire = wire
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self._on_failure = on_failure
+        # Queued frames as (frame_type, encoded text or bytes, enqueued_at)
+        self._queue: Deque[Tuple[str, Union[str, bytes], float]] = deque()
+        self._wakeup = asyncio.Event()
+        self.closed = False
+        # Counters
+        self.sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        # Time spent in send_text/send_bytes, i.e. actually writing to this client
+        self.last_send_ms = 0.0
+        self.max_send_ms = 0.0
+        self.total_send_ms = 0.0
+        self._writer = asyncio.create_task(self._write_loop(), name=f"WSWriter-{streamer_name}")
+
+    @property
+    def client_id(self) -> str:
+        client = getattr(self.websocket, "client", None)
+        return f"{client.host}:{client.port}" if client else hex(id(self.websocket))
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, frame_type: str, data: Union[str, bytes]) -> bool:
+        """Queues an encoded frame. Returns False if the client must be disconnected."""
+        if self.closed:
+            return True # Being torn down; the frame is discarded
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                logger.warning(f"Client {self.client_id} for {self.streamer_name} fell {len(self._queue)} frames behind. Disconnecting.")
+                return False
+            dropped_before = self.dropped
+            try:
+                if self.policy == "coalesce" and self._coalesce(frame_type):
+                    return True # Chat frame dropped; queue now holds at most the latest aggregate
+                if len(self._queue) >= self.max_queue:
+                    # drop_oldest, or only undroppable control frames were left to coalesce
+                    self._drop_oldest()
+            finally:
+                ws_frames_dropped_total.inc(self.dropped - dropped_before)
+        self._queue.append((frame_type, data, time.monotonic()))
+        self._wakeup.set()
+        return True
+
+    def _drop_oldest(self):
+        for index, frame in enumerate(self._queue):
+            if frame[0] not in UNDROPPABLE_FRAME_TYPES:
+                del self._queue[index]
+                self.dropped += 1
+                return
+        # Only undroppable frames queued: let the queue grow past its limit
+
+    def _coalesce(self, frame_type: str) -> bool:
+        """Drops queued chat frames and superseded aggregates, keeping control frames
+        and the latest aggregate. Returns True if the incoming frame is dropped as well.
+        """
+        kept: Deque[Tuple[str, Union[str, bytes], float]] = deque()
+        latest_aggregate: Optional[Tuple[str, Union[str, bytes], float]] = None
+        for frame in self._queue:
+            if frame[0] == "aggregate":
+                if latest_aggregate is not None:
+                    self.dropped += 1
+                latest_aggregate = frame
+            elif frame[0] in COALESCIBLE_FRAME_TYPES:
+                self.dropped += 1
+            else:
+                kept.append(frame)
+        if latest_aggregate is not None:
+            if frame_type == "aggregate":
+                self.dropped += 1 # Superseded by the incoming aggregate
+            else:
+                kept.append(latest_aggregate)
+        self._queue = kept
+        if frame_type == "chat_message":
+            self.dropped += 1
+            return True
+        return False
+
+    async def _write_loop(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            frame_type, data, enqueued_at = self._queue.popleft()
+            started = time.perf_counter()
+            try:
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+            except Exception as e:
+                logger.warning(f"Failed to send message to client {self.client_id} for {self.streamer_name}: {e}. Marking for disconnect.")
+                ws_send_failures_total.inc()
+                self.closed = True
+                self._on_failure(self)
+                return
+            self.last_send_ms = (time.perf_counter() - started) * 1000
+            self.max_send_ms = max(self.max_send_ms, self.last_send_ms)
+            self.total_send_ms += self.last_send_ms
+            self.sent += 1
+            self.bytes_sent += len(data) # Characters for text frames
+            self.last_lag_ms = (time.monotonic() - enqueued_at) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+
+    async def close(self):
+        self.closed = True
+        self._queue.clear()
+        if not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        oldest_age_ms = (time.monotonic() - self._queue[0][2]) * 1000 if self._queue else 0.0
+        return {
+            "client": self.client_id,
+            "policy": self.policy,
+            "wire": self.wire.describe() if not self.wire.is_default else "json",
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "dropped": self.dropped,
+            "lag_ms": round(max(self.last_lag_ms, oldest_age_ms), 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+            "last_send_ms": round(self.last_send_ms, 3),
+            "avg_send_ms": round(self.total_send_ms / self.sent, 3) if self.sent else 0.0,
+            "max_send_ms": round(self.max_send_ms, 3),
+        }
+
+class ConnectionManager:
+    def __init__(self, max_queue: int = WS_SEND_QUEUE_SIZE, overflow_policy: str = WS_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            logger.warning(f"Unknown overflow policy '{overflow_policy}', using 'drop_oldest'.")
+            overflow_policy = "drop_oldest"
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
         # Dictionary to hold active connections per streamer
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Send queue and writer task of every connected WebSocket
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        # Per-streamer broadcast timings
+        self.broadcast_stats: Dict[str, BroadcastStats] = {}
+        # Emote ids of each streamer's clients, per wire format using emote refs
+        self.emote_registries: Dict[str, Dict[WireFormat, EmoteRegistry]] = {}
+        # Disconnects in progress, so they aren't garbage collected mid-way
+        self._background_tasks: Set[asyncio.Task] = set()
 
-    async def connect(self, websocket: WebSocket, streamer_name: str):
+    async def connect(self, websocket: WebSocket, streamer_name: str, overflow_policy: Optional[str] = None,
+                      wire: WireFormat = DEFAULT_WIRE_FORMAT):
         await websocket.accept()
         streamer_name = streamer_name.lower()
+        policy = overflow_policy if overflow_policy in OVERFLOW_POLICIES else self.overflow_policy
+        client = ClientConnection(
+            websocket, streamer_name, self.max_queue, policy, self._on_client_failure, wire
+        )
+        self.clients[websocket] = client
+        if not wire.is_default:
+            client.enqueue("protocol", encode_frame({"type": "protocol", "payload": wire.describe()}, wire.encoding))
+            registry = self.emote_registries.get(streamer_name, {}).get(wire)
+            if registry:
+                # Emotes the other clients of this format already know by id
+                client.enqueue("emote_defs", encode_frame(
+                    {"type": "emote_defs", "payload": list(registry.definitions)}, wire.encoding
+                ))
         if streamer_name not in self.active_connections:
             self.active_connections[streamer_name] = []
         self.active_connections[streamer_name].append(websocket)
         logger.info(f"WebSocket connected for {streamer_name}. Total clients: {len(self.active_connections[streamer_name])}")
 
     async def disconnect(self, websocket: WebSocket, streamer_name: str):
+        client = self._remove(websocket, streamer_name)
+        if client:
+            await client.close()
+
+    def _remove(self, websocket: WebSocket, streamer_name: str) -> Optional[ClientConnection]:
+        """Unregisters a WebSocket without waiting on it. Returns its client, if it had one."""
         streamer_name = streamer_name.lower()
+        client = self.clients.pop(websocket, None)
         if streamer_name in self.active_connections:
             try:
                 self.active_connections[streamer_name].remove(websocket)
                 # Clean up streamer entry if no clients are left
                 if not self.active_connections[streamer_name]:
                     del self.active_connections[streamer_name]
+                    self.broadcast_stats.pop(streamer_name, None)
+                    self.emote_registries.pop(streamer_name, None)
                     logger.info(f"Last client disconnected for {streamer_name}. Removing entry.")
                 else:
                     logger.info(f"WebSocket disconnected for {streamer_name}. Remaining clients: {len(self.active_connections[streamer_name])}")
@@ -33,38 +275,120 @@ class ConnectionManager:
                 pass # Connection already removed
             except Exception as e:
                 logger.error(f"Error during WebSocket disconnect for {streamer_name}: {e}")
+        return client
+
+    def _on_client_failure(self, client: ClientConnection):
+        """Called by a writer task whose send failed."""
+        self._spawn(self.disconnect(client.websocket, client.streamer_name))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
 
-    async def broadcast_to_streamer(self, streamer_name: str, message: dict):
+    def _drop_slow_client(self, client: ClientConnection):
+        """Disconnects a client that fell behind. Its transport is likely stuck, so the
+        writer shutdown and close handshake run in the background, never on the broadcaster.
+        """
+        ws_slow_disconnects_total.inc()
+        self._remove(client.websocket, client.streamer_name)
+        self._spawn(self._close_slow_client(client))
+
+    async def _close_slow_client(self, client: ClientConnection):
+        await client.close()
+        try:
+            await client.websocket.close(code=1013) # Try Again Later
+        except Exception:
+            pass # Socket may already be gone
+
+    def _encode_for_clients(self, streamer_name: Optional[str], connections: List[WebSocket],
+                            message: Optional[dict], encoded_text: Optional[str] = None,
+                            frame_type: Optional[str] = None) -> List[Tuple[List[ClientConnection], List[Tuple[str, Union[str, bytes]]]]]:
+        """Encodes a message once per wire format in use by `connections`.
+        `encoded_text` is the message already encoded as JSON, if available; then
+        `message` may be None and is only decoded if a compact format needs it.
+        Returns (clients, frames) for each format.
+        """
+        if frame_type is None:
+            frame_type = message.get("type", "")
+        by_wire: Dict[WireFormat, List[ClientConnection]] = {}
+        for connection in connections:
+            client = self.clients.get(connection)
+            if client:
+                by_wire.setdefault(client.wire, []).append(client)
+        encoded = []
+        for wire, clients in by_wire.items():
+            if wire.is_default:
+                if encoded_text is None:
+                    encoded_text = encode_message(message)
+                frames = [(frame_type, encoded_text)]
+            else:
+                if message is None:
+                    message = json.loads(encoded_text)
+                registry = None
+                if wire.emote_refs and streamer_name is not None:
+                    registry = self.emote_registries.setdefault(streamer_name, {}).setdefault(wire, EmoteRegistry())
+                frames = compact_frames(message, wire, registry)
+            encoded.append((clients, frames))
+        return encoded
+
+    def _enqueue(self, encoded: List[Tuple[List[ClientConnection], List[Tuple[str, Union[str, bytes]]]]]) -> List[ClientConnection]:
+        """Queues already encoded frames for each client.
+        Returns the clients that have to be disconnected.
+        """
+        slow_clients = []
+        for clients, frames in encoded:
+            for client in clients:
+                for frame_type, data in frames:
+                    if not client.enqueue(frame_type, data):
+                        slow_clients.append(client)
+                        break
+        return slow_clients
+
+    async def broadcast_to_streamer(self, streamer_name: str, message: Optional[dict],
+                                    encoded: Optional[str] = None, frame_type: Optional[str] = None):
+        """Sends a message to every client of a streamer. If the caller already has it
+        encoded as JSON (`encoded`), default-format clients get that text as is.
+        """
         streamer_name = streamer_name.lower()
         if streamer_name in self.active_connections:
-            disconnected_clients = []
-            # Iterate over a copy in case disconnect modifies the list during iteration
-            for connection in self.active_connections[streamer_name][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    # Log error and mark client for removal
-                    logger.warning(f"Failed to send message to client for {streamer_name}: {e}. Marking for disconnect.")
-                    disconnected_clients.append(connection)
-
-            # Remove disconnected clients
-            for client in disconnected_clients:
-                await self.disconnect(client, streamer_name)
+            connections = self.active_connections[streamer_name]
+            start = time.perf_counter()
+            # Encode once per wire format, not per client
+            encoded_frames = self._encode_for_clients(streamer_name, connections, message, encoded, frame_type)
+            encoded_at = time.perf_counter()
+            # Writers send concurrently; this only appends to their queues
+            slow_clients = self._enqueue(encoded_frames)
+            finished = time.perf_counter()
+
+            stats = self.broadcast_stats.setdefault(streamer_name, BroadcastStats())
+            stats.record(len(connections), (encoded_at - start) * 1000, (finished - encoded_at) * 1000)
+            logger.debug(f"Broadcast to {len(connections)} clients for {streamer_name}: "
+                         f"encode {stats.last_encode_ms:.3f} ms, enqueue {stats.last_enqueue_ms:.3f} ms")
+
+            for client in slow_clients:
+                self._drop_slow_client(client)
+
+    async def broadcast_encoded(self, streamer_name: str, frame_type: str, text: str):
+        """Broadcasts a frame received already encoded as JSON (e.g. relayed from another worker)."""
+        await self.broadcast_to_streamer(streamer_name, None, encoded=text, frame_type=frame_type)
 
     async def broadcast_all(self, message: dict):
         # Send message to all clients across all streamers
-        all_connections = [conn for conns in self.active_connections.values() for conn in conns]
-        disconnected_clients = []
-        streamer_map = {conn: streamer for streamer, conns in self.active_connections.items() for conn in conns}
+        slow_clients = []
+        encoded_text = encode_message(message) # Once for every streamer's default-format clients
+        for streamer_name, connections in list(self.active_connections.items()):
+            slow_clients.extend(self._enqueue(self._encode_for_clients(streamer_name, connections, message, encoded_text)))
+        for client in slow_clients:
+            self._drop_slow_client(client)
 
-        for connection in all_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                 logger.warning(f"Failed to broadcast message: {e}. Marking for disconnect.")
-                 disconnected_clients.append(connection)
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns broadcast timings per streamer."""
+        return {streamer: stats.to_dict() for streamer, stats in self.broadcast_stats.items()}
 
-        for client in disconnected_clients:
-            streamer = streamer_map.get(client)
-            if streamer:
-                await self.disconnect(client, streamer)
\ No newline at end of file
+    def get_client_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Returns queue depth, drop and lag counters of every client, per streamer."""
+        return {
+            streamer: [self.clients[conn].stats() for conn in conns if conn in self.clients]
+            for streamer, conns in self.active_connections.items()
+        }
@@ -0,0 +1,132 @@
+import os
+import json
+import logging
+from typing import Dict, List, Tuple, Any, Optional, NamedTuple, Mapping, Union
+
+logger = logging.getLogger(__name__)
+
+# Binary framing is optional: without msgpack, clients asking for it get JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# --- Configuration ---
+# Distinct emotes a compact connection group assigns ids to before sending full emote objects again
+WS_EMOTE_REF_LIMIT = int(os.getenv("WS_EMOTE_REF_LIMIT", "20000"))
+
+# --- Negotiation ---
+# Clients pick a wire format with query parameters on /ws/{streamer_name}:
+#   encoding=json|msgpack   text JSON frames (default) or binary msgpack frames
+#   fields=a,b,c            only these chat_message payload fields (default: all)
+#   emote_refs=1            detected_emotes as [id, sentiment_score] pairs; the name, url
+#                           and type of each id arrive once, in an earlier `emote_defs` frame
+# A client asking for anything but the default first receives a `protocol` frame
+# describing what it got. Other frame types (status, aggregate, ...) keep their payloads
+# and only change encoding.
+ENCODINGS = ("json", "msgpack")
+CHAT_MESSAGE_FIELDS = (
+    "timestamp", "author", "content", "tags", "sentiment_score", "sentiment_words",
+    "keywords", "detected_emotes", "score_table_version", "analyzed", "sample_rate", "copypasta"
+)
+
+class WireFormat(NamedTuple):
+    """How one client wants its frames encoded. Clients with equal formats share encodings."""
+    encoding: str = "json"
+    fields: Optional[Tuple[str, ...]] = None # None: every field
+    emote_refs: bool = False
+
+    @property
+    def is_default(self) -> bool:
+        return self == DEFAULT_WIRE_FORMAT
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "encoding": self.encoding,
+            "fields": list(self.fields) if self.fields is not None else list(CHAT_MESSAGE_FIELDS),
+            "emote_refs": self.emote_refs
+        }
+
+DEFAULT_WIRE_FORMAT = WireFormat()
+
+def parse_wire_format(params: Mapping[str, str]) -> WireFormat:
+    """Builds a WireFormat from WebSocket query parameters. Raises ValueError if invalid."""
+    encoding = params.get("encoding", "json").lower()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}' (expected one of {', '.join(ENCODINGS)})")
+    if encoding == "msgpack" and msgpack is None:
+        logger.warning("Client asked for msgpack but it is not installed. Using JSON.")
+        encoding = "json"
+
+    fields = None
+    if params.get("fields"):
+        requested = [field.strip() for field in params["fields"].split(",") if field.strip()]
+        unknown = [field for field in requested if field not in CHAT_MESSAGE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown chat_message fields: {', '.join(unknown)}")
+        # Keep the canonical order so equal field sets share one encoding
+        fields = tuple(field for field in CHAT_MESSAGE_FIELDS if field in requested)
+
+    emote_refs = params.get("emote_refs", "0").lower() in ("1", "true", "yes")
+    return WireFormat(encoding, fields, emote_refs)
+
+def encode_frame(message: dict, encoding: str) -> Union[str, bytes]:
+    """Serializes a frame: text JSON (same as WebSocket.send_json) or binary msgpack."""
+    if encoding == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class EmoteRegistry:
+    """Emote ids handed out to one group of clients sharing a wire format.
+
+    Every id's definition is sent to the group once (an `emote_defs` frame queued
+    ahead of the first message using it), and all of them to clients joining later.
+    """
+
+    def __init__(self, limit: int = WS_EMOTE_REF_LIMIT):
+        self.limit = limit
+        self._ids: Dict[Tuple[str, str], int] = {} # (name, url) -> id
+        self.definitions: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.definitions)
+
+    def ref(self, emote: Mapping[str, Any], new_definitions: List[Dict[str, Any]]) -> Optional[int]:
+        """Id of an emote, registering it (and appending its definition to
+        `new_definitions`) if it is new. None once the registry is full."""
+        key = (emote.get("name"), emote.get("url"))
+        emote_id = self._ids.get(key)
+        if emote_id is None:
+            if len(self.definitions) >= self.limit:
+                return None
+            emote_id = len(self.definitions)
+            definition = {"id": emote_id, "name": emote.get("name"), "url": emote.get("url"), "type": emote.get("type")}
+            self._ids[key] = emote_id
+            self.definitions.append(definition)
+            new_definitions.append(definition)
+        return emote_id
+
+def compact_frames(message: dict, wire: WireFormat, registry: Optional[EmoteRegistry]) -> List[Tuple[str, Union[str, bytes]]]:
+    """Encodes a frame for one wire format. Returns (frame_type, data) pairs: an
+    `emote_defs` frame for newly referenced emotes, if any, then the frame itself.
+    """
+    frame_type = message.get("type", "")
+    if frame_type != "chat_message" or (wire.fields is None and not wire.emote_refs):
+        return [(frame_type, encode_frame(message, wire.encoding))]
+
+    payload = message["payload"]
+    fields = wire.fields if wire.fields is not None else CHAT_MESSAGE_FIELDS
+    compact = {field: payload.get(field) for field in fields}
+    frames = []
+    if wire.emote_refs and "detected_emotes" in compact and registry is not None:
+        new_definitions: List[Dict[str, Any]] = []
+        refs = []
+        for emote in compact["detected_emotes"] or ():
+            emote_id = registry.ref(emote, new_definitions)
+            # Emotes past the registry limit are sent in full
+            refs.append([emote_id, emote.get("sentiment_score")] if emote_id is not None else emote)
+        compact["detected_emotes"] = refs
+        if new_definitions:
+            frames.append(("emote_defs", encode_frame({"type": "emote_defs", "payload": new_definitions}, wire.encoding)))
+    frames.append((frame_type, encode_frame({"type": frame_type, "payload": compact}, wire.encoding)))
+    return frames
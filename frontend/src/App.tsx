@@ -23,6 +23,10 @@ interface ChatMessagePayload {
   sentiment_words: Record<string, number>; // <-- ADDED word scores { word: score }
   keywords: string[];
   detected_emotes: EmoteData[];
+  score_table_version?: string | null; // Emote score table used for sentiment_words
+  analyzed?: boolean; // False if sentiment/keyword analysis was skipped under load
+  sample_rate?: number; // Share of messages being analyzed when this one was processed
+  copypasta?: { id: number; size: number } | null; // Near-duplicate cluster, once it has repeats
 }
 
 // Add a unique ID to messages for list keys
@@ -30,6 +34,51 @@ interface DisplayMessage extends ChatMessagePayload {
     id: string; 
 }
 
+// Server-side sliding-window statistics, pushed on a fixed tick
+interface AggregatePayload {
+    window_seconds: number;
+    message_count: number;
+    message_rate: number; // messages per second over the window
+    analyzed_ratio?: number; // share of the window's messages that got sentiment/keyword analysis
+    sentiment: { count: number; mean: number | null; p10?: number; p50?: number; p90?: number };
+    top_keywords: [string, number][]; // [keyword, count]
+    top_emotes: [string, number, string | null][]; // [name, count, url]
+    copypasta_waves?: [string, number, number][]; // [first message, count, cluster id]
+    chatters?: ChatterStats;
+}
+
+// Estimated unique chatters over one window, with chatters per messages-sent bucket ("1", "2", "3-4", ...)
+interface ChatterWindowStats {
+    unique: number;
+    messages: number;
+    messages_per_chatter: Record<string, number>;
+    sampled_chatters: number;
+}
+
+interface ChatterStats {
+    relative_error: number; // standard error of the unique estimates, e.g. 0.023
+    '1m': ChatterWindowStats;
+    '5m': ChatterWindowStats;
+    session: ChatterWindowStats;
+}
+
+// Fired by a backend alert rule (see the README's Alerts section)
+interface AlertPayload {
+    id: number;
+    rule_id: string;
+    rule_name: string;
+    channel: string;
+    metric: 'sentiment' | 'message_rate' | 'emote_rate' | 'keyword';
+    term: string | null;
+    detector: 'ewma' | 'cusum';
+    direction: 'up' | 'down';
+    value: number; // in the second that fired
+    baseline: number;
+    score: number; // z-score (ewma) or cumulative sum (cusum)
+    threshold: number;
+    timestamp: number; // unix seconds
+}
+
 // Type for sentiment chart data points
 interface SentimentDataPoint {
     time: number; // Use a numeric value for charting (e.g., message index or timestamp)
@@ -39,6 +88,8 @@ interface SentimentDataPoint {
 // Union type for different WebSocket message types
 type WebSocketMessage = 
   | { type: 'chat_message', payload: ChatMessagePayload }
+  | { type: 'aggregate', payload: AggregatePayload }
+  | { type: 'alert', payload: AlertPayload }
   | { type: 'status', payload: string }
   | { type: 'error', payload: string }
   | { type: 'connection_ack', streamer: string }; 
@@ -194,33 +245,19 @@ function App() {
 
   // Analytics & Display State
   const [latestMessages, setLatestMessages] = useState<DisplayMessage[]>([]);
-  const [keywordCounts, setKeywordCounts] = useState<Record<string, number>>({});
+  const [aggregate, setAggregate] = useState<AggregatePayload | null>(null);
+  const [alerts, setAlerts] = useState<AlertPayload[]>([]);
   const [sentimentChartData, setSentimentChartData] = useState<SentimentDataPoint[]>([]);
   const [statusMessage, setStatusMessage] = useState<string>("Enter streamer name to begin.");
-  const [averageSentiment, setAverageSentiment] = useState<number | null>(null);
-  const [emoteCounts, setEmoteCounts] = useState<Record<string, number>>({}); // <-- Add state for emote counts
 
   const ws = useRef<WebSocket | null>(null);
-  const messageCounter = useRef<number>(0); // Counter for chart X-axis
+  const aggregateCounter = useRef<number>(0); // Counter for chart X-axis
   const chatLogRef = useRef<HTMLDivElement>(null); // Ref for auto-scrolling chat
 
   // Constants
   const MAX_MESSAGES_DISPLAY = 100; // Show last 100 messages in chat feed
   const MAX_SENTIMENT_POINTS = 50; // Keep last 50 points for sentiment chart
-
-  // Effect to calculate average sentiment whenever chart data changes
-  useEffect(() => {
-      // Filter out scores of 0 *and* potentially null if they somehow got in
-      const validSentimentData = sentimentChartData.filter(point => point.score !== 0 && point.score !== null);
-  
-      if (validSentimentData.length > 0) {
-          const sum = validSentimentData.reduce((acc, point) => acc + point.score, 0);
-          setAverageSentiment(sum / validSentimentData.length);
-      } else {
-          // If no valid (non-zero, non-null) scores exist in the window, set average to null
-          setAverageSentiment(null);
-      }
-  }, [sentimentChartData]); // Re-run whenever sentimentChartData updates
+  const MAX_ALERTS_DISPLAY = 10;
 
   const connectWebSocket = useCallback((name: string) => {
     if (!name) {
@@ -233,11 +270,10 @@ function App() {
     setCurrentStreamer(streamer);
     // Reset state
     setLatestMessages([]);
-    setKeywordCounts({});
-    setEmoteCounts({}); // <-- Reset emote counts
+    setAggregate(null);
+    setAlerts([]);
     setSentimentChartData([]);
-    setAverageSentiment(null);
-    messageCounter.current = 0;
+    aggregateCounter.current = 0;
     setStatusMessage(`Attempting to connect to ${streamer}...`);
 
     if (ws.current && ws.current.readyState === WebSocket.OPEN) ws.current.close();
@@ -287,7 +323,6 @@ function App() {
             break;
           case 'chat_message':
             const payload = message.payload;
-            messageCounter.current += 1;
             
             // Assign ID, using Twitch message ID if available
             const displayMsg: DisplayMessage = { 
@@ -307,41 +342,25 @@ function App() {
                 return updatedMessages;
             });
 
-            // Update sentiment chart data (average calculation moved to useEffect)
-            if (payload.sentiment_score !== null) {
+            break;
+          case 'aggregate':
+            // Keyword/emote counts and sentiment are computed by the backend
+            setAggregate(message.payload);
+            if (message.payload.sentiment.mean !== null) {
+                aggregateCounter.current += 1;
                 const newDataPoint: SentimentDataPoint = {
-                    time: messageCounter.current,
-                    score: payload.sentiment_score
+                    time: aggregateCounter.current,
+                    score: message.payload.sentiment.mean
                 };
-                setSentimentChartData(prev => 
+                setSentimentChartData(prev =>
                     [...prev.slice(-MAX_SENTIMENT_POINTS + 1), newDataPoint]
                 );
-            } 
-            // No need to handle average calculation here anymore
-            
-            // Update keyword counts
-            if (payload.keywords && payload.keywords.length > 0) {
-                setKeywordCounts(prevCounts => {
-                    const newCounts = { ...prevCounts };
-                    payload.keywords.forEach((kw: string) => {
-                        newCounts[kw] = (newCounts[kw] || 0) + 1;
-                    });
-                    return newCounts;
-                });
-            }
-
-            // Update emote counts
-            if (payload.detected_emotes && payload.detected_emotes.length > 0) {
-                setEmoteCounts(prevCounts => {
-                    const newCounts = { ...prevCounts };
-                    payload.detected_emotes.forEach((emote: EmoteData) => {
-                        newCounts[emote.name] = (newCounts[emote.name] || 0) + 1;
-                    });
-                    // Return unsorted/unlimited counts, handle in getTopEmotesData
-                    return newCounts;
-                });
             }
             break;
+          case 'alert':
+            // Newest first
+            setAlerts(prev => [message.payload, ...prev].slice(0, MAX_ALERTS_DISPLAY));
+            break;
           default:
              console.warn('Received unknown message type:', message);
              setStatusMessage('Received unknown message from backend.');
@@ -381,21 +400,19 @@ function App() {
 
   // Data Preparation for Charts
   const getTopKeywordsData = (count: number): { name: string, count: number }[] => {
-      return Object.entries(keywordCounts)
-          .sort(([, countA], [, countB]) => countB - countA)
+      return (aggregate?.top_keywords ?? [])
           .slice(0, count)
           .map(([name, count]) => ({ name, count })); // Format for Recharts BarChart
   };
 
-  // New function for emote chart data
   const getTopEmotesData = (count: number): { name: string, count: number }[] => {
-    return Object.entries(emoteCounts) // Already potentially limited/sorted in state update
-        .sort(([, countA], [, countB]) => countB - countA) // Sort again to be sure
+    return (aggregate?.top_emotes ?? [])
         .slice(0, count)
         .map(([name, count]) => ({ name, count }));
   };
 
   // Format average sentiment for display
+  const averageSentiment = aggregate?.sentiment.mean ?? null;
   const formattedAvgSentiment = averageSentiment !== null
       ? averageSentiment.toFixed(2)
       : 'N/A';
@@ -464,6 +481,11 @@ function App() {
              <span className="average-sentiment">
                Avg Sentiment: {formattedAvgSentiment}
              </span>
+             <span className="message-rate">
+               {aggregate ? `${aggregate.message_rate.toFixed(1)} msgs/s` : ''}
+               {aggregate && aggregate.analyzed_ratio !== undefined && aggregate.analyzed_ratio < 1
+                 ? ` (${Math.round(aggregate.analyzed_ratio * 100)}% analyzed)` : ''}
+             </span>
            </div>
           {isConnected ? (
             <div className="charts-container">
@@ -523,6 +545,56 @@ function App() {
                   </ResponsiveContainer>
                 </div>
               </div> {/* End of chart-row */}
+
+              {/* Alerts fired by the backend's alert rules */}
+              {alerts.length > 0 && (
+                <div className="chart-wrapper">
+                  <h3>Alerts</h3>
+                  <ul className="alerts">
+                    {alerts.map((alert) => (
+                      <li key={alert.id}>
+                        {new Date(alert.timestamp * 1000).toLocaleTimeString()}{' '}
+                        {alert.rule_name} {alert.direction === 'up' ? '▲' : '▼'}{' '}
+                        {alert.value} (baseline {alert.baseline}, score {alert.score})
+                      </li>
+                    ))}
+                  </ul>
+                </div>
+              )}
+
+              {/* Unique chatters (estimated) and how many messages each sent */}
+              {aggregate?.chatters && (
+                <div className="chart-wrapper">
+                  <h3>Chatters</h3>
+                  <ul className="chatter-stats">
+                    {(['1m', '5m', 'session'] as const).map((window) => (
+                      <li key={window}>
+                        {window}: ~{aggregate.chatters![window].unique} unique
+                        ({aggregate.chatters![window].messages} messages)
+                      </li>
+                    ))}
+                  </ul>
+                  <p className="chatter-distribution">
+                    Messages per chatter (5m):{' '}
+                    {Object.entries(aggregate.chatters['5m'].messages_per_chatter)
+                      .map(([bucket, chatters]) => `${bucket}: ${chatters}`)
+                      .join(', ')}
+                    {' '}(±{(aggregate.chatters.relative_error * 100).toFixed(1)}%)
+                  </p>
+                </div>
+              )}
+
+              {/* Copypasta waves: repeated messages in the window */}
+              {aggregate?.copypasta_waves && aggregate.copypasta_waves.length > 0 && (
+                <div className="chart-wrapper">
+                  <h3>Copypasta Waves</h3>
+                  <ul className="copypasta-waves">
+                    {aggregate.copypasta_waves.slice(0, 5).map(([text, count, id]) => (
+                      <li key={id}>{count}x {text}</li>
+                    ))}
+                  </ul>
+                </div>
+              )}
             </div>
           ) : (
             <p>Start analysis to view dashboard.</p>